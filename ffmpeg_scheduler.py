@@ -0,0 +1,335 @@
+import concurrent.futures
+import queue
+import re
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+
+# asyncio ffmpeg 调度器：所有 ffmpeg 子进程都在一个后台事件循环中启动，
+# 统一限制同时运行的进程数、为每个进程设置超时，并且可以随时取消（杀掉子进程，由调用方的 finally 清理临时文件）。
+# 渲染代码仍然是普通的阻塞函数：在绑定了会话的线程中调用 run() 时交给调度器执行，否则直接运行 ffmpeg。
+# 事件循环（以及 asyncio 本身）在第一次运行 ffmpeg 时才创建，图形界面启动时不加载。
+
+NO_TIMEOUT = 0  # run(timeout=NO_TIMEOUT)：不受调度器的单进程超时限制（用于随整场时长增长的最终拼接）
+MAX_EVENTS = 1000       # 界面事件队列中积压的进度与日志事件上限（状态事件不受限制）
+LOG_WAIT_SECONDS = 5    # 积压超过上限时，渲染线程投递日志最多等待的秒数
+
+# 计量时附加的参数：-benchmark 输出子进程的 CPU 时间，verbose 日志中的 AVIO 统计给出实际读写的字节数；
+# 日志带上级别标记，解析后只把原本就会输出的行留给调用方
+METER_ARGS = ["-benchmark", "-loglevel", "level+verbose"]
+LOG_LEVELS = ("panic", "fatal", "error", "warning", "info")
+_BENCH = re.compile(r"bench: utime=([\d.]+)s stime=([\d.]+)s")
+_READ = re.compile(r"Statistics: (\d+) bytes read")
+_WRITTEN = re.compile(r"Statistics: (\d+) bytes written")
+_LEVEL = re.compile(r"\[(panic|fatal|error|warning|info|verbose|debug|trace)\] ")
+
+
+class JobCancelled(Exception):
+    """所属的生成任务已被取消"""
+
+    def __init__(self, message="已取消"):
+        super().__init__(message)
+
+
+_local = threading.local()
+
+
+def current():
+    """当前线程绑定的会话，没有时返回 None"""
+    return getattr(_local, "session", None)
+
+
+def cancelled():
+    session = current()
+    return session is not None and session.cancelled
+
+
+class Meter:
+    """累计一段代码中启动的 ffmpeg 进程的 CPU 时间（用户 + 系统）与读写字节数"""
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.processes = 0
+        self.cpu_seconds = 0.0
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def add(self, cpu_seconds, bytes_read, bytes_written):
+        meter = self
+        while meter is not None:
+            meter.processes += 1
+            meter.cpu_seconds += cpu_seconds
+            meter.bytes_read += bytes_read
+            meter.bytes_written += bytes_written
+            meter = meter.parent
+
+
+@contextmanager
+def metered():
+    """在当前线程中计量 ffmpeg 进程，嵌套时外层也会累计内层的数据"""
+    meter = Meter(getattr(_local, "meter", None))
+    _local.meter = meter
+    try:
+        yield meter
+    finally:
+        _local.meter = meter.parent
+
+
+def meter_args():
+    """当前线程正在计量时需要附加的 ffmpeg 全局参数（供自行管理管道的调用方使用）"""
+    return METER_ARGS if getattr(_local, "meter", None) is not None else []
+
+
+def record_stderr(stderr, min_level="info"):
+    """从计量模式的 stderr 中取出统计数据计入当前计量，返回去掉统计行后的 stderr
+
+    min_level 为调用方原本设置的日志级别，低于它的行会被去掉。
+    """
+    meter = getattr(_local, "meter", None)
+    if meter is None or not stderr:
+        return stderr
+    text = stderr.decode(errors="replace")
+    cpu_seconds = sum(float(user) + float(system) for user, system in _BENCH.findall(text))
+    meter.add(cpu_seconds, sum(map(int, _READ.findall(text))), sum(map(int, _WRITTEN.findall(text))))
+    keep = LOG_LEVELS[:LOG_LEVELS.index(min_level) + 1]
+    lines = []
+    keeping = False
+    for line in text.splitlines(keepends=True):
+        match = _LEVEL.search(line)
+        if match is None:
+            # 多行消息的后续行没有级别标记，跟随上一行
+            if keeping:
+                lines.append(line)
+            continue
+        keeping = match.group(1) in keep and "bench: " not in line
+        if keeping:
+            lines.append(line[:match.start()] + line[match.end():])
+    return "".join(lines).encode()
+
+
+def propagate(worker):
+    """让线程池中的 worker 继承调用线程的会话（没有会话时原样返回）"""
+    session = current()
+    return session.wrap(worker) if session is not None else worker
+
+
+def run(stream_spec, capture_stdout=False, timeout=None):
+    """运行一个 ffmpeg 命令（覆盖输出、不打印日志），返回 stdout（capture_stdout 为 True 时）
+
+    timeout 为 None 时使用调度器的单进程超时，为 NO_TIMEOUT 时不限时。
+    失败时抛出 ffmpeg.Error，所属任务被取消时抛出 JobCancelled。
+    """
+    out, _ = _execute(stream_spec, capture_stdout, timeout)
+    return out
+
+
+def run_stderr(stream_spec, timeout=None):
+    """运行 ffmpeg 并返回它的 stderr（读取 ebur128 等分析滤镜的输出），失败与取消同 run()"""
+    _, err = _execute(stream_spec, False, timeout)
+    return err.decode(errors="replace") if err else ""
+
+
+def _execute(stream_spec, capture_stdout, timeout):
+    import ffmpeg
+    session = current()
+    metering = getattr(_local, "meter", None) is not None
+    if session is None and not metering:
+        return stream_spec.run(capture_stdout=capture_stdout, quiet=True, overwrite_output=True)
+    args = ffmpeg.compile(stream_spec, overwrite_output=True)
+    if metering:
+        args = [args[0], *METER_ARGS, *args[1:]]
+    try:
+        if session is None:
+            out, err = _run_direct(args, capture_stdout)
+        else:
+            out, err = session.run_args(args, capture_stdout, timeout)
+    except ffmpeg.Error as e:
+        e.stderr = record_stderr(e.stderr)
+        raise
+    return out, record_stderr(err)
+
+
+def _run_direct(args, capture_stdout):
+    import ffmpeg
+    process = subprocess.run(args, stdin=subprocess.DEVNULL,
+                             stdout=subprocess.PIPE if capture_stdout else subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if process.returncode != 0:
+        raise ffmpeg.Error("ffmpeg", process.stdout, process.stderr)
+    return process.stdout, process.stderr
+
+
+@contextmanager
+def track(process):
+    """登记一个由调用方自己管理管道的 ffmpeg 进程（run_async），任务取消时一并杀掉"""
+    session = current()
+    if session is None:
+        yield process
+        return
+    with session.lock:
+        session.processes.add(process)
+    if session.cancelled:
+        process.kill()
+    try:
+        yield process
+    finally:
+        with session.lock:
+            session.processes.discard(process)
+
+
+class Session:
+    """一次生成任务：可以整体取消，取消只影响本任务的 ffmpeg 进程"""
+
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.cancelled = False
+        self.tasks = set()
+        self.processes = set()
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def bind(self):
+        previous = current()
+        _local.session = self
+        try:
+            yield self
+        finally:
+            _local.session = previous
+
+    def wrap(self, worker):
+        def run_bound(*args):
+            with self.bind():
+                return worker(*args)
+        return run_bound
+
+    def run_args(self, args, capture_stdout=False, timeout=None):
+        import asyncio
+        if self.cancelled:
+            raise JobCancelled()
+        if timeout is None:
+            timeout = self.scheduler.timeout
+        future = asyncio.run_coroutine_threadsafe(
+            self.scheduler._exec(self, args, capture_stdout, timeout or None),
+            self.scheduler.loop,
+        )
+        try:
+            return future.result()
+        except (concurrent.futures.CancelledError, asyncio.CancelledError):
+            raise JobCancelled() from None
+
+    def cancel(self):
+        """杀掉本任务所有正在运行的 ffmpeg 进程，之后的调用立即抛出 JobCancelled"""
+        self.cancelled = True
+        with self.lock:
+            tasks = list(self.tasks)
+            processes = list(self.processes)
+        for task in tasks:
+            self.scheduler.loop.call_soon_threadsafe(task.cancel)
+        for process in processes:
+            try:
+                process.kill()
+            except OSError:
+                pass
+
+
+class FfmpegScheduler:
+    """后台 asyncio 事件循环 + 有界并发的 ffmpeg 进程调度，以及供界面轮询的有界事件队列"""
+
+    def __init__(self, max_workers, timeout=None, max_events=MAX_EVENTS):
+        self.max_workers = max(1, max_workers)
+        self.timeout = timeout  # 单个 ffmpeg 进程的超时（秒），None 表示不限
+        self.max_events = max_events
+        self.events = queue.Queue()  # 不设容量，积压由 post() 控制，状态事件永远不会被丢弃
+        self.sessions = set()
+        self.lock = threading.Lock()
+        self._loop = None
+        self.limit = None
+
+    @property
+    def loop(self):
+        """后台事件循环，第一次使用时启动"""
+        with self.lock:
+            if self._loop is None:
+                import asyncio
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, daemon=True).start()
+                self.limit = asyncio.run_coroutine_threadsafe(self._make_limit(), loop).result()
+                self._loop = loop
+            return self._loop
+
+    async def _make_limit(self):
+        import asyncio
+        return asyncio.Semaphore(self.max_workers)
+
+    @contextmanager
+    def session(self):
+        session = Session(self)
+        with self.lock:
+            self.sessions.add(session)
+        try:
+            yield session
+        finally:
+            with self.lock:
+                self.sessions.discard(session)
+
+    def cancel_all(self):
+        """取消所有进行中的任务，返回被取消的任务数"""
+        with self.lock:
+            sessions = list(self.sessions)
+        for session in sessions:
+            session.cancel()
+        return len(sessions)
+
+    def post(self, kind, value=None):
+        """向界面发送事件
+
+        积压超过 max_events 时只丢弃进度事件（后面的进度会覆盖它）；日志事件最多等待 5 秒，
+        让渲染线程在界面来不及处理时放慢，之后仍然投递；maximum、ready、clear、done 等状态事件总是立即投递。
+        在主线程中调用时从不等待，否则界面会卡住。
+        """
+        if kind == "progress":
+            if self.events.qsize() < self.max_events:
+                self.events.put((kind, value))
+            return
+        if kind == "log" and threading.current_thread() is not threading.main_thread():
+            deadline = time.monotonic() + LOG_WAIT_SECONDS
+            while self.events.qsize() >= self.max_events and time.monotonic() < deadline:
+                time.sleep(0.05)
+        self.events.put((kind, value))
+
+    async def _exec(self, session, args, capture_stdout, timeout):
+        import asyncio
+        import ffmpeg
+        task = asyncio.current_task()
+        with session.lock:
+            session.tasks.add(task)
+        try:
+            async with self.limit:
+                if session.cancelled:
+                    raise asyncio.CancelledError()
+                process = await asyncio.create_subprocess_exec(
+                    *args, stdin=subprocess.DEVNULL,
+                    stdout=subprocess.PIPE if capture_stdout else subprocess.DEVNULL,
+                    stderr=subprocess.PIPE,
+                )
+                try:
+                    out, err = await asyncio.wait_for(process.communicate(), timeout)
+                except asyncio.TimeoutError:
+                    await self._kill(process)
+                    raise TimeoutError(f"ffmpeg 超过 {timeout} 秒未完成，已终止") from None
+                except asyncio.CancelledError:
+                    await self._kill(process)
+                    raise
+                if process.returncode != 0:
+                    raise ffmpeg.Error("ffmpeg", out, err)
+                return out, err
+        finally:
+            with session.lock:
+                session.tasks.discard(task)
+
+    async def _kill(self, process):
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+        await process.wait()
@@ -3,12 +3,58 @@ from tkinter import ttk, messagebox, filedialog
 import csv
 import os
 import threading
-import ffmpeg
-import random
+import queue
+import sys
 import time
 import shutil
-import pygame
-from mutagen import File as MutagenFile
+import otaku_engine
+import ffmpeg_scheduler
+from render_cache import SegmentCache, DEFAULT_BUDGET_MB
+from source_library import SourceLibrary
+from prerender import PrerenderWorker
+from run_manifest import find_resumable
+from workspace import Workspace
+from render_planner import ThroughputStats, plan_show
+from run_report import RunReport
+import render_jobs
+
+EVENT_POLL_MS = 100  # 界面处理渲染事件的间隔
+STARTUP_TASKS_MS = 50  # 窗口显示之后多久加载默认歌单并开始后台转码
+
+# pygame（约占原来启动时间的大半）、mutagen 与 ffmpeg-python 都在第一次用到时才导入，
+# mixer 在第一次预览播放时才初始化；启动耗时可用 scripts/check_startup.py 检查。
+
+
+def audio_mixer():
+    """返回 pygame.mixer，第一次调用时导入 pygame 并初始化 mixer"""
+    os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+    import pygame
+    if not pygame.mixer.get_init():
+        pygame.mixer.init()
+    return pygame.mixer
+
+
+def stop_playback():
+    """停止预览播放；还没有播放过时不导入 pygame"""
+    pygame = sys.modules.get("pygame")
+    if pygame is not None and pygame.mixer.get_init():
+        pygame.mixer.music.stop()
+
+
+def audio_duration(filepath):
+    """读取音频时长（秒）：先用 mutagen 读文件头，读不出时才用 pygame 解码，失败时返回 0"""
+    try:
+        from mutagen import File as MutagenFile
+        audio = MutagenFile(filepath)
+        if audio is not None and audio.info:
+            return audio.info.length
+    except Exception:
+        pass
+    try:
+        return audio_mixer().Sound(filepath).get_length()
+    except Exception:
+        return 0
+
 
 class OtakuDanceGUI:
     def __init__(self, root):
@@ -27,12 +73,56 @@ class OtakuDanceGUI:
         # 数据存储
         self.song_data = []
 
+        # 渲染设置
+        # single_pass: 裁剪/淡入淡出/倒数拼接合并为一次 ffmpeg 调用
+        # smart: 只重新编码淡入淡出的边缘，中间的 MP3 帧原样复制（不满足条件时自动退回 single_pass）
+        # numpy: 每首歌只解码一次到内存映射的 PCM 缓存，淡入淡出在 NumPy 中完成，整场只编码一次（需要 numpy，可选 PyAV）
+        # legacy: 原有的 剪切 -> 淡入 -> 淡出 -> 拼接 四步流程
+        self.render_mode = "single_pass"
+        # 整场生成方式
+        # segments: 逐首渲染 output/out_* 后再拼接（可利用片段缓存）
+        # streaming: 整场一次性流式渲染，不写单曲中间文件，直接输出最终文件
+        # playlist: 只渲染不含倒数的单曲片段，打乱后写出 M3U/CUE 播放列表（直接引用缓存片段，列表文件还在时不会被淘汰），不做最终拼接
+        # progressive: 先打乱再渲染，按顺序把完成的片段追加到可边生成边播放的 MP3 与 HLS 列表（仅输出 mp3）
+        self.show_engine = "segments"
+        # 整场输出格式（见 otaku_engine.OUTPUT_PROFILES），多种格式共用一次解码同时编码
+        self.output_profiles = list(otaku_engine.DEFAULT_PROFILES)
+        # 并行渲染的最大 ffmpeg 进程数，默认等于 CPU 核心数；同时进行的多个生成任务共用这些名额
+        self.render_workers = otaku_engine.default_workers()
+        # 单个 ffmpeg 进程的超时（秒），None 表示不限；只限制逐首的片段渲染，最终拼接 / 整场编码不受限制
+        self.ffmpeg_timeout = 600
+        # 所有 ffmpeg 进程由调度器统一启动，可以随时取消；渲染线程的日志与进度也通过它的事件队列交给界面
+        self.scheduler = ffmpeg_scheduler.FfmpegScheduler(self.render_workers, self.ffmpeg_timeout)
+        # 正在运行的生成任务 ID（每个任务有独立的工作目录，见 workspace.py）
+        self.active_jobs = set()
+        # 片段缓存：未改动的歌曲直接复用，cache 目录按 LRU 控制在预算之内
+        self.cache_budget_mb = DEFAULT_BUDGET_MB
+        # True 时按文件内容哈希判断源文件是否变化，False 时按大小+修改时间
+        self.cache_use_content_hash = False
+        self.segment_cache = SegmentCache("cache", self.cache_budget_mb, self.cache_use_content_hash)
+        # 规范化中间文件库：songs 中的源文件在后台统一转码为 44.1kHz 立体声 WAV，渲染/预览/副歌分析都读取它
+        self.library = SourceLibrary("cache")
+        # 各渲染路径的实测处理速度，用于生成前的耗时预估
+        self.throughput = ThroughputStats()
+        # 进度条当前的最大值（片段数或整场秒数），变化时才通知界面
+        self.progress_maximum = None
+        # 倒数音频的 (修改时间, 时长)，更新总时长时不必每次重新读取
+        self.mix_duration_cache = (None, 0)
+        # 添加/编辑曲目后在后台预渲染该行，生成时只剩打乱与拼接
+        self.prerender = PrerenderWorker(self.prerender_row)
+
         # 创建界面
         self.create_widgets()
+        self.root.after(EVENT_POLL_MS, self.drain_events)
+
+        # 默认歌单与后台转码放到窗口显示之后：读取倒数音频时长会导入 mutagen，转码会导入 ffmpeg
+        self.root.after(STARTUP_TASKS_MS, self.load_startup_files)
 
-        # 加载默认CSV文件
+    def load_startup_files(self):
+        """加载默认CSV文件并开始后台转码 songs 目录"""
         if os.path.exists("songs.csv"):
             self.load_csv("songs.csv")
+        self.library.start_background_ingest("songs")
 
     def create_widgets(self):
         # 主框架
@@ -69,16 +159,26 @@ class OtakuDanceGUI:
         ttk.Button(button_frame, text="编辑曲目", command=self.edit_song).grid(row=0, column=2, padx=5)
         ttk.Button(button_frame, text="加载工程(CSV)", command=self.load_csv_dialog).grid(row=0, column=3, padx=5)
         ttk.Button(button_frame, text="保存工程(CSV)", command=self.save_csv_dialog).grid(row=0, column=4, padx=5)
+        ttk.Button(button_frame, text="预估耗时", command=self.explain_plan).grid(row=0, column=5, padx=5)
 
-        # 总时长显示标签
-        self.duration_label = ttk.Label(left_frame, text="")
-        self.duration_label.grid(row=2, column=0, columnspan=2, pady=5, sticky=(tk.W, tk.E))
+        # 总时长显示标签，右侧为生成耗时与磁盘占用的预估
+        info_frame = ttk.Frame(left_frame)
+        info_frame.grid(row=2, column=0, columnspan=2, pady=5, sticky=(tk.W, tk.E))
+        self.duration_label = ttk.Label(info_frame, text="")
+        self.duration_label.grid(row=0, column=0, sticky=tk.W)
+        self.plan_label = ttk.Label(info_frame, text="")
+        self.plan_label.grid(row=0, column=1, padx=(20, 0), sticky=tk.W)
 
         # 右侧控制面板
         right_frame = ttk.LabelFrame(main_frame, text="操作", padding="10")
         right_frame.grid(row=0, column=1, sticky=(tk.W, tk.E, tk.N, tk.S))
 
-        ttk.Button(right_frame, text="生成音频", command=self.generate_audio).grid(row=0, column=0, pady=10, sticky=(tk.W, tk.E))
+        action_frame = ttk.Frame(right_frame)
+        action_frame.grid(row=0, column=0, pady=10, sticky=(tk.W, tk.E))
+        action_frame.columnconfigure(0, weight=1)
+        ttk.Button(action_frame, text="生成音频", command=self.generate_audio).grid(row=0, column=0, sticky=(tk.W, tk.E))
+        ttk.Button(action_frame, text="继续上次生成", command=self.resume_generation).grid(row=0, column=1, padx=(5, 0))
+        ttk.Button(action_frame, text="取消", command=self.cancel_generation).grid(row=0, column=2, padx=(5, 0))
 
         self.progress_text = tk.Text(right_frame, height=25, width=60)
         self.progress_text.grid(row=1, column=0, pady=10, sticky=(tk.W, tk.E, tk.N, tk.S))
@@ -90,6 +190,10 @@ class OtakuDanceGUI:
         self.progress_bar = ttk.Progressbar(right_frame, mode='determinate', length=400)
         self.progress_bar.grid(row=2, column=0, columnspan=2, pady=5, sticky=(tk.W, tk.E))
 
+        # progressive 模式下显示已经可以播放到的位置
+        self.ready_label = ttk.Label(right_frame, text="")
+        self.ready_label.grid(row=3, column=0, columnspan=2, sticky=(tk.W, tk.E))
+
         main_frame.columnconfigure(0, weight=1)
         main_frame.rowconfigure(0, weight=1)
         left_frame.columnconfigure(0, weight=1)
@@ -98,44 +202,78 @@ class OtakuDanceGUI:
         right_frame.rowconfigure(1, weight=1)
 
     # --- 线程安全的 UI 更新辅助函数 ---
+    # 渲染线程只向调度器的有界事件队列投递事件，由主线程定时取出并更新界面
     def log_progress(self, message):
-        """线程安全地向文本框写入日志"""
-        def _update():
+        """线程安全地向文本框写入日志；在主线程中先处理积压的事件再直接写入，不经过队列"""
+        if threading.current_thread() is threading.main_thread():
+            self.apply_events()
             self.progress_text.insert(tk.END, message)
             self.progress_text.see(tk.END)
-        self.root.after(0, _update)
+            return
+        self.scheduler.post("log", message)
 
     def update_progress_bar(self, value):
         """线程安全地更新进度条"""
-        self.root.after(0, lambda: self.progress_bar.configure(value=value))
+        self.scheduler.post("progress", value)
+
+    def set_progress_maximum(self, value):
+        self.scheduler.post("maximum", value)
+
+    def update_ready_label(self, text):
+        """线程安全地更新“已就绪”提示"""
+        self.scheduler.post("ready", text)
+
+    def clear_log(self):
+        self.scheduler.post("clear")
+
+    def notify_done(self, message):
+        self.scheduler.post("done", message)
+
+    def drain_events(self):
+        """定时在主线程中处理积压的事件"""
+        self.apply_events()
+        self.root.after(EVENT_POLL_MS, self.drain_events)
+
+    def apply_events(self):
+        """处理积压的事件（只在主线程调用）；同一批中的进度只应用最后一个值"""
+        progress = None
+        lines = []
+        try:
+            for _ in range(self.scheduler.max_events):
+                kind, value = self.scheduler.events.get_nowait()
+                if kind == "log":
+                    lines.append(value)
+                    continue
+                if lines:
+                    self.progress_text.insert(tk.END, "".join(lines))
+                    lines = []
+                if kind == "progress":
+                    progress = value
+                elif kind == "maximum":
+                    self.progress_bar.configure(maximum=value)
+                elif kind == "ready":
+                    self.ready_label.config(text=value)
+                elif kind == "clear":
+                    self.progress_text.delete(1.0, tk.END)
+                elif kind == "done":
+                    messagebox.showinfo("完成", value)
+        except queue.Empty:
+            pass
+        if lines:
+            self.progress_text.insert(tk.END, "".join(lines))
+            self.progress_text.see(tk.END)
+        if progress is not None:
+            self.progress_bar.configure(value=progress)
 
     def load_csv(self, filename):
         try:
             self.song_data = []
             self.tree.delete(*self.tree.get_children())
             
-            # 增加 utf-8-sig 支持（兼容 Excel 保存的 CSV）
-            encodings = ['utf-8', 'utf-8-sig', 'gbk', 'gb2312']
-            data_read = False
-
-            for encoding in encodings:
-                try:
-                    with open(filename, 'r', encoding=encoding, newline='') as file:
-                        reader = csv.reader(file)
-                        headers = next(reader, None) # 跳过标题
-                        for row in reader:
-                            if row: # 避免空行
-                                self.song_data.append(row)
-                                self.tree.insert('', 'end', values=row)
-                    data_read = True
-                    break
-                except UnicodeDecodeError:
-                    continue
-                except Exception:
-                    continue
-
-            if not data_read:
-                raise Exception("无法识别文件编码")
+            # 编码依次尝试 utf-8 / utf-8-sig（兼容 Excel 保存的 CSV）/ gbk / gb2312，与命令行共用
+            for row in otaku_engine.read_setlist_rows(filename):
+                self.song_data.append(row)
+                self.tree.insert('', 'end', values=row)
 
             self.update_duration_display()  # 更新总时长显示
 
@@ -167,23 +305,14 @@ class OtakuDanceGUI:
 
     def get_mix_duration(self):
         """获取mix.mp3的时长"""
-        mix_path = "songs/mix.mp3"
-        if os.path.exists(mix_path):
-            try:
-                audio = MutagenFile(mix_path)
-                if audio and audio.info:
-                    return audio.info.length
-            except Exception:
-                pass
-            try:
-                import pygame
-                if not pygame.mixer.get_init():
-                    pygame.mixer.init()
-                sound = pygame.mixer.Sound(mix_path)
-                return sound.get_length()
-            except Exception:
-                pass
-        return 0  # 如果没有mix.mp3，则时长为0
+        mix_path = otaku_engine.MIX_PATH
+        try:
+            mtime = os.path.getmtime(mix_path)
+        except OSError:
+            return 0  # 如果没有mix.mp3，则时长为0
+        if self.mix_duration_cache[0] != mtime:
+            self.mix_duration_cache = (mtime, audio_duration(mix_path))
+        return self.mix_duration_cache[1]
 
     def calculate_single_song_duration(self, start_time_str, end_time_str):
         """计算单首歌曲的时长（结束时间-开始时间）"""
@@ -228,12 +357,46 @@ class OtakuDanceGUI:
         duration_str = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
         song_count = len(self.song_data)
         self.duration_label.config(text=f"当前曲目数: {song_count}  /  总时长: {duration_str}")
+        self.update_plan_display()
+
+    def plan(self, exact=False):
+        """按当前歌单与渲染设置做一次预估（不渲染）"""
+        return plan_show(self.song_data, self.segment_cache, self.throughput, self.render_mode, self.show_engine,
+                         self.output_profiles, self.get_mix_duration(), self.render_workers, exact=exact)
+
+    def plan_summary(self, totals):
+        estimate = "" if totals["measured"] else "（默认速率）"
+        return (f"预计: 缓存命中 {totals['hits']}/{totals['rows']}  /  "
+                f"耗时约 {self.format_mmss(totals['wall_seconds'])}{estimate}  /  "
+                f"需写入 {totals['bytes'] / 1024 / 1024:.0f} MB")
+
+    def update_plan_display(self):
+        try:
+            _, totals = self.plan()
+        except OSError:
+            return
+        self.plan_label.config(text=self.plan_summary(totals))
+
+    def explain_plan(self):
+        """在日志中逐行列出预估：缓存是否命中、渲染路径、CPU 时间与写入量"""
+        def run():
+            plans, totals = self.plan(exact=True)
+            labels = {"hit": "命中", "miss": "未命中", "missing": "缺少文件", "invalid": "时间错误"}
+            lines = [f">>> 生成预估 ({self.show_engine} / {self.render_mode}, 并发数 {self.render_workers})\n"]
+            for i, row in enumerate(plans, 1):
+                lines.append(f"{i}. {row.song_file}  [{labels[row.status]}] {row.path}  "
+                             f"CPU {row.cpu_seconds:.1f}s  {row.bytes / 1024 / 1024:.1f} MB\n")
+            lines.append(f"合计 CPU {totals['cpu_seconds']:.1f}s，{self.plan_summary(totals)}\n")
+            self.log_progress("".join(lines))
+        threading.Thread(target=run, daemon=True).start()
 
     def add_song(self):
-        dialog = SongDialog(self.root, "添加曲目", use_file_dialog=True)
+        dialog = SongDialog(self.root, "添加曲目", use_file_dialog=True, library=self.library)
         if dialog.result:
+            self.library.start_background_ingest("songs")
             self.song_data.append(dialog.result)
-            self.tree.insert('', 'end', values=dialog.result)
+            item = self.tree.insert('', 'end', values=dialog.result)
+            self.schedule_prerender(item, dialog.result)
             self.update_duration_display()  # 更新总时长显示
 
     def delete_song(self):
@@ -245,6 +408,7 @@ class OtakuDanceGUI:
             index = self.tree.index(item)
             self.tree.delete(item)
             del self.song_data[index]
+            self.prerender.cancel(item)
         self.update_duration_display()  # 更新总时长显示
 
     def edit_song(self):
@@ -254,42 +418,91 @@ class OtakuDanceGUI:
             return
         item = selected_items[0]
         values = self.tree.item(item, 'values')
-        dialog = SongDialog(self.root, "编辑曲目", values)
+        dialog = SongDialog(self.root, "编辑曲目", values, library=self.library)
         if dialog.result:
+            self.library.start_background_ingest("songs")
             self.tree.item(item, values=dialog.result)
             index = self.tree.index(item)
             self.song_data[index] = dialog.result
+            self.schedule_prerender(item, dialog.result)
             self.update_duration_display()  # 更新总时长显示
 
     def generate_audio(self):
         self.save_csv("songs.csv")
-        thread = threading.Thread(target=self._generate_audio_internal)
+        # 使用当前歌单的快照，生成期间继续编辑或加载其他歌单不影响本次任务
+        rows = [list(row) for row in self.song_data]
+        self.start_generation(lambda: self._generate_audio_internal(rows))
+
+    def resume_generation(self):
+        self.start_generation(self._resume_internal)
+
+    def start_generation(self, target):
+        def run():
+            # 生成期间暂停后台预渲染，已经开始的任务会先完成并写入缓存
+            self.prerender.pause()
+            try:
+                # 本次生成中的 ffmpeg 进程都属于这个会话，点击“取消”时一起终止
+                with self.scheduler.session() as session, session.bind():
+                    target()
+            finally:
+                self.prerender.resume()
+        thread = threading.Thread(target=run)
         thread.daemon = True
         thread.start()
 
-    def _generate_audio_internal(self):
+    def cancel_generation(self):
+        """终止所有进行中的生成任务：杀掉 ffmpeg 子进程，临时文件由各自的清理逻辑删除"""
+        if self.scheduler.cancel_all():
+            self.log_progress("\n>>> 正在取消...\n")
+
+    def render_settings(self):
+        """写入检查点的渲染设置"""
+        return {
+            "render_mode": self.render_mode,
+            "show_engine": self.show_engine,
+            "output_profiles": list(self.output_profiles),
+            "use_content_hash": self.cache_use_content_hash,
+        }
+
+    def make_renderer(self, settings=None, report=None):
+        """按渲染设置（默认为当前设置）创建共享的生成流程，日志与进度交给界面"""
+        return render_jobs.renderer_for(
+            settings or self.render_settings(), self.segment_cache, self.library, workers=self.render_workers,
+            log=lambda message: self.log_progress(f"{message}\n"), on_progress=self.show_progress,
+            on_ready=self.show_ready, report=report, throughput=self.throughput,
+        )
+
+    def show_progress(self, value, maximum):
+        """线程安全地更新进度条，最大值变化时才发送"""
+        maximum = max(maximum, 1)
+        if maximum != self.progress_maximum:
+            self.progress_maximum = maximum
+            self.set_progress_maximum(maximum)
+        self.update_progress_bar(value)
+
+    def show_ready(self, ready, planned, finished):
+        """渐进式输出中已经可以播放的长度"""
+        if finished:
+            self.update_ready_label(f"已全部就绪: {self.format_mmss(ready)}")
+        else:
+            self.update_ready_label(f"已就绪: {self.format_mmss(ready)} / {self.format_mmss(planned)}")
+
+    def _generate_audio_internal(self, rows):
         try:
             # 清空进度文本
-            self.root.after(0, lambda: self.progress_text.delete(1.0, tk.END))
+            self.clear_log()
 
-            csv_file = "songs.csv"
-            output_directory = "output"
-            fade_duration = 2
+            # 本次任务独占的工作目录：歌单快照、单曲片段与拼接列表都放在这里
+            workspace = Workspace.create()
+            otaku_engine.write_setlist(workspace.csv_file, rows)
+            self.progress_maximum = None
 
-            with open(csv_file, newline='', encoding='utf-8-sig') as csvfile:
-                reader = csv.reader(csvfile)
-                next(reader, None)
-                rows = list(reader)
-                song_count = len(rows)
+            self.log_progress(f">>> 开始处理音频 (任务 {workspace.job_id})...\n")
+            if not os.path.exists(otaku_engine.MIX_PATH):
+                self.log_progress(f"提示：未找到 {otaku_engine.MIX_PATH}，将跳过过渡音效直接输出。\n")
 
-            self.total_songs = song_count
-            self.current_song = 0
-            self.root.after(0, lambda: self.progress_bar.configure(maximum=song_count))
-
-            self.log_progress(">>> 开始处理音频...\n")
-            
-            # 第一步：裁剪处理
-            for i, row in enumerate(rows):
+            entries = []
+            for row in rows:
                 if not row: continue
                 song_file = row[0]
                 try:
@@ -298,141 +511,92 @@ class OtakuDanceGUI:
                 except ValueError:
                     self.log_progress(f"警告：歌曲 {song_file} 时间格式错误，跳过。\n")
                     continue
-                
-                output_file = f"{output_directory}/out_{song_file}"
-                self.cut_and_fade(song_file, output_file, start_time, end_time)
+                entries.append((song_file, start_time, end_time))
 
-                self.current_song += 1
-                self.update_progress_bar(self.current_song)
-                self.log_progress(f"进度: {self.current_song}/{self.total_songs} - 完成 {song_file}\n")
+            if self.show_engine != "segments":
+                status = self.make_renderer().render_show(self.show_engine, entries, workspace)
+                self.finish_generation(status, resumable=False,
+                                       message="播放列表生成完成~" if self.show_engine == "playlist" else None)
+                return
 
-            # 第二步：随机化列表
-            self.log_progress(">>> 正在随机化播放列表...\n")
-            song_files = [f"output/out_{row[0]}" for row in rows if os.path.exists(f"output/out_{row[0]}")]
-            random.shuffle(song_files)
-
-            # 第三步：生成列表文件
-            self.save_to_txt(song_files, "songlist.txt")
-
-            # 第四步：拼接
-            final_output = f'output_audio_{int(time.time())}.mp3'
-            self.log_progress(">>> 开始最终拼接...\n")
-            self.concatenate_audio_from_list(final_output)
-
-            self.log_progress(f"*** 全部完成！文件已保存为: {final_output} ***\n")
-            self.root.after(0, lambda: messagebox.showinfo("完成", "随舞音频生成完成~"))
+            # 逐首渲染的流程写入检查点，中断后可以继续
+            manifest = render_jobs.create_job(workspace, entries, self.render_settings(), workspace.final_output())
+            self._render_and_concat(manifest, workspace)
 
         except Exception as e:
             self.log_progress(f"\n!!! 严重错误: {str(e)}\n")
 
-    def cut_song(self, input_file, output_file, start_time, end_time):
-        try:
-            # 修正：duration 应该是 end - start
-            duration = end_time - start_time
-            if duration <= 0:
-                raise ValueError("结束时间必须大于开始时间")
-            
-            (
-                ffmpeg
-                .input(input_file, ss=start_time, t=duration)
-                .output(output_file, acodec="copy")
-                .run(overwrite_output=True, quiet=True)
-            )
-            # self.log_progress(f"剪切成功：{output_file}\n") # 日志太长可注释
-        except ffmpeg.Error as e:
-            self.log_progress(f"剪切失败 [{input_file}]: {e.stderr.decode() if e.stderr else str(e)}\n")
-            raise
-
-    def add_fade_in_effects(self, input_file, output_file):
+    def _resume_internal(self):
+        """继续上次未完成的生成任务：跳过已验证的片段，从第一个缺失或失效的片段继续"""
         try:
-            (
-                ffmpeg
-                .input(input_file)
-                .filter("afade", t="in", st=0, d=2)
-                .output(output_file, audio_bitrate='320k')
-                .run(overwrite_output=True, quiet=True)
-            )
-        except ffmpeg.Error as e:
-            self.log_progress(f"淡入失败: {str(e)}\n")
-
-    def add_fade_out_effects(self, input_file, output_file, duration):
-        try:
-            # 确保淡出开始时间不为负
-            fade_out_start = max(0, duration - 3)
-            (
-                ffmpeg
-                .input(input_file)
-                .filter("afade", t="out", st=fade_out_start, d=3)
-                .output(output_file, audio_bitrate='320k')
-                .run(overwrite_output=True, quiet=True)
-            )
-        except ffmpeg.Error as e:
-            self.log_progress(f"淡出失败: {str(e)}\n")
-
-    def cut_and_fade(self, input_file_raw, output_file, start_time, end_time):
-        input_path = f"songs/{input_file_raw}"
-        mix_path = "songs/mix.mp3" # 确保你的文件夹里有这个文件
-
-        if not os.path.exists(input_path):
-             self.log_progress(f"错误：找不到文件 {input_path}\n")
-             return
-
-        # 定义临时文件路径
-        temp_cut = f"cache/temp_cut_{input_file_raw}"
-        temp_fade_in = f"cache/temp_in_{input_file_raw}"
-        # 这是一个新变量：代表"处理完淡入淡出，但还没加mix"的纯歌曲片段
-        temp_song_ready = f"cache/temp_ready_{input_file_raw}" 
-        
-        # 1. 剪切
-        self.cut_song(input_path, temp_cut, start_time, end_time)
-        
-        # 2. 淡入
-        self.add_fade_in_effects(temp_cut, temp_fade_in)
-        
-        # 3. 淡出 (注意：这里输出到 temp_song_ready，而不是最终文件)
-        duration = end_time - start_time
-        self.add_fade_out_effects(temp_fade_in, temp_song_ready, duration)
-        
-        # 4. 拼接 mix.mp3 + 歌曲片段
-        if os.path.exists(mix_path):
-            # 如果存在 mix.mp3，则拼接：mix在前，歌曲在后
-            self.concatenate_audio_2(mix_path, temp_song_ready, output_file)
-        else:
-            # 如果找不到 mix.mp3，就直接把处理好的歌曲作为输出（防止程序崩溃）
-            self.log_progress(f"提示：未找到 {mix_path}，将跳过过渡音效直接输出。\n")
-            shutil.copy(temp_song_ready, output_file)
+            self.clear_log()
+            self.progress_maximum = None
+            manifest = find_resumable(exclude=self.active_jobs)
+            if manifest is None:
+                self.log_progress("没有可以继续的生成任务。\n")
+                return
+            self.log_progress(f">>> 继续生成任务 {manifest.job_id} ({manifest.data['csv']})...\n")
+            self._render_and_concat(manifest, Workspace(manifest.job_id))
+        except Exception as e:
+            self.log_progress(f"\n!!! 严重错误: {str(e)}\n")
 
-    def concatenate_audio_2(self, f1, f2, out):
+    def _render_and_concat(self, manifest, workspace):
+        """按检查点渲染尚未完成的片段，然后打乱并拼接（流程见 render_jobs.Renderer.run_job）"""
+        self.active_jobs.add(workspace.job_id)
+        report = RunReport(workspace.report_path, workspace.job_id, manifest.settings)
         try:
-            in1 = ffmpeg.input(f1)
-            in2 = ffmpeg.input(f2)
-            ffmpeg.concat(in1, in2, v=0, a=1).output(out, ac=2).run(overwrite_output=True, quiet=True)
-        except Exception as e:
-            self.log_progress(f"拼接失败: {e}\n")
+            status = self.make_renderer(manifest.settings, report).run_job(manifest, workspace)
+            self.finish_generation(status, resumable=True)
+        finally:
+            self.active_jobs.discard(workspace.job_id)
+            report.save()
+            self.log_progress(report.summary())
+
+    def finish_generation(self, status, resumable, message=None):
+        """按生成结果写出收尾日志并弹出提示；resumable 表示任务写了检查点，可以“继续上次生成”"""
+        if status == render_jobs.CANCELLED:
+            if resumable:
+                self.log_progress(">>> 可点击“继续上次生成”从中断处继续\n")
+            return
+        if status == render_jobs.FAILED:
+            if resumable:
+                self.log_progress(">>> 可点击“继续上次生成”重新拼接\n")
+            return
+        if status == render_jobs.UNVERIFIED:
+            if resumable:
+                # 不标记完成，点击“继续上次生成”会校验片段并重新拼接
+                self.log_progress(">>> 可点击“继续上次生成”重新拼接\n")
+            self.notify_done("音频已生成，但输出校验未通过，请查看日志")
+            return
+        if status == render_jobs.INCOMPLETE and resumable:
+            self.log_progress(">>> 修正后可点击“继续上次生成”只重做失败的曲目\n")
+        self.log_progress("*** 全部完成！ ***\n")
+        self.notify_done(message or "随舞音频生成完成~")
+
+    def format_mmss(self, seconds):
+        return render_jobs.format_mmss(seconds)
 
-    def save_to_txt(self, file_list, output_file):
-        # 转换为绝对路径防止 ffmpeg 找不到
-        abs_list = [os.path.abspath(f) for f in file_list]
-        with open(output_file, 'w', encoding='UTF-8') as file:
-            for item in abs_list:
-                # ffmpeg concat protocol 格式要求
-                file.write(f"file '{item.replace(os.sep, '/')}'\n")
+    def prerender_row(self, song_file, start_time, end_time):
+        """后台预渲染一行：按当前的渲染设置把片段放进缓存，点击生成时直接命中"""
+        self.make_renderer().prerender(song_file, start_time, end_time, self.show_engine)
 
-    def concatenate_audio_from_list(self, output_file):
+    def schedule_prerender(self, item, values):
+        """为表格中的一行安排预渲染，同一行之前未开始的任务会被取消"""
         try:
-            (
-                ffmpeg
-                .input('songlist.txt', f='concat', safe=0)
-                .output(output_file, c='copy')
-                .run(overwrite_output=True, quiet=True)
-            )
-        except Exception as e:
-            self.log_progress(f"最终拼接失败: {str(e)}\n")
+            start_time = float(values[1])
+            end_time = float(values[2])
+        except (IndexError, ValueError):
+            self.prerender.cancel(item)
+            return
+        if end_time > start_time:
+            self.prerender.submit(item, values[0], start_time, end_time)
+
 
 class SongDialog:
-    def __init__(self, parent, title, initial_values=None, use_file_dialog=False):
+    def __init__(self, parent, title, initial_values=None, use_file_dialog=False, library=None):
         self.parent = parent
         self.result = None
+        self.library = library
         self.use_file_dialog = use_file_dialog
         self.is_playing = False
         self.current_pos = 0.0
@@ -440,10 +604,9 @@ class SongDialog:
         self.stop_thread_flag = False
         self.play_start_time = 0
         self.track_start_pos = 0
-
-        # 初始化 mixer
-        if not pygame.mixer.get_init():
-            pygame.mixer.init()
+        # m4a 需要先转码才能预览：正在后台转码的文件，以及转码失败、只能直接读取源文件的文件
+        self.preparing = set()
+        self.transcode_failed = set()
 
         self.dialog = tk.Toplevel(parent)
         self.dialog.title(title)
@@ -589,37 +752,57 @@ class SongDialog:
             self.restart_playback(target_sec)
         else:
             # 停止当前可能存在的任何播放，准备从新位置开始
-            pygame.mixer.music.stop()
+            stop_playback()
             # 为了让用户确认跳转成功，可以加载并暂停在那个位置，
             # 但 pygame 不支持 seek 暂停。所以我们只更新界面变量，等用户点播放。
             pass
 
+    def audio_source(self, filepath):
+        """预览与分析实际读取的文件：有规范化中间文件时使用它；m4a 还在后台转码时返回 None"""
+        if self.library is None or not os.path.exists(filepath):
+            return filepath
+        if filepath.lower().endswith(".m4a") and filepath not in self.transcode_failed:
+            # pygame 无法直接播放 m4a，只能读取转码后的中间文件
+            return self.library.lookup(filepath) or self.prepare_audio(filepath)
+        return self.library.resolve(filepath)
+
+    def prepare_audio(self, filepath):
+        """在后台转码 filepath（不阻塞界面），期间显示"准备中…"，完成后重新加载；返回 None"""
+        if filepath not in self.preparing:
+            self.preparing.add(filepath)
+            self.library.prepare(filepath, self.on_prepared)
+        self.time_label.config(text="准备中…")
+        self.progress_scale.state(['disabled'])
+        self.play_button.state(['disabled'])
+        return None
+
+    def on_prepared(self, source, error):
+        """后台转码完成（在转码线程中调用），回到界面线程处理"""
+        try:
+            self.dialog.after(0, self.finish_prepare, source, error)
+        except (tk.TclError, RuntimeError):
+            pass  # 对话框已关闭
+
+    def finish_prepare(self, source, error):
+        self.preparing.discard(source)
+        if error is not None:
+            print(f"Transcode error: {error}")
+            self.transcode_failed.add(source)
+        # 转码期间用户可能已经换了文件，只在仍是当前文件时重新加载
+        if source == f"songs/{self.filename_var.get().strip()}":
+            self.load_audio(source)
+
     def load_audio(self, filepath):
         if os.path.exists(filepath):
-            try:
-                pygame.mixer.music.load(filepath)
-                self.audio_length = 0
-                try:
-                    audio = MutagenFile(filepath)
-                    if audio and audio.info:
-                        self.audio_length = audio.info.length
-                except: pass
-                
-                if self.audio_length == 0:
-                    try:
-                        sound = pygame.mixer.Sound(filepath)
-                        self.audio_length = sound.get_length()
-                    except: pass
-                
-                if self.audio_length == 0: self.audio_length = 120
-
-                self.progress_scale.configure(to=self.audio_length)
-                self.progress_scale.state(['!disabled'])
-                self.update_time_label()
-                
-            except Exception as e:
-                print(f"Load error: {e}")
-                self.progress_scale.state(['disabled'])
+            filepath = self.audio_source(filepath)
+            if filepath is None:
+                return
+            # 只读取时长，文件在点击播放时才交给 mixer；读不出时长时按 120 秒处理
+            self.audio_length = audio_duration(filepath) or 120
+            self.progress_scale.configure(to=self.audio_length)
+            self.progress_scale.state(['!disabled'])
+            self.play_button.state(['!disabled'])
+            self.update_time_label()
         else:
             self.progress_scale.state(['disabled'])
 
@@ -634,10 +817,11 @@ class SongDialog:
     def restart_playback(self, start_pos):
         filename = self.filename_var.get().strip()
         filepath = f"songs/{filename}"
-        if os.path.exists(filepath):
-            pygame.mixer.music.stop()
-            pygame.mixer.music.load(filepath)
-            pygame.mixer.music.play(start=start_pos)
+        source = self.audio_source(filepath)
+        if os.path.exists(filepath) and source is not None:
+            stop_playback()
+            audio_mixer().music.load(source)
+            audio_mixer().music.play(start=start_pos)
             self.play_start_time = time.time()
             self.track_start_pos = start_pos
             
@@ -653,9 +837,11 @@ class SongDialog:
         if not os.path.exists(filepath): return
 
         if not self.is_playing:
+            source = self.audio_source(filepath)
+            if source is None: return  # 还在转码
             try:
-                pygame.mixer.music.load(filepath)
-                pygame.mixer.music.play(start=self.current_pos)
+                audio_mixer().music.load(source)
+                audio_mixer().music.play(start=self.current_pos)
                 self.is_playing = True
                 self.play_button.config(text="暂停")
                 self.play_start_time = time.time()
@@ -669,7 +855,7 @@ class SongDialog:
 
     def update_progress(self):
         while self.is_playing and not self.stop_thread_flag:
-            if not pygame.mixer.music.get_busy(): break
+            if not audio_mixer().music.get_busy(): break
             elapsed = time.time() - self.play_start_time
             current = self.track_start_pos + elapsed
             if current > self.audio_length: current = self.audio_length
@@ -684,7 +870,7 @@ class SongDialog:
 
     def stop_audio(self):
         self.stop_thread_flag = True
-        pygame.mixer.music.stop()
+        stop_playback()
         self.is_playing = False
         self.play_button.config(text="播放")
 
@@ -776,8 +962,13 @@ class SongDialog:
             messagebox.showerror("错误", f"找不到音频文件: {filepath}")
             return
 
+        source = self.audio_source(filepath)
+        if source is None:
+            messagebox.showinfo("提示", "音频正在准备中，请稍候")
+            return
+
         # 创建副歌提取对话框
-        ChorusExtractionDialog(self.dialog, filepath, self)
+        ChorusExtractionDialog(self.dialog, source, self)
 
     def preview_segment(self):
         """预览当前设置的片段"""
@@ -803,6 +994,11 @@ class SongDialog:
             messagebox.showerror("错误", "结束时间必须大于开始时间")
             return
 
+        source = self.audio_source(filepath)
+        if source is None:
+            messagebox.showinfo("提示", "音频正在准备中，请稍候")
+            return
+
         # 如果当前正在播放，先停止
         if self.is_playing:
             self.stop_audio()
@@ -814,8 +1010,8 @@ class SongDialog:
 
         # 开始播放
         try:
-            pygame.mixer.music.load(filepath)
-            pygame.mixer.music.play(start=start_time)
+            audio_mixer().music.load(source)
+            audio_mixer().music.play(start=start_time)
             self.is_playing = True
             self.play_button.config(text="暂停")
             self.play_start_time = time.time()
@@ -828,7 +1024,7 @@ class SongDialog:
     def update_progress_for_segment(self, end_time):
         """更新进度条并检查是否到达片段结束时间"""
         while self.is_playing and not self.stop_thread_flag:
-            if not pygame.mixer.music.get_busy(): break
+            if not audio_mixer().music.get_busy(): break
             elapsed = time.time() - self.play_start_time
             current = self.track_start_pos + elapsed
             if current > self.audio_length: current = self.audio_length
@@ -859,10 +1055,6 @@ class ChorusExtractionDialog:
         self.song_dialog = song_dialog
         self.intervals = []
         
-        # 初始化 mixer
-        if not pygame.mixer.get_init():
-            pygame.mixer.init()
-
         self.dialog = tk.Toplevel(parent)
         self.dialog.title("副歌提取结果(实验性)")
         self.dialog.geometry("700x700")
@@ -1036,30 +1228,11 @@ class ChorusExtractionDialog:
 
     def load_audio(self, filepath):
         if os.path.exists(filepath):
-            try:
-                pygame.mixer.music.load(filepath)
-                self.audio_length = 0
-                try:
-                    audio = MutagenFile(filepath)
-                    if audio and audio.info:
-                        self.audio_length = audio.info.length
-                except: pass
-                
-                if self.audio_length == 0:
-                    try:
-                        sound = pygame.mixer.Sound(filepath)
-                        self.audio_length = sound.get_length()
-                    except: pass
-                
-                if self.audio_length == 0: self.audio_length = 120
-
-                self.progress_scale.configure(to=self.audio_length)
-                self.progress_scale.state(['!disabled'])
-                self.update_time_label()
-                
-            except Exception as e:
-                print(f"Load error: {e}")
-                self.progress_scale.state(['disabled'])
+            # 只读取时长，文件在点击播放时才交给 mixer；读不出时长时按 120 秒处理
+            self.audio_length = audio_duration(filepath) or 120
+            self.progress_scale.configure(to=self.audio_length)
+            self.progress_scale.state(['!disabled'])
+            self.update_time_label()
         else:
             self.progress_scale.state(['disabled'])
 
@@ -1073,9 +1246,9 @@ class ChorusExtractionDialog:
 
     def restart_playback(self, start_pos):
         if os.path.exists(self.filepath):
-            pygame.mixer.music.stop()
-            pygame.mixer.music.load(self.filepath)
-            pygame.mixer.music.play(start=start_pos)
+            stop_playback()
+            audio_mixer().music.load(self.filepath)
+            audio_mixer().music.play(start=start_pos)
             self.play_start_time = time.time()
             self.track_start_pos = start_pos
             
@@ -1091,8 +1264,8 @@ class ChorusExtractionDialog:
 
         if not self.is_playing:
             try:
-                pygame.mixer.music.load(self.filepath)
-                pygame.mixer.music.play(start=self.current_pos)
+                audio_mixer().music.load(self.filepath)
+                audio_mixer().music.play(start=self.current_pos)
                 self.is_playing = True
                 self.play_button.config(text="暂停")
                 self.play_start_time = time.time()
@@ -1123,9 +1296,9 @@ class ChorusExtractionDialog:
         if self.is_playing:
             self.restart_playback(start_time)
         else:
-            pygame.mixer.music.stop()
-            pygame.mixer.music.load(self.filepath)
-            pygame.mixer.music.play(start=start_time)
+            stop_playback()
+            audio_mixer().music.load(self.filepath)
+            audio_mixer().music.play(start=start_time)
             self.is_playing = True
             self.play_button.config(text="暂停")
             self.play_start_time = time.time()
@@ -1135,7 +1308,7 @@ class ChorusExtractionDialog:
 
     def update_progress(self):
         while self.is_playing and not self.stop_thread_flag:
-            if not pygame.mixer.music.get_busy(): break
+            if not audio_mixer().music.get_busy(): break
             elapsed = time.time() - self.play_start_time
             current = self.track_start_pos + elapsed
             if current > self.audio_length: current = self.audio_length
@@ -1162,7 +1335,7 @@ class ChorusExtractionDialog:
 
     def stop_audio(self):
         self.stop_thread_flag = True
-        pygame.mixer.music.stop()
+        stop_playback()
         self.is_playing = False
         self.play_button.config(text="播放")
 
@@ -0,0 +1,267 @@
+import argparse
+import os
+import random
+import socket
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import mp3_frames
+import otaku_engine
+import render_jobs
+from render_cache import SegmentCache
+from source_library import SourceLibrary
+
+# 现场模式：不生成固定长度的文件，而是无限地随机播放歌单，
+# 后台提前渲染接下来的几首，并把连续的 MP3 流输出到 stdout / 管道 / TCP 连接
+
+LOOKAHEAD = 2          # 提前渲染的曲目数
+CHUNK_SECONDS = 0.5    # 每次写出的音频时长
+MAX_LEAD_SECONDS = 3.0 # 输出最多领先实际播放的时长，超过则等待（按实时速度推流）
+FAILURE_BACKOFF = 0.5  # 渲染失败后的等待时间，连续失败时逐次翻倍
+MAX_BACKOFF = 10.0
+
+
+def log(message):
+    # stdout 可能就是音频流，日志一律写到 stderr
+    print(message, file=sys.stderr, flush=True)
+
+
+class Setlist:
+    """可热加载的歌单：CSV 被修改后，下一次检查时重新读取"""
+
+    def __init__(self, csv_file):
+        self.csv_file = csv_file
+        # 第一次读取失败时直接抛出（由调用方报错退出），之后读取失败只记录日志并沿用旧歌单
+        self.mtime = os.stat(csv_file).st_mtime_ns
+        self.entries = otaku_engine.read_setlist(csv_file)
+
+    def reload(self):
+        """文件有变化时重新读取，返回是否发生了变化"""
+        try:
+            mtime = os.stat(self.csv_file).st_mtime_ns
+        except OSError:
+            return False
+        if mtime == self.mtime:
+            return False
+        try:
+            entries = otaku_engine.read_setlist(self.csv_file)
+        except (OSError, ValueError) as e:
+            log(f"读取歌单失败，继续使用旧歌单: {e}")
+            return False
+        self.mtime = mtime
+        changed = entries != self.entries
+        self.entries = entries
+        return changed
+
+
+class ShuffleSequence:
+    """无限随机序列：与 random_otaku.py 一样每轮把整个歌单打乱一次，播完再打乱下一轮
+
+    两轮交界处不会连续播放同一首。歌单变化时立即按新歌单重新开始一轮。
+    """
+
+    def __init__(self, setlist, rng=None):
+        self.setlist = setlist
+        self.rng = rng or random.Random()
+        self.bag = []
+        self.last = None
+        self.exclude = set()  # 新一轮中需要跳过的曲目（歌单更新时已经排队的曲目）
+        self.on_new_round = None
+
+    def reset(self, exclude=()):
+        self.bag = []
+        self.exclude = set(exclude)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while not self.bag:
+            entries = [e for e in self.setlist.entries if e not in self.exclude] or list(self.setlist.entries)
+            self.exclude = set()
+            if not entries:
+                # 歌单为空时等待它被编辑
+                time.sleep(1)
+                self.setlist.reload()
+                continue
+            self.rng.shuffle(entries)
+            if len(entries) > 1 and entries[0] == self.last:
+                entries[0], entries[-1] = entries[-1], entries[0]
+            self.bag = entries
+            if self.on_new_round:
+                self.on_new_round()
+        self.last = self.bag.pop(0)
+        return self.last
+
+
+class LookaheadRenderer:
+    """双缓冲渲染：当前曲目播放时，后台已经在渲染接下来的 lookahead 首"""
+
+    def __init__(self, sequence, renderer, lookahead=LOOKAHEAD):
+        self.sequence = sequence
+        self.renderer = renderer  # render_jobs.Renderer：与其他入口共用片段渲染、缓存与淘汰
+        self.lookahead = max(1, lookahead)
+        self.pool = ThreadPoolExecutor(max_workers=self.lookahead)
+        self.pending = deque()
+        self.failed = set()  # 上次成功以来渲染失败的曲目
+        sequence.on_new_round = self.evict
+
+    def _render(self, entry):
+        path, _ = self.renderer.ensure_segment(*entry)
+        return path
+
+    def _fill(self):
+        while len(self.pending) < self.lookahead + 1:
+            entry = next(self.sequence)
+            self.pending.append((entry, self.pool.submit(self._render, entry)))
+
+    def _check_reload(self):
+        """歌单变化时丢弃已排队但不在新歌单中的曲目，正在播放的曲目不受影响"""
+        if not self.sequence.setlist.reload():
+            return
+        entries = set(self.sequence.setlist.entries)
+        log(f"歌单已更新：{len(entries)} 首")
+        kept = deque()
+        for entry, future in self.pending:
+            if entry in entries:
+                kept.append((entry, future))
+            else:
+                future.cancel()
+        self.pending = kept
+        self.sequence.reset(entry for entry, _ in kept)
+        self.failed.clear()
+
+    def evict(self):
+        """每轮开始时按磁盘预算清理缓存，保留当前歌单用到的片段"""
+        self.renderer.evict(self.sequence.setlist.entries)
+
+    def __iter__(self):
+        while True:
+            self._check_reload()
+            self._fill()
+            entry, future = self.pending.popleft()
+            if not future.done():
+                log(f"等待渲染: {entry[0]}")
+            try:
+                path = future.result()
+            except Exception as e:
+                log(f"渲染失败，跳过 {entry[0]}: {e}")
+                self.failed.add(entry)
+                if self.failed >= set(self.sequence.setlist.entries):
+                    raise RuntimeError(f"歌单中的 {len(self.failed)} 首全部渲染失败") from e
+                time.sleep(min(FAILURE_BACKOFF * 2 ** (len(self.failed) - 1), MAX_BACKOFF))
+                continue
+            self.failed.clear()
+            # 先补满队列再交出当前曲目，保证播放期间后台始终在渲染
+            self._fill()
+            yield entry, path
+
+
+class FileSink:
+    """写入文件对象（stdout 或命名管道）"""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+
+    def write(self, data):
+        self.fileobj.write(data)
+        self.fileobj.flush()
+
+
+class SocketSink:
+    """TCP 广播：所有连接的客户端收到同一路 MP3 流，断开的客户端自动移除"""
+
+    def __init__(self, host, port):
+        self.server = socket.create_server((host, port))
+        self.clients = []
+        self.lock = threading.Lock()
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            conn, addr = self.server.accept()
+            log(f"客户端已连接: {addr[0]}:{addr[1]}")
+            with self.lock:
+                self.clients.append(conn)
+
+    def write(self, data):
+        with self.lock:
+            clients = list(self.clients)
+        for conn in clients:
+            try:
+                conn.sendall(data)
+            except OSError:
+                with self.lock:
+                    self.clients.remove(conn)
+                conn.close()
+
+
+def stream(renderer, sink):
+    """按实时速度把渲染好的片段逐帧写入 sink，片段之间按帧直接衔接"""
+    started = time.monotonic()
+    sent = 0.0
+    for (song_file, _, _), path in renderer:
+        log(f"正在播放: {song_file}")
+        with open(path, "rb") as f:
+            data = f.read()
+        frames = mp3_frames.scan_buffer(data).frames
+        if not frames:
+            continue
+        group = max(1, round(CHUNK_SECONDS * frames[0].sample_rate / frames[0].samples))
+        for i in range(0, len(frames), group):
+            chunk = frames[i:i + group]
+            sink.write(mp3_frames.read_frames_from(data, chunk))
+            sent += sum(f.samples for f in chunk) / chunk[0].sample_rate
+            ahead = sent - (time.monotonic() - started)
+            if ahead > MAX_LEAD_SECONDS:
+                time.sleep(ahead - MAX_LEAD_SECONDS)
+
+
+def main():
+    p = argparse.ArgumentParser(description="无限随机播放歌单并输出连续的 MP3 流")
+    p.add_argument("--csv", default="songs.csv", help="歌单 CSV，修改后自动重新加载")
+    p.add_argument("--songs-dir", default="songs")
+    p.add_argument("--cache-dir", default="cache")
+    p.add_argument("--mode", choices=render_jobs.SEGMENT_MODES, default="single_pass")
+    p.add_argument("--lookahead", type=int, default=LOOKAHEAD, help="提前渲染的曲目数")
+    p.add_argument("--seed", type=int, default=None)
+    target = p.add_mutually_exclusive_group()
+    target.add_argument("--output", default="-", help="输出文件或命名管道，- 表示 stdout")
+    target.add_argument("--listen", help="以 host:port 监听 TCP 连接，例如 127.0.0.1:8765")
+    args = p.parse_args()
+
+    try:
+        setlist = Setlist(args.csv)
+    except (OSError, ValueError) as e:
+        log(f"读取歌单失败: {e}")
+        sys.exit(1)
+
+    if args.listen:
+        host, _, port = args.listen.rpartition(":")
+        sink = SocketSink(host or "127.0.0.1", int(port))
+        log(f"监听 {args.listen}，可用 ffplay tcp://{args.listen} 收听")
+    elif args.output == "-":
+        sink = FileSink(sys.stdout.buffer)
+    else:
+        sink = FileSink(open(args.output, "wb"))
+
+    sequence = ShuffleSequence(setlist, random.Random(args.seed))
+    segments = render_jobs.Renderer(SegmentCache(args.cache_dir), SourceLibrary(args.cache_dir), args.songs_dir,
+                                    args.mode, workers=args.lookahead, log=log)
+    renderer = LookaheadRenderer(sequence, segments, args.lookahead)
+    try:
+        stream(renderer, sink)
+    except (BrokenPipeError, KeyboardInterrupt):
+        pass
+    except RuntimeError as e:
+        log(f"停止播放: {e}")
+        sys.exit(1)
+    finally:
+        renderer.pool.shutdown(wait=False, cancel_futures=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+
+import ffmpeg_scheduler
+from render_cache import LOUDNESS_FILE, content_hash
+
+# 响度统一：每个 (源文件, 开始, 结束) 片段只用 ebur128 测量一次积分响度与真峰值，
+# 结果按源文件内容哈希保存在 cache/loudness.json 中；渲染时只按测量值施加一个固定增益，仍然只编码一次。
+# 目标为 EBU R128 的积分响度测量，电平按现场播放习惯取 -14 LUFS，真峰值不超过 -1 dBTP。
+
+TARGET_LUFS = -14.0       # 目标积分响度，设为 None 时不做响度统一
+TRUE_PEAK_LIMIT = -1.0    # 增益后允许的最大真峰值（dBTP）
+SILENCE_LUFS = -70.0      # 低于此响度视为静音，不调整
+
+_INTEGRATED = re.compile(r"I:\s+(-?[\d.]+|-inf) LUFS")
+_TRUE_PEAK = re.compile(r"Peak:\s+(-?[\d.]+|-inf) dBFS")
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def loudness_params():
+    """影响响度统一结果的参数，作为片段缓存键的一部分（未启用时为 None）"""
+    if TARGET_LUFS is None:
+        return None
+    return {"target": TARGET_LUFS, "true_peak": TRUE_PEAK_LIMIT}
+
+
+def gain_for(integrated, true_peak, target=TARGET_LUFS, peak_limit=TRUE_PEAK_LIMIT):
+    """由测量值计算增益（dB）：把积分响度拉到目标值，但真峰值不超过上限"""
+    if target is None or integrated is None or integrated <= SILENCE_LUFS:
+        return 0.0
+    gain = target - integrated
+    if true_peak is not None:
+        gain = min(gain, peak_limit - true_peak)
+    return round(gain, 2)
+
+
+def measure(path, start_time=0, end_time=0):
+    """用 ebur128 测量 [start_time, end_time) 的积分响度（LUFS）与真峰值（dBTP），end_time 为 0 表示到结尾"""
+    import ffmpeg
+    input_args = {"ss": start_time} if start_time else {}
+    if end_time:
+        input_args["t"] = end_time - start_time
+    text = ffmpeg_scheduler.run_stderr(
+        ffmpeg
+        .input(path, **input_args)
+        .audio
+        .filter("ebur128", peak="true", framelog="verbose")
+        .output("-", f="null")
+        .global_args("-nostats")
+    )
+    # 逐帧日志为 verbose 级别不会输出，取最后的摘要
+    integrated = _INTEGRATED.findall(text)
+    true_peak = _TRUE_PEAK.findall(text)
+    if not integrated:
+        raise RuntimeError(f"无法测量响度: {path}")
+    return _to_float(integrated[-1]), _to_float(true_peak[-1]) if true_peak else None
+
+
+def _to_float(value):
+    return -math.inf if value == "-inf" else float(value)
+
+
+class LoudnessStore:
+    """按内容寻址的响度测量结果：{键: [积分响度, 真峰值]}"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        try:
+            with open(path, encoding="utf-8") as f:
+                self.data = json.load(f)
+        except (OSError, ValueError):
+            self.data = {}
+
+    @staticmethod
+    def key(input_path, start_time, end_time):
+        """源文件内容哈希 + 起止时间（与文件名、修改时间无关，复制或改名后仍然命中）"""
+        raw = f"{content_hash(input_path)}:{round(float(start_time), 3)}:{round(float(end_time), 3)}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            value = self.data.get(key)
+        return tuple(value) if value is not None else None
+
+    def put(self, key, integrated, true_peak):
+        with self.lock:
+            # JSON 不支持 -inf，静音片段记为 null
+            self.data[key] = [integrated if math.isfinite(integrated) else None,
+                              true_peak if true_peak is not None and math.isfinite(true_peak) else None]
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.data, f)
+            os.replace(tmp, self.path)
+
+    def measurement(self, input_path, start_time, end_time, decode_path=None):
+        """返回 (积分响度, 真峰值)，没有记录时测量一次并保存；decode_path 可指定实际读取的文件（如规范化中间文件）"""
+        key = self.key(input_path, start_time, end_time)
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        integrated, true_peak = measure(decode_path or input_path, start_time, end_time)
+        self.put(key, integrated, true_peak)
+        return self.get(key)
+
+
+def store_for(cache):
+    """片段缓存对应的响度记录（同一 cache 目录共用一个实例）"""
+    path = os.path.abspath(os.path.join(cache.cache_dir, LOUDNESS_FILE))
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = LoudnessStore(path)
+        return _stores[path]
+
+
+def segment_gain(cache, input_path, start_time, end_time, decode_path=None):
+    """片段需要施加的增益（dB），未启用响度统一时为 0"""
+    if TARGET_LUFS is None:
+        return 0.0
+    integrated, true_peak = store_for(cache).measurement(input_path, start_time, end_time, decode_path)
+    return gain_for(integrated, true_peak)
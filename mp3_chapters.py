@@ -0,0 +1,83 @@
+import io
+import mmap
+import os
+
+import mp3_frames
+
+# 最终 MP3 的寻址信息：重写 Xing/Info 帧（正确的总帧数与 TOC）并写入 ID3 CHAP 章节
+# 只扫描帧头、按字节复制，不重新解码
+
+COPY_CHUNK = 16 * 1024 * 1024
+
+
+def segment_duration(path):
+    """按帧数计算片段时长（秒），与按帧流复制拼接后在整场中占用的时长一致"""
+    return mp3_frames.scan_file(path).duration
+
+
+def chapters_from_durations(titles, durations):
+    """由各首的标题与时长生成 [(标题, 开始秒, 结束秒)]"""
+    chapters = []
+    position = 0.0
+    for title, duration in zip(titles, durations):
+        chapters.append((title, position, position + duration))
+        position += duration
+    return chapters
+
+
+def build_id3(chapters, title=""):
+    """生成包含 CTOC 与各章节 CHAP 帧的 ID3v2.4 标签字节"""
+    from mutagen.id3 import ID3, CHAP, CTOC, TIT2, CTOCFlags
+    tags = ID3()
+    if title:
+        tags.add(TIT2(encoding=3, text=[title]))
+    element_ids = [f"ch{i}" for i in range(len(chapters))]
+    tags.add(CTOC(
+        element_id="toc", flags=CTOCFlags.TOP_LEVEL | CTOCFlags.ORDERED,
+        child_element_ids=element_ids, sub_frames=[TIT2(encoding=3, text=["目录"])],
+    ))
+    for element_id, (chapter_title, start, end) in zip(element_ids, chapters):
+        tags.add(CHAP(
+            element_id=element_id, start_time=round(start * 1000), end_time=round(end * 1000),
+            sub_frames=[TIT2(encoding=3, text=[chapter_title])],
+        ))
+    buf = io.BytesIO()
+    tags.save(buf, v2_version=4)
+    return buf.getvalue()
+
+
+def write_seekable(path, chapters, title=""):
+    """把 path 重写为：ID3 章节标签 + 新的 Xing/Info 帧 + 原有音频帧
+
+    原文件中的 ID3 与第一个片段遗留的 Xing/LAME 帧都会被去掉；原信息帧描述的正是整个文件时
+    （整场一次编码的输出），保留其中 LAME 扩展的编码器延迟与填充。没有可识别的音频帧时不做修改并返回 False。
+    """
+    rewritten = f"{path}.seek.tmp"
+    with open(path, "rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # 空文件
+            return False
+        try:
+            scan = mp3_frames.scan_buffer(mm)
+            frames = scan.frames
+            if not frames:
+                return False
+            lame = None
+            if scan.tag_frame is not None and (mp3_frames.xing_counts(mm, scan.tag_frame) or (None,))[0] == len(frames):
+                lame = mp3_frames.lame_tag(mm, scan.tag_frame)
+            start = frames[0].offset
+            end = frames[-1].offset + frames[-1].size
+            with open(rewritten, "wb") as out:
+                out.write(build_id3(chapters, title))
+                out.write(mp3_frames.xing_frame(frames, lame))
+                for pos in range(start, end, COPY_CHUNK):
+                    out.write(mm[pos:min(end, pos + COPY_CHUNK)])
+        except BaseException:
+            if os.path.exists(rewritten):
+                os.remove(rewritten)
+            raise
+        finally:
+            mm.close()
+    os.replace(rewritten, path)
+    return True
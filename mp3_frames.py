@@ -0,0 +1,437 @@
+import mmap
+import struct
+from collections import namedtuple
+
+# MPEG Audio Layer III 帧头解析
+# 参考: http://www.mp3-tech.org/programmer/frame_header.html
+
+# 版本位 -> 名称
+MPEG1, MPEG2, MPEG25 = 3, 2, 0
+
+# 码率表 (kbps)，按 MPEG1 / MPEG2(2.5) 区分，下标为码率位
+BITRATES = {
+    MPEG1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 0),
+    MPEG2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160, 0),
+}
+SAMPLE_RATES = {
+    MPEG1: (44100, 48000, 32000),
+    MPEG2: (22050, 24000, 16000),
+    MPEG25: (11025, 12000, 8000),
+}
+
+# LAME 扩展（紧跟在 Xing/Info 各字段之后）：编码器版本、延迟与填充、音乐长度、CRC 等，共 36 字节
+LAME_TAG_SIZE = 36
+LAME_MUSIC_LENGTH = 28  # 扩展内的偏移：音乐长度（信息帧 + 音频的字节数）
+LAME_TAG_CRC = 34       # 扩展内的偏移：信息帧前 190 字节的 CRC-16
+
+# offset: 帧在文件中的字节偏移；size: 帧字节数；samples: 每帧采样数
+Frame = namedtuple("Frame", "offset size version bitrate sample_rate channels samples has_crc")
+
+
+class Mp3Scan:
+    """一次扫描的结果：音频帧列表、ID3 标签、Xing/LAME 信息以及无法解析的字节区间"""
+
+    def __init__(self):
+        self.frames = []
+        self.gaps = []            # [(offset, length)] 帧之间无法解析的数据
+        self.id3v2_size = 0
+        self.tag_frame = None     # Xing/Info/VBRI 信息帧（不含音频）
+        self.encoder_delay = None # LAME 标签中的编码器延迟（采样数）
+        self.encoder_padding = None
+        self.audio_end = 0        # 最后一帧结束的位置
+        self.main_data_begins = None  # 每帧的 main_data_begin（仅在扫描时要求才会填充）
+
+    @property
+    def sample_rate(self):
+        return self.frames[0].sample_rate if self.frames else 0
+
+    @property
+    def total_samples(self):
+        return sum(f.samples for f in self.frames)
+
+    @property
+    def duration(self):
+        """按帧数计算的时长（秒），未扣除编码器延迟与填充"""
+        return self.total_samples / self.sample_rate if self.frames else 0.0
+
+    @property
+    def decoder_skip(self):
+        """ffmpeg 解码时在开头丢弃的采样数：有 LAME 标签时为 延迟+529，否则为 0"""
+        if self.encoder_delay is None:
+            return 0
+        return self.encoder_delay + 529
+
+
+def parse_header(buf, pos):
+    """解析 pos 处的 Layer III 帧头，无效时返回 None"""
+    if pos + 4 > len(buf):
+        return None
+    b0, b1, b2, b3 = buf[pos], buf[pos + 1], buf[pos + 2], buf[pos + 3]
+    if b0 != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+    version = (b1 >> 3) & 0x03
+    layer = (b1 >> 1) & 0x03
+    if version == 1 or layer != 1:  # 保留版本，或者不是 Layer III
+        return None
+    bitrate_index = b2 >> 4
+    sr_index = (b2 >> 2) & 0x03
+    if bitrate_index in (0, 15) or sr_index == 3:
+        return None
+
+    bitrate = BITRATES[MPEG1 if version == MPEG1 else MPEG2][bitrate_index] * 1000
+    sample_rate = SAMPLE_RATES[version][sr_index]
+    padding = (b2 >> 1) & 0x01
+    if version == MPEG1:
+        samples = 1152
+        size = 144 * bitrate // sample_rate + padding
+    else:
+        samples = 576
+        size = 72 * bitrate // sample_rate + padding
+    channels = 1 if (b3 >> 6) == 3 else 2
+    has_crc = not (b1 & 0x01)
+    return Frame(pos, size, version, bitrate, sample_rate, channels, samples, has_crc)
+
+
+def side_info_offset(frame):
+    """帧头（及 CRC）之后 side info 的起始偏移"""
+    return frame.offset + 4 + (2 if frame.has_crc else 0)
+
+
+def side_info_length(frame):
+    """side info 字节数"""
+    if frame.version == MPEG1:
+        return 17 if frame.channels == 1 else 32
+    return 9 if frame.channels == 1 else 17
+
+
+def data_range(frame):
+    """帧内主数据区（side info 之后到帧尾）的起止偏移"""
+    return side_info_offset(frame) + side_info_length(frame), frame.offset + frame.size
+
+
+def main_data_begin(buf, frame):
+    """读取帧的 main_data_begin：主数据从比特池中向前借用的字节数，0 表示不依赖之前的帧"""
+    pos = side_info_offset(frame)
+    if frame.version == MPEG1:
+        return ((buf[pos] << 1) | (buf[pos + 1] >> 7)) & 0x1FF
+    return buf[pos]
+
+
+def _granule_layout(frame):
+    """side info 中 granule/声道字段的排布：(公共字段位数, granule 数, 每个 granule/声道的位数)"""
+    if frame.version == MPEG1:
+        # main_data_begin(9) + private_bits(5/3) + scfsi(4/声道)；每个 granule/声道 59 位
+        return 9 + (5 if frame.channels == 1 else 3) + 4 * frame.channels, 2, 59
+    # main_data_begin(8) + private_bits(1/2)；scalefac_compress 多 5 位且没有 preflag，共 63 位
+    return 8 + (1 if frame.channels == 1 else 2), 1, 63
+
+
+def main_data_length(buf, frame):
+    """帧自身主数据的字节数（各 granule/声道 part2_3_length 之和，向上取整到字节）"""
+    pos = side_info_offset(frame)
+    bits = int.from_bytes(buf[pos:pos + side_info_length(frame)], "big")
+    total_bits = side_info_length(frame) * 8
+    header_bits, granules, gr_bits = _granule_layout(frame)
+    length = 0
+    for i in range(granules * frame.channels):
+        shift = total_bits - header_bits - i * gr_bits - 12
+        length += (bits >> shift) & 0xFFF
+    return (length + 7) // 8
+
+
+def adjust_global_gain(buf, frames, steps):
+    """把 frames（需连续、不带 CRC）每个 granule/声道的 global_gain 加上 steps，返回修改后的帧字节
+
+    global_gain 每步为 1.5 dB，只改写 side info，主数据与比特池不变，相当于无损地调整音量（与 mp3gain 相同）。
+    """
+    out = bytearray(read_frames_from(buf, frames))
+    base = frames[0].offset if frames else 0
+    for frame in frames:
+        pos = side_info_offset(frame) - base
+        length = side_info_length(frame)
+        bits = int.from_bytes(out[pos:pos + length], "big")
+        header_bits, granules, gr_bits = _granule_layout(frame)
+        for i in range(granules * frame.channels):
+            # part2_3_length(12) + big_values(9) 之后是 8 位 global_gain
+            shift = length * 8 - header_bits - i * gr_bits - 29
+            gain = min(255, max(0, ((bits >> shift) & 0xFF) + steps))
+            bits = (bits & ~(0xFF << shift)) | (gain << shift)
+        out[pos:pos + length] = bits.to_bytes(length, "big")
+    return bytes(out)
+
+
+def reservoir_bytes(buf, frames, index):
+    """frames[index] 从比特池借用的字节：即它之前各帧主数据区末尾的 main_data_begin 个字节"""
+    need = main_data_begin(buf, frames[index])
+    chunks = []
+    i = index - 1
+    while need > 0 and i >= 0:
+        start, stop = data_range(frames[i])
+        take = min(need, stop - start)
+        chunks.append(bytes(buf[stop - take:stop]))
+        need -= take
+        i -= 1
+    if need > 0:
+        return None
+    return b"".join(reversed(chunks))
+
+
+def pack_frames(buf, frames, trailing=b""):
+    """重新排布一组帧的主数据，使最后 len(trailing) 个主数据字节等于 trailing
+
+    用于把重新编码的帧拼接到保留比特池的原始帧之前：frames 必须由关闭比特池的编码器生成
+    （main_data_begin 均为 0、无 CRC），排布时尽量利用比特池把主数据往前挪，
+    空出的末尾字节填入后续原始帧所借用的数据。空间不足时返回 None。
+    """
+    max_begin = 511 if frames and frames[0].version == MPEG1 else 255
+    layout = []
+    area_start = 0
+    cursor = 0
+    for frame in frames:
+        if frame.has_crc or main_data_begin(buf, frame) != 0:
+            return None
+        start, stop = data_range(frame)
+        length = main_data_length(buf, frame)
+        pos = max(cursor, area_start - max_begin)
+        if pos + length > area_start + (stop - start):
+            return None
+        layout.append((pos, length, start))
+        cursor = pos + length
+        area_start += stop - start
+
+    if cursor > area_start - len(trailing):
+        return None
+
+    # 先拼出连续的主数据流，再按帧切回
+    stream = bytearray(area_start)
+    for pos, length, start in layout:
+        stream[pos:pos + length] = buf[start:start + length]
+    stream[area_start - len(trailing):] = trailing
+
+    out = bytearray()
+    area_start = 0
+    for frame, (pos, _, _) in zip(frames, layout):
+        start, stop = data_range(frame)
+        head = bytearray(buf[frame.offset:start])
+        _set_main_data_begin(head, frame, area_start - pos)
+        out += head
+        out += stream[area_start:area_start + (stop - start)]
+        area_start += stop - start
+    return bytes(out)
+
+
+def _set_main_data_begin(head, frame, value):
+    """改写帧头字节（含 side info）中的 main_data_begin"""
+    pos = 4 + (2 if frame.has_crc else 0)
+    if frame.version == MPEG1:
+        head[pos] = (value >> 1) & 0xFF
+        head[pos + 1] = (head[pos + 1] & 0x7F) | ((value & 0x01) << 7)
+    else:
+        head[pos] = value & 0xFF
+
+
+def id3v2_size(buf):
+    """开头 ID3v2 标签的字节数（含页脚），没有标签时为 0"""
+    if len(buf) >= 10 and buf[:3] == b"ID3":
+        size = (buf[6] << 21) | (buf[7] << 14) | (buf[8] << 7) | buf[9]
+        footer = 10 if buf[5] & 0x10 else 0
+        return 10 + size + footer
+    return 0
+
+
+def xing_counts(buf, frame):
+    """读取 Xing/Info 信息帧中记录的 (帧数, 字节数)，未记录的项为 None；frame 不是 Xing/Info 帧时返回 None"""
+    xing_pos = side_info_offset(frame) + side_info_length(frame)
+    if bytes(buf[xing_pos:xing_pos + 4]) not in (b"Xing", b"Info"):
+        return None
+    flags = struct.unpack(">I", buf[xing_pos + 4:xing_pos + 8])[0]
+    pos = xing_pos + 8
+    frames = byte_count = None
+    if flags & 0x1:
+        frames = struct.unpack(">I", buf[pos:pos + 4])[0]
+        pos += 4
+    if flags & 0x2:
+        byte_count = struct.unpack(">I", buf[pos:pos + 4])[0]
+    return frames, byte_count
+
+
+def lame_tag(buf, frame):
+    """返回 Xing/Info 信息帧中 LAME 扩展的 36 字节，没有 LAME 扩展时返回 None"""
+    xing_pos = side_info_offset(frame) + side_info_length(frame)
+    if bytes(buf[xing_pos:xing_pos + 4]) not in (b"Xing", b"Info"):
+        return None
+    flags = struct.unpack(">I", buf[xing_pos + 4:xing_pos + 8])[0]
+    pos = xing_pos + 8
+    for bit, length in ((0x1, 4), (0x2, 4), (0x4, 100), (0x8, 4)):
+        if flags & bit:
+            pos += length
+    tag = bytes(buf[pos:pos + LAME_TAG_SIZE])
+    if len(tag) < LAME_TAG_SIZE or tag[:4] not in (b"LAME", b"Lavf", b"Lavc"):
+        return None
+    return tag
+
+
+def _crc16(data):
+    """LAME 标签使用的 CRC-16（多项式 0x8005，按位反转）"""
+    crc = 0
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+    return crc
+
+
+def _parse_tag_frame(buf, frame, scan):
+    """识别 Xing/Info/VBRI 信息帧，并读取 LAME 标签中的延迟与填充"""
+    if frame.version == MPEG1:
+        xing_pos = side_info_offset(frame) + (17 if frame.channels == 1 else 32)
+    else:
+        xing_pos = side_info_offset(frame) + (9 if frame.channels == 1 else 17)
+
+    tag = bytes(buf[xing_pos:xing_pos + 4])
+    if tag in (b"Xing", b"Info"):
+        flags = struct.unpack(">I", buf[xing_pos + 4:xing_pos + 8])[0]
+        lame_pos = xing_pos + 8
+        for bit, length in ((0x1, 4), (0x2, 4), (0x4, 100), (0x8, 4)):
+            if flags & bit:
+                lame_pos += length
+        if bytes(buf[lame_pos:lame_pos + 4]) in (b"LAME", b"Lavf", b"Lavc"):
+            delay_pos = lame_pos + 21
+            d0, d1, d2 = buf[delay_pos], buf[delay_pos + 1], buf[delay_pos + 2]
+            scan.encoder_delay = (d0 << 4) | (d1 >> 4)
+            scan.encoder_padding = ((d1 & 0x0F) << 8) | d2
+        return True
+    if bytes(buf[frame.offset + 36:frame.offset + 40]) == b"VBRI":
+        return True
+    return False
+
+
+def scan_buffer(buf, with_main_data=False):
+    """扫描整个缓冲区中的 MP3 帧，with_main_data 为 True 时同时记录每帧的 main_data_begin"""
+    scan = Mp3Scan()
+    pos = id3v2_size(buf)
+    scan.id3v2_size = pos
+    end = len(buf)
+    if end >= 128 and buf[end - 128:end - 125] == b"TAG":
+        end -= 128
+
+    first = True
+    while pos + 4 <= end:
+        frame = parse_header(buf, pos)
+        if frame is None or pos + frame.size > end:
+            # 重新同步：寻找下一个有效帧头
+            nxt = resync(buf, pos + 1, end)
+            if nxt is None:
+                scan.gaps.append((pos, end - pos))
+                break
+            scan.gaps.append((pos, nxt - pos))
+            pos = nxt
+            continue
+        if first:
+            first = False
+            if _parse_tag_frame(buf, frame, scan):
+                scan.tag_frame = frame
+                pos += frame.size
+                continue
+        scan.frames.append(frame)
+        pos += frame.size
+    scan.audio_end = pos if not scan.frames else scan.frames[-1].offset + scan.frames[-1].size
+    if with_main_data:
+        scan.main_data_begins = [main_data_begin(buf, f) for f in scan.frames]
+    return scan
+
+
+def resync(buf, pos, end):
+    """从 pos 起寻找连续两个有效帧头的位置，避免把音频数据中的 0xFF 误认为帧头"""
+    while True:
+        pos = buf.find(b"\xFF", pos, end)
+        if pos < 0:
+            return None
+        frame = parse_header(buf, pos)
+        if frame is not None:
+            nxt = pos + frame.size
+            if nxt == end or parse_header(buf, nxt) is not None:
+                return pos
+        pos += 1
+
+
+def scan_file(path, with_main_data=False):
+    """内存映射方式扫描 MP3 文件，不解码音频"""
+    with open(path, "rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # 空文件无法映射
+            return Mp3Scan()
+        try:
+            return scan_buffer(mm, with_main_data)
+        finally:
+            mm.close()
+
+
+def xing_frame(frames, lame=None):
+    """为 frames 构造一个 Xing/Info 信息帧（帧数、字节数与 100 项 TOC 寻址表）
+
+    帧头沿用第一帧的版本、采样率与声道，码率取能容纳信息的最小值；
+    码率全部相同时写 Info（CBR），否则写 Xing（VBR）。
+    lame 为原信息帧的 LAME 扩展（见 lame_tag）时原样写入，只更新音乐长度与 CRC，
+    解码器据此跳过编码器延迟与结尾填充；不给出时不写 LAME 扩展，解码器不会跳过开头的采样。
+    """
+    first = frames[0]
+    version = first.version
+    table = BITRATES[MPEG1 if version == MPEG1 else MPEG2]
+    sr_index = SAMPLE_RATES[version].index(first.sample_rate)
+    probe = Frame(0, 0, version, 0, first.sample_rate, first.channels, first.samples, False)
+    xing_pos = side_info_offset(probe) + side_info_length(probe)
+    needed = xing_pos + 4 + 4 + 4 + 4 + 100 + (4 + LAME_TAG_SIZE if lame else 0)
+
+    for bitrate_index in range(1, 15):
+        bitrate = table[bitrate_index] * 1000
+        size = (144 if version == MPEG1 else 72) * bitrate // first.sample_rate
+        if size >= needed:
+            break
+    channel_mode = 3 if first.channels == 1 else 0
+    header = bytes((
+        0xFF,
+        0xE0 | (version << 3) | (1 << 1) | 0x01,  # Layer III，无 CRC
+        (bitrate_index << 4) | (sr_index << 2),
+        channel_mode << 6,
+    ))
+
+    audio_bytes = frames[-1].offset + frames[-1].size - first.offset
+    total_bytes = size + audio_bytes
+    toc = bytearray(100)
+    for i in range(100):
+        k = min(len(frames) - 1, i * len(frames) // 100)
+        offset = size + frames[k].offset - first.offset
+        toc[i] = min(255, offset * 256 // total_bytes)
+
+    tag = b"Info" if len({f.bitrate for f in frames}) == 1 else b"Xing"
+    out = bytearray(size)
+    out[0:4] = header
+    out[xing_pos:xing_pos + 4] = tag
+    out[xing_pos + 4:xing_pos + 8] = struct.pack(">I", 0x1 | 0x2 | 0x4 | (0x8 if lame else 0))  # 帧数、字节数、TOC
+    out[xing_pos + 8:xing_pos + 12] = struct.pack(">I", len(frames))
+    out[xing_pos + 12:xing_pos + 16] = struct.pack(">I", total_bytes)
+    out[xing_pos + 16:xing_pos + 116] = toc
+    if lame:
+        # 质量指示（4 字节，保持为 0）之后是 LAME 扩展
+        lame_pos = xing_pos + 120
+        out[lame_pos:lame_pos + LAME_TAG_SIZE] = lame
+        music_length = lame_pos + LAME_MUSIC_LENGTH
+        out[music_length:music_length + 4] = struct.pack(">I", total_bytes)
+        crc_pos = lame_pos + LAME_TAG_CRC
+        out[crc_pos:crc_pos + 2] = b"\0\0"
+        out[crc_pos:crc_pos + 2] = struct.pack(">H", _crc16(out[:190]))
+    return bytes(out)
+
+
+def read_frames_from(buf, frames):
+    """从缓冲区中取出指定帧的原始字节（帧需连续）"""
+    if not frames:
+        return b""
+    return bytes(buf[frames[0].offset:frames[-1].offset + frames[-1].size])
+
+
+def strip_tags(buf):
+    """去掉 ID3 标签与 Xing/LAME 信息帧，只保留音频帧字节"""
+    return read_frames_from(buf, scan_buffer(buf).frames)
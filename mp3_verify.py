@@ -0,0 +1,217 @@
+import mmap
+import os
+
+import mp3_frames
+from mp3_frames import MPEG1, MPEG2
+
+# 生成后的快速校验：内存映射最终 MP3，只沿帧头逐帧跳转（不解码），检查
+#   1. 连续性：第一帧到文件末尾之间没有无法解析的数据、没有被截断的帧，格式（版本/采样率）前后一致；
+#   2. 总时长与计划歌单一致，Xing/Info 帧记录的帧数与实际一致；
+#   3. 章节（片段边界）首尾相接、落在帧边界上，每首的时长与计划一致。
+# 2 小时 320kbps 的文件约 27 万帧，逐帧跳转在一秒内完成。
+
+SEGMENT_TOLERANCE = 0.25  # 每首时长允许的误差（秒）：编码器延迟/填充与按帧剪切造成的差异
+MAX_PROBLEMS = 20         # 最多报告的问题数
+
+
+class Mp3Check:
+    """一次校验的结果"""
+
+    def __init__(self, path):
+        self.path = path
+        self.frames = 0
+        self.duration = 0.0
+        self.sample_rate = 0
+        self.frame_seconds = 0.0
+        self.chapters = []   # [(标题, 开始秒, 结束秒)]
+        self.problems = []
+
+    @property
+    def ok(self):
+        return not self.problems
+
+    def problem(self, message):
+        if len(self.problems) < MAX_PROBLEMS:
+            self.problems.append(message)
+
+
+def audio_length(path):
+    """读取音频文件时长（秒），失败时返回 0"""
+    from mutagen import File as MutagenFile
+    try:
+        audio = MutagenFile(path)
+    except Exception:
+        return 0
+    return audio.info.length if audio is not None and audio.info else 0
+
+
+def planned_durations(entries, mix_duration=0, length=audio_length, songs_dir="songs"):
+    """[(歌曲文件, 开始, 结束)] 中每首在输出中的计划时长 [(章节标题, 秒)]
+
+    结束时间超过歌曲实际长度时按 length(源文件) 截断，每首前面加上倒数音频的时长。
+    """
+    planned = []
+    for song_file, start_time, end_time in entries:
+        end_time = min(end_time, length(os.path.join(songs_dir, song_file)) or end_time)
+        planned.append((os.path.splitext(song_file)[0], end_time - start_time + mix_duration))
+    return planned
+
+
+def _size_table(first):
+    """按第一帧的版本与采样率生成帧长表：下标为帧头第 2、3 字节，格式不同或无效的帧头为 0"""
+    sizes = [0] * 65536
+    b1 = 0xE0 | (first.version << 3) | (1 << 1)
+    bitrates = mp3_frames.BITRATES[MPEG1 if first.version == MPEG1 else MPEG2]
+    sr_index = mp3_frames.SAMPLE_RATES[first.version].index(first.sample_rate)
+    factor = 144 if first.version == MPEG1 else 72
+    for crc_bit in (0, 1):
+        for bitrate_index in range(1, 15):
+            size = factor * bitrates[bitrate_index] * 1000 // first.sample_rate
+            # 第 3 字节：码率、采样率、填充位，最低位（私有位）可以任意取值
+            for low in range(4):
+                sizes[((b1 | crc_bit) << 8) | (bitrate_index << 4) | (sr_index << 2) | low] = size + (low >> 1)
+    return sizes
+
+
+def walk_frames(buf, pos, end, sizes):
+    """从 pos 起按帧长表逐帧跳转，返回 (停止的位置, 帧数)；一直走到 end 时停止位置等于 end"""
+    count = 0
+    while pos + 4 <= end:
+        if buf[pos] != 0xFF:
+            break
+        size = sizes[(buf[pos + 1] << 8) | buf[pos + 2]]
+        if not size or pos + size > end:
+            break
+        pos += size
+        count += 1
+    return pos, count
+
+
+def verify_mp3(path, planned=None, frame_aligned=True, tolerance=SEGMENT_TOLERANCE):
+    """校验 MP3 文件，返回 Mp3Check
+
+    planned 为计划的 [(标题, 时长秒)]（标题与章节标题相同，顺序不限）；为 None 时只检查文件自身的一致性。
+    frame_aligned 表示文件由片段按帧拼接而成，章节边界必须落在帧边界上；整场一次编码的输出
+    （numpy / streaming）章节按采样计算，并且多出编码器延迟与填充，只按 tolerance 比较。
+    """
+    check = Mp3Check(path)
+    try:
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):  # 不存在或为空文件
+        check.problem("文件不存在或为空")
+        return check
+    try:
+        _check_frames(mm, check)
+    finally:
+        mm.close()
+    if check.frames:
+        _check_chapters(check, planned, frame_aligned, tolerance)
+    return check
+
+
+def _check_frames(buf, check):
+    end = len(buf)
+    if end >= 128 and buf[end - 128:end - 125] == b"TAG":
+        end -= 128
+    tag_end = mp3_frames.id3v2_size(buf)
+    pos = tag_end
+    if mp3_frames.parse_header(buf, pos) is None:
+        pos = mp3_frames.resync(buf, pos, end)
+        if pos is None:
+            check.problem("没有可识别的 MP3 音频帧")
+            return
+        check.problem(f"标签之后有 {pos - tag_end} 字节无法解析的数据")
+
+    frame = mp3_frames.parse_header(buf, pos)
+    check.sample_rate = frame.sample_rate
+    check.frame_seconds = frame.samples / frame.sample_rate
+    xing = mp3_frames.xing_counts(buf, frame)
+    if xing is not None:
+        pos += frame.size
+
+    while pos + 4 <= end:
+        stop, count = walk_frames(buf, pos, end, _size_table(frame))
+        check.frames += count
+        check.duration += count * frame.samples / frame.sample_rate
+        if stop + 4 > end:
+            if stop < end:
+                check.problem(f"文件末尾有 {end - stop} 字节不完整的数据")
+            break
+        nxt = mp3_frames.parse_header(buf, stop)
+        if nxt is not None and stop + nxt.size > end:
+            check.problem(f"最后一帧被截断（偏移 {stop}，缺少 {stop + nxt.size - end} 字节）")
+            break
+        if nxt is not None:
+            # 帧头有效但格式改变：报告后按新格式继续
+            check.problem(f"约 {check.duration:.1f}s 处格式改变（{frame.sample_rate}Hz -> {nxt.sample_rate}Hz）")
+            frame, pos = nxt, stop
+            continue
+        pos = mp3_frames.resync(buf, stop + 1, end)
+        if pos is None:
+            check.problem(f"偏移 {stop} 之后的 {end - stop} 字节无法解析")
+            break
+        check.problem(f"约 {check.duration:.1f}s 处不连续：偏移 {stop} 有 {pos - stop} 字节无法解析的数据")
+        frame = mp3_frames.parse_header(buf, pos)
+
+    if not check.frames:
+        check.problem("信息帧之后没有音频帧")
+    elif xing is not None and xing[0] is not None and xing[0] != check.frames:
+        check.problem(f"信息帧记录 {xing[0]} 帧，实际 {check.frames} 帧")
+
+
+def _check_chapters(check, planned, frame_aligned, tolerance):
+    from mutagen.id3 import ID3, ID3NoHeaderError
+    frame_seconds = check.frame_seconds
+    try:
+        tags = ID3(check.path)
+    except ID3NoHeaderError:
+        tags = None
+    if tags is not None:
+        for chap in sorted(tags.getall("CHAP"), key=lambda chap: chap.start_time):
+            title = chap.sub_frames["TIT2"].text[0] if "TIT2" in chap.sub_frames else chap.element_id
+            check.chapters.append((title, chap.start_time / 1000, chap.end_time / 1000))
+
+    position = 0.0
+    for title, start, end in check.chapters:
+        if abs(start - position) > 0.002:
+            check.problem(f"章节 {title} 开始于 {start:.3f}s，与上一章节结束 {position:.3f}s 不相接")
+        # CHAP 以毫秒记录，边界应落在帧边界上（误差在 1 毫秒取整以内）
+        offset = start / frame_seconds
+        if frame_aligned and abs(offset - round(offset)) * frame_seconds > 0.002:
+            check.problem(f"章节 {title} 的开始 {start:.3f}s 不在帧边界上")
+        position = end
+    if check.chapters and abs(position - check.duration) > (frame_seconds if frame_aligned else tolerance):
+        check.problem(f"章节结束于 {position:.3f}s，音频时长为 {check.duration:.3f}s")
+
+    if planned is None:
+        return
+    planned_total = sum(seconds for _, seconds in planned)
+    if abs(planned_total - check.duration) > tolerance * max(1, len(planned)):
+        check.problem(f"总时长 {check.duration:.1f}s 与计划 {planned_total:.1f}s 不符")
+    if not check.chapters:
+        return
+    expected = {}
+    for title, seconds in planned:
+        expected.setdefault(title, []).append(seconds)
+    for title, start, end in check.chapters:
+        if not expected.get(title):
+            check.problem(f"章节 {title} 不在计划歌单中")
+            continue
+        seconds = expected[title].pop(0)
+        if abs((end - start) - seconds) > tolerance:
+            check.problem(f"{title} 时长 {end - start:.2f}s，计划 {seconds:.2f}s")
+    missing = [title for title, rest in expected.items() for _ in rest]
+    if missing:
+        check.problem(f"缺少 {len(missing)} 首: " + ", ".join(missing[:5]))
+
+
+def describe(check):
+    """校验结果的日志文本"""
+    if not check.frames:
+        return f"!!! 输出校验失败 {check.path}: " + "; ".join(check.problems) + "\n"
+    head = (f"{os.path.basename(check.path)}: {check.frames} 帧，时长 {check.duration:.1f}s，"
+            f"{len(check.chapters)} 个章节")
+    if check.ok:
+        return f">>> 输出校验通过 {head}\n"
+    return f"!!! 输出校验失败 {head}\n" + "".join(f"    - {problem}\n" for problem in check.problems)
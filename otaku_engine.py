@@ -0,0 +1,526 @@
+import contextlib
+import csv
+import io
+import math
+import os
+import shutil
+import threading
+import ffmpeg_scheduler
+import loudness
+import mp3_frames
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from render_cache import content_hash
+
+# ffmpeg-python 在用到的函数中才导入：图形界面只需要这里的常量，启动时不加载它（见 scripts/check_startup.py）
+
+# 渲染参数（与原有淡入淡出/拼接流程保持一致）
+FADE_IN_DURATION = 2     # 开头淡入时长（秒）
+FADE_OUT_DURATION = 3    # 结尾淡出时长（秒）
+AUDIO_BITRATE = '320k'   # 输出码率
+SAMPLE_RATE = 44100      # 输出采样率
+CHANNELS = 2             # 输出声道数
+MIX_PATH = "songs/mix.mp3"  # miku 倒数音频
+# 读取歌单 CSV 时依次尝试的编码：仓库自带的 songs.csv 为 GBK，Excel 保存的带 BOM
+CSV_ENCODINGS = ('utf-8', 'utf-8-sig', 'gbk', 'gb2312')
+
+# smart 渲染参数
+LAME_DELAY = 1105           # libmp3lame 编码延迟 576 + 解码延迟 529（采样数），裸帧输出时解码器不会跳过
+SMART_WARMUP_FRAMES = 2     # 开头与结尾重新编码时丢弃的预热帧数，需覆盖 LAME_DELAY
+SMART_MIN_BODY_FRAMES = 40  # 中间可直接复制的帧数太少时不值得走 smart 渲染（约 1 秒）
+GLOBAL_GAIN_STEP_DB = 1.5   # MP3 帧 global_gain 每步对应的增益，smart 渲染的响度增益按此取整
+# 输出不带 Xing/ID3 的裸 MP3 帧，便于与其他片段按帧直接拼接（流复制）
+STREAM_OUTPUT_ARGS = dict(
+    f="mp3", acodec="libmp3lame", audio_bitrate=AUDIO_BITRATE, ar=SAMPLE_RATE, ac=CHANNELS,
+    write_xing=0, id3v2_version=0,
+)
+# 淡入淡出边缘的编码参数：在上面的基础上关闭比特池
+EDGE_OUTPUT_ARGS = dict(STREAM_OUTPUT_ARGS, reservoir=0)
+
+# 整场输出格式：名称 -> (扩展名, 编码参数)
+# mp3 给现场 PA，opus 作为直播备份，wav 给 DJ
+OUTPUT_PROFILES = {
+    "mp3": (".mp3", dict(acodec="libmp3lame", audio_bitrate=AUDIO_BITRATE, ac=CHANNELS)),
+    "opus": (".opus", dict(acodec="libopus", audio_bitrate="160k", ar=48000, ac=CHANNELS)),
+    "wav": (".wav", dict(acodec="pcm_s16le", ar=SAMPLE_RATE, ac=CHANNELS)),
+}
+DEFAULT_PROFILES = ("mp3",)
+
+_countdown_lock = threading.Lock()
+
+
+def render_params(render_mode, mix_path=MIX_PATH):
+    """影响片段渲染结果的全部参数，作为片段缓存键的一部分"""
+    return {
+        "mode": render_mode,
+        "fade_in": FADE_IN_DURATION,
+        "fade_out": FADE_OUT_DURATION,
+        "bitrate": AUDIO_BITRATE,
+        "sample_rate": SAMPLE_RATE,
+        "channels": CHANNELS,
+        "mix": content_hash(mix_path) if mix_path and os.path.exists(mix_path) else None,
+        "loudness": loudness.loudness_params(),
+    }
+
+
+def build_segment_stream(input_path, start_time, end_time, gain_db=0):
+    """构建单首歌曲的滤镜链：裁剪 -> 响度增益 -> 淡入 -> 淡出 -> 统一格式"""
+    import ffmpeg
+    duration = end_time - start_time
+    if duration <= 0:
+        raise ValueError("结束时间必须大于开始时间")
+
+    return (
+        with_gain(ffmpeg.input(input_path, ss=start_time, t=duration).audio, gain_db)
+        .filter("afade", t="in", st=0, d=FADE_IN_DURATION)
+        .filter("afade", t="out", st=max(0, duration - FADE_OUT_DURATION), d=FADE_OUT_DURATION)
+        .filter("aformat", sample_rates=SAMPLE_RATE, channel_layouts="stereo")
+    )
+
+
+def with_gain(stream, gain_db):
+    """施加固定增益（dB），增益为 0 时不加滤镜"""
+    if not gain_db:
+        return stream
+    return stream.filter("volume", f"{gain_db}dB")
+
+
+def countdown_key(cache, mix_path=MIX_PATH):
+    """倒数音频在片段缓存中的键"""
+    return cache.segment_key(mix_path, 0, 0, {"countdown": STREAM_OUTPUT_ARGS})
+
+
+def countdown_clip(cache, mix_path=MIX_PATH):
+    """返回按输出格式预先编码好的倒数音频，找不到 mix_path 时返回 None
+
+    编码结果存放在片段缓存中，以 mix.mp3 的指纹和输出参数为键，整场只编码一次；
+    之后每首歌都通过 join_mp3 以流复制的方式拼接在开头。
+    """
+    import ffmpeg
+    if not (mix_path and os.path.exists(mix_path)):
+        return None
+    key = countdown_key(cache, mix_path)
+    with _countdown_lock:
+        path = cache.get(key)
+        if path:
+            return path
+        rendered = cache.temp_path(key)
+        try:
+            ffmpeg_scheduler.run(ffmpeg.input(mix_path).audio.output(rendered, **STREAM_OUTPUT_ARGS))
+            return cache.put(key, rendered)
+        finally:
+            if os.path.exists(rendered):
+                os.remove(rendered)
+
+
+def join_mp3(output_file, parts):
+    """按帧拼接多段 MP3 数据（流复制，不解码），parts 为文件路径或字节串，自动去掉 ID3/Xing 信息帧"""
+    with open(output_file, "wb") as out:
+        for part in parts:
+            if isinstance(part, str):
+                with open(part, "rb") as f:
+                    part = f.read()
+            out.write(mp3_frames.strip_tags(part))
+
+
+def render_segment_single_pass(input_path, output_file, start_time, end_time, countdown_file=None, gain_db=0):
+    """单次渲染：裁剪、淡入、淡出合并为一个滤镜图，只编码一次
+
+    等价于 render_segment_legacy 的四个步骤，
+    但只启动一个 ffmpeg 进程，不写 cache 临时文件，也没有重复编码带来的音质损失。
+    countdown_file 为 countdown_clip() 预先编码好的倒数音频，以流复制方式拼接在开头；
+    为 None 时只输出淡入淡出后的歌曲片段。gain_db 为响度统一的增益。
+    """
+    song = build_segment_stream(input_path, start_time, end_time, gain_db)
+
+    if countdown_file is None:
+        ffmpeg_scheduler.run(song.output(output_file, audio_bitrate=AUDIO_BITRATE, ac=CHANNELS))
+        return
+
+    encoded = ffmpeg_scheduler.run(song.output("pipe:", **STREAM_OUTPUT_ARGS), capture_stdout=True)
+    join_mp3(output_file, [countdown_file, encoded])
+
+
+def render_segment_legacy(input_path, output_file, start_time, end_time, mix_path=MIX_PATH, gain_db=0, stage=None):
+    """原有的四步流程：剪切 -> 淡入（同时施加响度增益）-> 淡出 -> 拼接倒数音频，每一步单独编码
+
+    中间文件跟随 output_file 的唯一临时名，多个任务同时渲染同一首歌也不会互相覆盖，结束后删除。
+    stage(步骤名) 返回计量该步骤的上下文管理器（见 run_report.stage），为 None 时不计量。
+    """
+    import ffmpeg
+    duration = end_time - start_time
+    if duration <= 0:
+        raise ValueError("结束时间必须大于开始时间")
+    stage = stage or (lambda name: contextlib.nullcontext())
+
+    temp_base = os.path.splitext(output_file)[0]
+    ext = os.path.splitext(input_path)[1]
+    temp_cut = f"{temp_base}_cut{ext}"
+    temp_fade_in = f"{temp_base}_in{ext}"
+    # 处理完淡入淡出、还没有加倒数音频的歌曲片段
+    temp_song_ready = f"{temp_base}_ready{ext}"
+    try:
+        with stage("cut"):
+            ffmpeg_scheduler.run(ffmpeg.input(input_path, ss=start_time, t=duration).output(temp_cut, acodec="copy"))
+        with stage("fade_in"):
+            ffmpeg_scheduler.run(
+                with_gain(ffmpeg.input(temp_cut).audio, gain_db)
+                .filter("afade", t="in", st=0, d=FADE_IN_DURATION)
+                .output(temp_fade_in, audio_bitrate=AUDIO_BITRATE)
+            )
+        with stage("fade_out"):
+            ffmpeg_scheduler.run(
+                ffmpeg.input(temp_fade_in)
+                .filter("afade", t="out", st=max(0, duration - FADE_OUT_DURATION), d=FADE_OUT_DURATION)
+                .output(temp_song_ready, audio_bitrate=AUDIO_BITRATE)
+            )
+        if mix_path and os.path.exists(mix_path):
+            # 倒数音频在前，歌曲在后
+            with stage("mix"):
+                ffmpeg_scheduler.run(
+                    ffmpeg.concat(ffmpeg.input(mix_path), ffmpeg.input(temp_song_ready), v=0, a=1)
+                    .output(output_file, ac=CHANNELS)
+                )
+        else:
+            shutil.copy(temp_song_ready, output_file)
+    finally:
+        for temp_file in (temp_cut, temp_fade_in, temp_song_ready):
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+
+
+def segment_key(cache, input_path, start_time, end_time, render_mode="single_pass", mix_path=MIX_PATH):
+    """成品片段（倒数 + 淡入淡出后的歌曲）在片段缓存中的键"""
+    return cache.segment_key(input_path, start_time, end_time, render_params(render_mode, mix_path))
+
+
+def decode_setlist(data):
+    """按 CSV_ENCODINGS 依次尝试解码歌单 CSV 的字节，全部失败时抛出 ValueError"""
+    for encoding in CSV_ENCODINGS:
+        try:
+            # 按 utf-8 解码带 BOM 的文件时去掉开头的 BOM
+            return data.decode(encoding).lstrip('\ufeff')
+        except UnicodeDecodeError:
+            continue
+    raise ValueError(f"无法识别歌单的编码（已尝试 {', '.join(CSV_ENCODINGS)}）")
+
+
+def setlist_rows(text):
+    """解析歌单 CSV 文本，返回去掉表头与空行后的所有行"""
+    reader = csv.reader(io.StringIO(text, newline=''))
+    next(reader, None)
+    return [row for row in reader if row]
+
+
+def read_setlist_rows(csv_file):
+    """读取歌单 CSV 的所有行（不含表头），编码见 decode_setlist"""
+    with open(csv_file, 'rb') as f:
+        data = f.read()
+    try:
+        return setlist_rows(decode_setlist(data))
+    except ValueError as e:
+        raise ValueError(f"{csv_file}: {e}") from None
+
+
+def read_setlist(csv_file):
+    """读取歌单 CSV（第一行为表头），返回 [(文件名, 开始秒, 结束秒)]，时间无法解析的行会被跳过"""
+    entries = []
+    for row in read_setlist_rows(csv_file):
+        try:
+            entries.append((row[0], float(row[1]), float(row[2])))
+        except (IndexError, ValueError):
+            continue
+    return entries
+
+
+def write_setlist(csv_file, rows):
+    """写出歌单 CSV（带表头），rows 为 [(文件名, 开始秒, 结束秒[, 备注])]"""
+    with open(csv_file, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['文件名', '开始时间', '结束时间', '备注'])
+        writer.writerows(rows)
+
+
+def write_concat_list(file_list, list_file):
+    """写出 ffmpeg concat 列表（绝对路径）"""
+    with open(list_file, 'w', encoding='UTF-8') as f:
+        for item in file_list:
+            f.write(f"file '{os.path.abspath(item).replace(os.sep, '/')}'\n")
+
+
+def read_concat_list(list_file):
+    """读取 ffmpeg concat 列表，返回其中的文件路径"""
+    paths = []
+    with open(list_file, encoding='UTF-8') as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("file "):
+                paths.append(line[5:].strip().strip("'"))
+    return paths
+
+
+def plan_smart_render(input_path, start_time, end_time):
+    """计算 smart 渲染的切分方案，源文件不适合时返回 None
+
+    片段被分成三部分：开头（含淡入）重新编码、中间按原始 MP3 帧直接复制、结尾（含淡出）重新编码。
+    所有位置都以采样为单位、对齐到 1152 采样的帧边界，保证拼接后时间轴与源文件完全一致。
+    输出是不带 LAME 标签的裸帧，解码时不会跳过编码延迟，因此开头和结尾都多编码几帧预热再丢弃，
+    使第一帧恰好对应片段开头；开头与结尾按整帧取舍，与 single_pass 的偏差不超过半帧。
+    """
+    if not input_path.lower().endswith(".mp3"):
+        return None
+    scan = mp3_frames.scan_file(input_path, with_main_data=True)
+    frames = scan.frames
+    if not frames or scan.gaps:
+        return None
+    if any(f.version != mp3_frames.MPEG1 or f.sample_rate != SAMPLE_RATE or f.channels != CHANNELS for f in frames):
+        return None
+
+    spf = 1152
+    skip = scan.decoder_skip
+    start_s = round(start_time * SAMPLE_RATE)
+    end_s = round(end_time * SAMPLE_RATE)
+
+    # 中间直接复制的帧范围 [k1, k2)，需要完整落在淡入结束之后、淡出开始之前
+    k1 = math.ceil((start_s + FADE_IN_DURATION * SAMPLE_RATE + skip) / spf)
+    k2 = math.floor((end_s - FADE_OUT_DURATION * SAMPLE_RATE + skip) / spf)
+    k2 = min(k2, len(frames))
+    if k2 - k1 < SMART_MIN_BODY_FRAMES:
+        return None
+    body_start = k1 * spf - skip
+    body_end = k2 * spf - skip
+
+    # 开头保留 head_frames 帧，结束于 body_start；编码输入再往前多取预热帧，抵消编码与解码延迟
+    head_frames = round((body_start - start_s) / spf)
+    head_start = body_start - (head_frames + SMART_WARMUP_FRAMES) * spf + LAME_DELAY
+    # 结尾保留 tail_frames 帧，从 body_end 开始；同样先编码预热帧。结束时间超出源文件时只到源文件结尾
+    tail_frames = round((min(end_s, len(frames) * spf - skip) - body_end) / spf)
+    tail_start = body_end - SMART_WARMUP_FRAMES * spf + LAME_DELAY
+    if head_start < 0:
+        return None
+
+    return {
+        "scan": scan,
+        "k1": k1,
+        "k2": k2,
+        "start_s": start_s,
+        "end_s": end_s,
+        "body_start": body_start,
+        "head_frames": head_frames,
+        "head_start": head_start,
+        "tail_start": tail_start,
+        "tail_frames": tail_frames,
+    }
+
+
+def render_segment_smart(input_path, output_file, start_time, end_time, countdown_file=None, gain_db=0):
+    """smart 渲染：只重新编码淡入淡出的边缘，中间的 MP3 帧原样复制
+
+    中间部分与源文件逐字节一致；开头重新编码的帧会重新排布主数据，把中间第一帧从比特池借用的字节
+    放在末尾，因此拼接处可以正确解码。countdown_file 同 render_segment_single_pass。
+    gain_db 按 1.5 dB 取整（正增益向下取整）：中间的帧只改写 global_gain（无损），边缘编码时施加同样的增益。
+    源文件不是 44.1kHz 立体声 MPEG1 MP3 或片段太短时，退回 render_segment_single_pass。
+    返回 True 表示走了 smart 路径。
+    """
+    import ffmpeg
+    plan = plan_smart_render(input_path, start_time, end_time)
+    # 提升音量时向下取整，实际增益不超过测量给出的增益，真峰值仍在限制以内
+    steps = gain_db / GLOBAL_GAIN_STEP_DB
+    gain_steps = math.floor(steps) if steps > 0 else round(steps)
+    body_frames = plan["scan"].frames[plan["k1"]:plan["k2"]] if plan is not None else []
+    if plan is None or (gain_steps and any(frame.has_crc for frame in body_frames)):
+        # 带 CRC 的帧改写 global_gain 后校验失败，同样整段重新编码
+        render_segment_single_pass(input_path, output_file, start_time, end_time, countdown_file, gain_db)
+        return False
+    edge_gain = gain_steps * GLOBAL_GAIN_STEP_DB
+
+    spf = 1152
+    scan = plan["scan"]
+    head_file = f"{output_file}.head.mp3"
+    tail_file = f"{output_file}.tail.mp3"
+
+    try:
+        # 一次 ffmpeg 调用同时编码开头与结尾；用 atrim 按采样精确裁剪
+        source = with_gain(ffmpeg.input(input_path).audio, edge_gain).filter_multi_output("asplit", 2)
+        head = (
+            source[0]
+            .filter("atrim", start_sample=plan["head_start"], end_sample=plan["body_start"] + 2 * spf)
+            .filter("asetpts", "PTS-STARTPTS")
+            .filter("afade", t="in", start_sample=plan["start_s"] - plan["head_start"],
+                    nb_samples=FADE_IN_DURATION * SAMPLE_RATE)
+        )
+        tail = (
+            source[1]
+            .filter("atrim", start_sample=plan["tail_start"], end_sample=plan["end_s"] + spf)
+            .filter("asetpts", "PTS-STARTPTS")
+            .filter("afade", t="out", start_sample=plan["end_s"] - FADE_OUT_DURATION * SAMPLE_RATE - plan["tail_start"],
+                    nb_samples=FADE_OUT_DURATION * SAMPLE_RATE)
+        )
+        ffmpeg_scheduler.run(ffmpeg.merge_outputs(
+            head.output(head_file, **EDGE_OUTPUT_ARGS),
+            tail.output(tail_file, **EDGE_OUTPUT_ARGS),
+        ))
+
+        with open(input_path, "rb") as f:
+            source_buf = f.read()
+        with open(head_file, "rb") as f:
+            head_buf = f.read()
+        with open(tail_file, "rb") as f:
+            tail_buf = f.read()
+
+        # 丢掉预热帧，只保留与片段对齐的帧
+        warmup = SMART_WARMUP_FRAMES
+        head_frames = mp3_frames.scan_buffer(head_buf).frames[warmup:warmup + plan["head_frames"]]
+        tail_frames = mp3_frames.scan_buffer(tail_buf).frames[warmup:warmup + plan["tail_frames"]]
+        reservoir = mp3_frames.reservoir_bytes(source_buf, scan.frames, plan["k1"])
+        head_bytes = None
+        if len(head_frames) == plan["head_frames"] and reservoir is not None:
+            head_bytes = mp3_frames.pack_frames(head_buf, head_frames, reservoir)
+        if head_bytes is None or len(tail_frames) != plan["tail_frames"]:
+            # 开头的空闲空间放不下比特池数据，退回整段重新编码
+            render_segment_single_pass(input_path, output_file, start_time, end_time, countdown_file, gain_db)
+            return False
+
+        if gain_steps:
+            body = mp3_frames.adjust_global_gain(source_buf, body_frames, gain_steps)
+        else:
+            body = mp3_frames.read_frames_from(source_buf, body_frames)
+        tail_bytes = mp3_frames.read_frames_from(tail_buf, tail_frames)
+        parts = [head_bytes, body, tail_bytes]
+        if countdown_file:
+            parts.insert(0, countdown_file)
+        join_mp3(output_file, parts)
+        return True
+    finally:
+        for temp_file in (head_file, tail_file):
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+
+
+def run_with_progress(stream_spec, on_progress=None):
+    """运行 ffmpeg 并通过 -progress 实时回调已输出的秒数，失败时抛出 ffmpeg.Error"""
+    import ffmpeg
+    process = (
+        stream_spec
+        .global_args("-progress", "pipe:1", "-nostats", "-loglevel", "error", *ffmpeg_scheduler.meter_args())
+        .run_async(pipe_stdout=True, pipe_stderr=True, overwrite_output=True)
+    )
+    # stderr 单独读取，避免管道写满导致 ffmpeg 阻塞
+    stderr_chunks = []
+    reader = threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True)
+    reader.start()
+    with ffmpeg_scheduler.track(process):
+        for line in process.stdout:
+            key, _, value = line.decode(errors="ignore").strip().partition("=")
+            if key == "out_time_us" and value.isdigit() and on_progress:
+                on_progress(int(value) / 1000000)
+        process.wait()
+    reader.join()
+    stderr = ffmpeg_scheduler.record_stderr(b"".join(stderr_chunks), "error")
+    if ffmpeg_scheduler.cancelled():
+        raise ffmpeg_scheduler.JobCancelled()
+    if process.returncode != 0:
+        raise ffmpeg.Error("ffmpeg", None, stderr)
+
+
+def output_paths(output_file, profiles=DEFAULT_PROFILES):
+    """各输出格式的文件路径：沿用 output_file 的文件名，只替换扩展名"""
+    base = os.path.splitext(output_file)[0]
+    return [base + OUTPUT_PROFILES[name][0] for name in profiles]
+
+
+def fan_out(stream, output_file, profiles=DEFAULT_PROFILES, copy_profile=None):
+    """把同一路已解码的音频同时送给多个编码器，返回合并后的 ffmpeg 输出节点
+
+    解码与滤镜只执行一次，每多一种格式只增加它自己的编码开销。
+    copy_profile 为 (格式名, 输入节点)：该格式直接流复制这个输入（其编码参数需与该格式一致），不再重新编码。
+    """
+    import ffmpeg
+    paths = dict(zip(profiles, output_paths(output_file, profiles)))
+    outputs = []
+    encoded = list(profiles)
+    if copy_profile is not None and copy_profile[0] in paths:
+        name, source = copy_profile
+        outputs.append(source.audio.output(paths[name], c="copy"))
+        encoded.remove(name)
+
+    if len(encoded) == 1:
+        branches = [stream]
+    elif encoded:
+        branches = stream.filter_multi_output("asplit", len(encoded))
+        branches = [branches[i] for i in range(len(encoded))]
+    else:
+        branches = []
+    for name, branch in zip(encoded, branches):
+        outputs.append(branch.output(paths[name], **OUTPUT_PROFILES[name][1]))
+    return ffmpeg.merge_outputs(*outputs)
+
+
+def concat_list_outputs(list_file, output_file, profiles=DEFAULT_PROFILES):
+    """按 ffmpeg concat 列表拼接片段并输出所有格式
+
+    片段本身就是 320k MP3，mp3 格式直接流复制；其余格式共用一次解码。
+    """
+    import ffmpeg
+    source = ffmpeg.input(list_file, f="concat", safe=0)
+    return fan_out(source.audio, output_file, profiles, copy_profile=("mp3", source))
+
+
+def render_show_streaming(entries, output_file, mix_path=MIX_PATH, on_progress=None, profiles=DEFAULT_PROFILES,
+                          gains=None):
+    """整场流式渲染：按给定顺序把所有歌曲片段与倒数音频送入同一个滤镜图，直接编码出最终文件
+
+    entries 为已经打乱顺序的 [(源文件路径, 开始时间, 结束时间)]，gains 为各首的响度增益（dB）。
+    不生成任何单曲中间文件，每个源文件只读取一次需要的区间，整场只解码一次，
+    再同时编码为 profiles 中的每种格式（文件名见 output_paths）。
+    on_progress(seconds) 按已输出的时长回调。
+    """
+    import ffmpeg
+    if not entries:
+        raise ValueError("没有可渲染的歌曲")
+
+    countdowns = None
+    if mix_path and os.path.exists(mix_path):
+        # 倒数音频只解码一次，asplit 的各路输出共享同一份帧数据
+        countdowns = (
+            ffmpeg
+            .input(mix_path)
+            .audio
+            .filter("aformat", sample_rates=SAMPLE_RATE, channel_layouts="stereo")
+            .filter_multi_output("asplit", len(entries))
+        )
+
+    streams = []
+    for i, (input_path, start_time, end_time) in enumerate(entries):
+        if countdowns is not None:
+            streams.append(countdowns[i])
+        streams.append(build_segment_stream(input_path, start_time, end_time, gains[i] if gains else 0))
+
+    stream = fan_out(ffmpeg.concat(*streams, v=0, a=1), output_file, profiles)
+    run_with_progress(stream, on_progress)
+
+
+def default_workers():
+    """默认并发数：CPU 核心数"""
+    return os.cpu_count() or 1
+
+
+def run_parallel(jobs, worker, max_workers=None, on_done=None):
+    """用线程池并行执行渲染任务
+
+    每个任务最终都是独立的 ffmpeg 子进程，线程只负责等待，因此线程池即可跑满多核。
+    jobs 为参数元组列表，worker(*job) 执行单个任务；
+    on_done(job, error) 按任务完成的先后顺序回调（在调用线程中执行），成功时 error 为 None。
+    返回失败的任务列表。
+    """
+    max_workers = max(1, max_workers or default_workers())
+    failed = []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(worker, *job): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            error = future.exception()
+            if error is not None:
+                failed.append(job)
+            if on_done:
+                on_done(job, error)
+    return failed
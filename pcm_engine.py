@@ -0,0 +1,195 @@
+import os
+import threading
+import numpy as np
+import ffmpeg
+import ffmpeg_scheduler
+import loudness
+
+from otaku_engine import (
+    CHANNELS, DEFAULT_PROFILES, FADE_IN_DURATION, FADE_OUT_DURATION, MIX_PATH, SAMPLE_RATE, fan_out, with_gain,
+)
+
+# PyAV 为可选依赖：安装后在进程内解码，不再为每首歌启动 ffmpeg
+try:
+    import av
+except ImportError:
+    av = None
+
+PCM_EXT = ".f32"  # 缓存中的 PCM 文件：float32 小端、交错立体声、44.1kHz
+PCM_PARAMS = {"pcm": "f32le", "sample_rate": SAMPLE_RATE, "channels": CHANNELS}
+
+
+def pcm_key(cache, input_path, start_time=0, end_time=0, normalized=False):
+    """PCM 片段在缓存中的键；start/end 均为 0 表示整个文件，normalized 表示解码时已施加响度增益"""
+    params = PCM_PARAMS
+    if normalized and loudness.loudness_params() is not None:
+        params = {**PCM_PARAMS, "loudness": loudness.loudness_params()}
+    return cache.segment_key(input_path, start_time, end_time, params)
+
+
+def _decode_with_av(input_path, output_file, start_time, end_time, gain_db=0):
+    """用 PyAV 在进程内解码 [start_time, end_time) 并重采样为 float32 立体声，乘上 gain_db 的增益
+
+    从头解码并按采样计数裁剪（MP3 解码远快于实时），保证与 ffmpeg -ss 的结果逐采样对齐。
+    """
+    scale = np.float32(10 ** (gain_db / 20)) if gain_db else None
+    start_sample = round(start_time * SAMPLE_RATE)
+    end_sample = round(end_time * SAMPLE_RATE) if end_time else None
+    resampler = av.AudioResampler(format="flt", layout="stereo", rate=SAMPLE_RATE)
+    position = 0  # 已经解码（包括丢弃）的采样数，按输出采样率计
+
+    with av.open(input_path) as container, open(output_file, "wb") as out:
+        def write(frames):
+            nonlocal position
+            for resampled in frames:
+                data = resampled.to_ndarray().reshape(-1, CHANNELS)
+                lo = max(0, start_sample - position)
+                hi = len(data) if end_sample is None else min(len(data), end_sample - position)
+                position += len(data)
+                if lo < hi:
+                    data = data[lo:hi]
+                    if scale is not None:
+                        data = data * scale
+                    out.write(data.tobytes())
+
+        for frame in container.decode(container.streams.audio[0]):
+            write(resampler.resample(frame))
+            if end_sample is not None and position >= end_sample:
+                return
+        write(resampler.resample(None))
+
+
+def decode_to_pcm(input_path, output_file, start_time=0, end_time=0, gain_db=0):
+    """把源文件的 [start_time, end_time) 解码为 float32 PCM 文件，end_time 为 0 表示到结尾
+
+    安装了 PyAV 时在进程内解码，否则通过 ffmpeg 管道解码（gain_db 用 volume 滤镜施加）。
+    """
+    if av is not None:
+        _decode_with_av(input_path, output_file, start_time, end_time, gain_db)
+        return
+
+    input_args = {"ss": start_time} if start_time else {}
+    if end_time:
+        input_args["t"] = end_time - start_time
+    ffmpeg_scheduler.run(
+        with_gain(ffmpeg.input(input_path, **input_args).audio, gain_db)
+        .output(output_file, f="f32le", ac=CHANNELS, ar=SAMPLE_RATE)
+    )
+
+
+def ensure_pcm(cache, input_path, start_time=0, end_time=0, decode_path=None, gain=None):
+    """返回缓存中的 PCM 文件路径，未命中时解码一次
+
+    缓存键始终按 input_path 计算；decode_path 可指定实际解码的文件（例如规范化中间文件）。
+    gain 为返回响度增益（dB）的函数（见 loudness.segment_gain），只在需要解码时调用，增益在解码时施加，
+    缓存中保存的就是响度统一后的样本；给出 gain 时缓存键带上响度参数。
+    """
+    key = pcm_key(cache, input_path, start_time, end_time, normalized=gain is not None)
+    path = cache.get(key, PCM_EXT)
+    if path:
+        return path
+    rendered = cache.temp_path(key, PCM_EXT)
+    try:
+        decode_to_pcm(decode_path or input_path, rendered, start_time, end_time, gain() if gain else 0)
+        return cache.put(key, rendered, PCM_EXT)
+    finally:
+        if os.path.exists(rendered):
+            os.remove(rendered)
+
+
+def load_pcm(path):
+    """以只读内存映射方式打开 PCM 文件，返回形状为 (采样数, 声道数) 的数组视图"""
+    if os.path.getsize(path) == 0:
+        return np.zeros((0, CHANNELS), dtype=np.float32)
+    return np.memmap(path, dtype=np.float32, mode="r").reshape(-1, CHANNELS)
+
+
+def faded_chunks(pcm, fade_in=FADE_IN_DURATION, fade_out=FADE_OUT_DURATION):
+    """按播放顺序返回加了淡入淡出的数据块
+
+    只有开头与结尾的几秒会乘以线性包络（与 ffmpeg afade 默认曲线一致）生成新数组，
+    中间部分直接返回内存映射的视图，不复制数据。
+    """
+    total = len(pcm)
+    n_in = min(round(fade_in * SAMPLE_RATE), total)
+    n_out = min(round(fade_out * SAMPLE_RATE), total)
+
+    if n_in + n_out > total:
+        # 片段比淡入淡出还短：整段同时乘两个包络
+        gain = np.minimum(
+            np.minimum(np.arange(total, dtype=np.float32) / max(n_in, 1), 1.0),
+            np.minimum(np.arange(total, 0, -1, dtype=np.float32) / max(n_out, 1), 1.0),
+        )
+        return [pcm * gain[:, None]]
+
+    ramp_in = np.arange(n_in, dtype=np.float32) / max(n_in, 1)
+    ramp_out = np.arange(n_out, 0, -1, dtype=np.float32) / max(n_out, 1)
+    return [
+        pcm[:n_in] * ramp_in[:, None],
+        pcm[n_in:total - n_out],
+        pcm[total - n_out:] * ramp_out[:, None],
+    ]
+
+
+def encode_pcm_stream(chunks, output_file, on_progress=None, profiles=DEFAULT_PROFILES):
+    """把一系列 float32 PCM 数据块通过一个 ffmpeg 进程同时编码为 profiles 中的每种格式
+
+    on_progress(seconds) 按已写入的时长回调。
+    """
+    process = (
+        fan_out(ffmpeg.input("pipe:", f="f32le", ac=CHANNELS, ar=SAMPLE_RATE).audio, output_file, profiles)
+        .global_args("-loglevel", "error", *ffmpeg_scheduler.meter_args())
+        .run_async(pipe_stdin=True, pipe_stderr=True, overwrite_output=True)
+    )
+    stderr_chunks = []
+    reader = threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True)
+    reader.start()
+
+    written = 0
+    try:
+        with ffmpeg_scheduler.track(process):
+            for chunk in chunks:
+                if not len(chunk):
+                    continue
+                process.stdin.write(np.ascontiguousarray(chunk, dtype=np.float32).data)
+                written += len(chunk)
+                if on_progress:
+                    on_progress(written / SAMPLE_RATE)
+    except BrokenPipeError:
+        pass
+    finally:
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+        process.wait()
+        reader.join()
+    stderr = ffmpeg_scheduler.record_stderr(b"".join(stderr_chunks), "error")
+    if ffmpeg_scheduler.cancelled():
+        raise ffmpeg_scheduler.JobCancelled()
+    if process.returncode != 0:
+        raise ffmpeg.Error("ffmpeg", None, stderr)
+
+
+def render_show(segment_files, output_file, countdown_file=None, on_progress=None, profiles=DEFAULT_PROFILES):
+    """按顺序拼接 PCM 片段（每首前面加倒数）并整场编码一次
+
+    segment_files 为 ensure_pcm 得到的、未加淡入淡出的 PCM 文件（响度增益已在解码时施加），
+    中间部分直接以内存映射的视图交给编码器，不复制；countdown_file 为倒数音频的 PCM 文件。
+    """
+    countdown = load_pcm(countdown_file) if countdown_file else None
+
+    def chunks():
+        for path in segment_files:
+            if countdown is not None:
+                yield countdown
+            yield from faded_chunks(load_pcm(path))
+
+    encode_pcm_stream(chunks(), output_file, on_progress, profiles)
+
+
+def countdown_pcm(cache, mix_path=MIX_PATH):
+    """倒数音频的 PCM 缓存路径，找不到 mix_path 时返回 None"""
+    if not (mix_path and os.path.exists(mix_path)):
+        return None
+    return ensure_pcm(cache, mix_path)
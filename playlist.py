@@ -0,0 +1,90 @@
+import math
+import os
+import shutil
+
+# 播放列表输出：不拼接最终文件，只把打乱后的顺序写成 M3U 与 CUE，
+# 直接引用缓存中的单曲片段和共用的倒数音频，交给支持无缝播放的播放器。
+# 被引用的缓存键通过 SegmentCache.pin 登记，列表文件还在时不会被淘汰
+
+
+def _relative(path, playlist_file):
+    """播放列表中的路径：相对于播放列表所在目录，统一用 / 分隔"""
+    base = os.path.dirname(os.path.abspath(playlist_file))
+    return os.path.relpath(os.path.abspath(path), base).replace(os.sep, "/")
+
+
+def remove_track_dirs(directory=""):
+    """删除早先版本在播放列表旁复制出的 output_*_tracks 片段目录，返回删除的目录数"""
+    removed = 0
+    for name in os.listdir(directory or "."):
+        path = os.path.join(directory, name)
+        if name.startswith("output_") and name.endswith("_tracks") and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+    return removed
+
+
+def cue_time(seconds):
+    """CUE 时间格式 mm:ss:ff（每秒 75 帧）"""
+    frames = round(seconds * 75)
+    minutes, frames = divmod(frames, 60 * 75)
+    secs, frames = divmod(frames, 75)
+    return f"{minutes:02d}:{secs:02d}:{frames:02d}"
+
+
+def write_m3u(tracks, playlist_file, countdown_file=None, countdown_duration=0):
+    """写出扩展 M3U 播放列表
+
+    tracks 为按播放顺序排列的 [(片段文件, 时长秒, 标题)]；countdown_file 不为空时在每首之前插入倒数音频。
+    """
+    with open(playlist_file, "w", encoding="utf-8") as f:
+        f.write("#EXTM3U\n")
+        for path, duration, title in tracks:
+            if countdown_file:
+                f.write(f"#EXTINF:{round(countdown_duration)},倒数\n")
+                f.write(f"{_relative(countdown_file, playlist_file)}\n")
+            f.write(f"#EXTINF:{round(duration)},{title}\n")
+            f.write(f"{_relative(path, playlist_file)}\n")
+
+
+def write_cue(tracks, cue_file, title="", countdown_file=None):
+    """写出多文件 CUE 表：每首歌一条音轨，倒数音频作为该音轨的 pregap（INDEX 00）"""
+    with open(cue_file, "w", encoding="utf-8") as f:
+        if title:
+            f.write(f'TITLE "{title}"\n')
+        for number, (path, _, track_title) in enumerate(tracks, start=1):
+            track_title = track_title.replace('"', "'")
+            if countdown_file:
+                f.write(f'FILE "{_relative(countdown_file, cue_file)}" MP3\n')
+                f.write(f"  TRACK {number:02d} AUDIO\n")
+                f.write(f'    TITLE "{track_title}"\n')
+                f.write(f"    INDEX 00 {cue_time(0)}\n")
+                f.write(f'FILE "{_relative(path, cue_file)}" MP3\n')
+            else:
+                f.write(f'FILE "{_relative(path, cue_file)}" MP3\n')
+                f.write(f"  TRACK {number:02d} AUDIO\n")
+                f.write(f'    TITLE "{track_title}"\n')
+            f.write(f"    INDEX 01 {cue_time(0)}\n")
+
+
+def write_hls(tracks, playlist_file, target_duration, ended=False):
+    """写出 HLS EVENT 播放列表（只会在末尾追加新片段），ended 为 True 时标记结束
+
+    先写临时文件再替换，播放器轮询时不会读到写了一半的列表。
+    """
+    lines = [
+        "#EXTM3U",
+        "#EXT-X-VERSION:3",
+        "#EXT-X-PLAYLIST-TYPE:EVENT",
+        f"#EXT-X-TARGETDURATION:{math.ceil(target_duration)}",
+        "#EXT-X-MEDIA-SEQUENCE:0",
+    ]
+    for path, duration, title in tracks:
+        lines.append(f"#EXTINF:{duration:.3f},{title}")
+        lines.append(_relative(path, playlist_file))
+    if ended:
+        lines.append("#EXT-X-ENDLIST")
+    rewritten = f"{playlist_file}.tmp"
+    with open(rewritten, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(rewritten, playlist_file)
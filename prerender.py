@@ -0,0 +1,48 @@
+import threading
+from collections import OrderedDict
+
+
+class PrerenderWorker:
+    """低优先级的后台预渲染
+
+    每个任务带一个键（例如表格中的行），同一个键的新任务会取代尚未开始的旧任务，
+    只有一个工作线程，并且在 pause() 期间不会开始新的任务，避免与正式生成抢占 CPU。
+    预渲染只是提前填充缓存，失败时静默忽略，正式生成时会重新渲染并报告错误。
+    """
+
+    def __init__(self, render):
+        self.render = render
+        self.jobs = OrderedDict()
+        self.paused = 0
+        self.cond = threading.Condition()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, key, *args):
+        with self.cond:
+            self.jobs.pop(key, None)
+            self.jobs[key] = args
+            self.cond.notify()
+
+    def cancel(self, key):
+        with self.cond:
+            self.jobs.pop(key, None)
+
+    def pause(self):
+        with self.cond:
+            self.paused += 1
+
+    def resume(self):
+        with self.cond:
+            self.paused = max(0, self.paused - 1)
+            self.cond.notify()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.jobs or self.paused:
+                    self.cond.wait()
+                _, args = self.jobs.popitem(last=False)
+            try:
+                self.render(*args)
+            except Exception:
+                pass
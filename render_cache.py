@@ -0,0 +1,165 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+DEFAULT_BUDGET_MB = 8192  # cache 目录默认磁盘预算（MB），包含 cache/library 中的规范化 WAV
+TEMP_GRACE_SECONDS = 3600  # 渲染中的临时文件在此时间内不会被淘汰
+LOUDNESS_FILE = "loudness.json"  # cache 根目录下的响度测量记录，体积很小，不参与淘汰
+PINS_FILE = "pins.json"  # 播放列表引用的缓存键：{播放列表路径: [键]}，列表文件还在时这些键不会被淘汰
+
+_pins_lock = threading.Lock()
+
+_hash_memo = {}
+_hash_lock = threading.Lock()
+
+
+def content_hash(path):
+    """计算文件内容的 sha1，按 (路径, 大小, 修改时间) 记忆，文件未变时不重复读取"""
+    st = os.stat(path)
+    memo_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    with _hash_lock:
+        if memo_key in _hash_memo:
+            return _hash_memo[memo_key]
+
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    digest = h.hexdigest()
+
+    with _hash_lock:
+        _hash_memo[memo_key] = digest
+    return digest
+
+
+def file_fingerprint(path, use_content_hash=False):
+    """源文件指纹：默认使用 大小+修改时间（快），也可以使用内容哈希（准）"""
+    if use_content_hash:
+        return content_hash(path)
+    st = os.stat(path)
+    return f"{st.st_size}-{st.st_mtime_ns}"
+
+
+class SegmentCache:
+    """按内容寻址的片段渲染缓存
+
+    同一源文件、同样的起止时间与渲染参数只渲染一次，之后直接复用。
+    命中时刷新文件修改时间，淘汰时按修改时间从旧到新删除（LRU），
+    使整个 cache 目录保持在磁盘预算之内。
+    """
+
+    def __init__(self, cache_dir="cache", budget_mb=DEFAULT_BUDGET_MB, use_content_hash=False):
+        self.cache_dir = cache_dir
+        self.segments_dir = os.path.join(cache_dir, "segments")
+        self.budget_bytes = int(budget_mb * 1024 * 1024)
+        self.use_content_hash = use_content_hash
+        os.makedirs(self.segments_dir, exist_ok=True)
+
+    def segment_key(self, source_path, start_time, end_time, params):
+        """由源文件指纹、起止时间和渲染参数计算缓存键"""
+        payload = {
+            "source": file_fingerprint(source_path, self.use_content_hash),
+            "start": round(float(start_time), 3),
+            "end": round(float(end_time), 3),
+            "params": params,
+        }
+        raw = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def path_for(self, key, ext=".mp3"):
+        return os.path.join(self.segments_dir, f"{key}{ext}")
+
+    def temp_path(self, key, ext=".mp3"):
+        """渲染用的临时路径，渲染成功后通过 put 原子地放入缓存"""
+        return os.path.join(self.segments_dir, f"tmp_{uuid.uuid4().hex}_{key}{ext}")
+
+    def get(self, key, ext=".mp3"):
+        """命中返回缓存文件路径并刷新其 LRU 时间，否则返回 None"""
+        path = self.path_for(key, ext)
+        try:
+            os.utime(path, None)
+        except OSError:
+            return None
+        return path
+
+    def put(self, key, rendered_path, ext=".mp3"):
+        """将渲染好的临时文件移入缓存，返回缓存路径"""
+        path = self.path_for(key, ext)
+        os.replace(rendered_path, path)
+        return path
+
+    def materialize(self, key, output_file, ext=".mp3"):
+        """将缓存条目复制到输出路径（复制而不是硬链接，避免其他流程覆盖输出时改坏缓存）"""
+        path = self.path_for(key, ext)
+        shutil.copyfile(path, output_file)
+        return output_file
+
+    def _read_pins(self):
+        try:
+            with open(os.path.join(self.cache_dir, PINS_FILE), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_pins(self, pins):
+        path = os.path.join(self.cache_dir, PINS_FILE)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(pins, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, path)
+
+    def pin(self, owner, keys):
+        """记录播放列表 owner 引用的缓存键（覆盖之前的记录），owner 文件存在期间这些键不会被淘汰"""
+        with _pins_lock:
+            pins = self._read_pins()
+            pins[os.path.abspath(owner)] = sorted(set(keys))
+            self._write_pins(pins)
+
+    def pinned(self):
+        """仍被播放列表引用的缓存键；播放列表已被删除的记录顺带清除"""
+        with _pins_lock:
+            pins = self._read_pins()
+            live = {owner: keys for owner, keys in pins.items() if os.path.exists(owner)}
+            if len(live) != len(pins):
+                self._write_pins(live)
+        return {key for keys in live.values() for key in keys}
+
+    def evict(self, protect=()):
+        """按 LRU 淘汰 cache 目录中的文件直到总大小不超过预算
+
+        protect 中的缓存键与仍被播放列表引用的键（见 pin）不会被删除。返回删除的文件数。
+        """
+        protected = set(protect) | self.pinned()
+        entries = []
+        total = 0
+        for dirpath, _, filenames in os.walk(self.cache_dir):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                if dirpath == self.cache_dir and (name in (LOUDNESS_FILE, PINS_FILE) or name.endswith(".tmp")):
+                    continue
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                total += st.st_size
+                if name.startswith("tmp_") and time.time() - st.st_mtime < TEMP_GRACE_SECONDS:
+                    continue
+                if os.path.splitext(name)[0] not in protected:
+                    entries.append((st.st_mtime, st.st_size, path))
+
+        removed = 0
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.budget_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
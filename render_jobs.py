@@ -0,0 +1,792 @@
+import argparse
+import contextlib
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+import ffmpeg_scheduler
+import loudness
+import mp3_chapters
+import mp3_frames
+import mp3_verify
+import otaku_engine
+import run_report
+from render_cache import SegmentCache, DEFAULT_BUDGET_MB
+from run_manifest import RunManifest
+from source_library import SourceLibrary
+from workspace import JOBS_DIR, Workspace
+
+# 不依赖图形界面的生成流程（Renderer）：渲染片段（各种渲染模式与整场生成方式）、打乱、拼接或整场编码、
+# 写入章节并校验。图形界面、scripts/、render_service.py 与命令行共用，不导入 tkinter / pygame：
+#
+#   python render_jobs.py render  --csv songs.csv --out-dir output     渲染每首的片段 output/out_<文件名>
+#   python render_jobs.py shuffle --csv songs.csv --list songlist.txt  打乱已渲染的片段，写出拼接列表
+#   python render_jobs.py concat  --list songlist.txt -o output_audio.mp3
+#   python render_jobs.py all     --csv songs.csv                      以上全部（带检查点，可继续）
+#   python render_jobs.py all     --csv songs.csv --engine streaming   整场一次生成（不写检查点）
+
+RENDER_MODES = ("single_pass", "smart", "numpy", "legacy")
+SEGMENT_MODES = ("single_pass", "smart", "legacy")  # 逐首输出 MP3 片段的渲染方式（numpy 只生成 PCM）
+SHOW_ENGINES = ("segments", "streaming", "playlist", "progressive")
+MP3_ONLY_ENGINES = ("playlist", "progressive")  # 直接引用 / 追加 MP3 片段，不支持其他输出格式
+
+# Renderer 各流程的结果
+DONE = "done"              # 全部完成（输出已通过校验）
+INCOMPLETE = "incomplete"  # 已生成输出，但有片段渲染失败，修正后重新运行只会重做这些片段
+UNVERIFIED = "unverified"  # 已生成输出，但校验未通过
+FAILED = "failed"          # 拼接或编码失败，没有可用的输出
+CANCELLED = "cancelled"    # 任务被取消
+
+
+def create_job(workspace, entries, settings, final_output, csv_file=None):
+    """为 [(歌曲文件, 开始, 结束)] 创建检查点，片段副本放在工作目录中"""
+    jobs = [(song_file, workspace.segment_path(song_file), start_time, end_time)
+            for song_file, start_time, end_time in entries]
+    return RunManifest.create(workspace.manifest_path, workspace.job_id, csv_file or workspace.csv_file,
+                              settings, jobs, final_output)
+
+
+def segment_output(out_dir, song_file):
+    """命令行 render 步骤中单首片段的输出路径（与 otaku_dance.py 原来的命名一致）"""
+    return os.path.join(out_dir, f"out_{song_file}")
+
+
+def describe_error(error):
+    """写入日志的错误说明，ffmpeg.Error 取 stderr 的最后几行"""
+    stderr = getattr(error, "stderr", None)
+    if stderr:
+        return "\n".join(stderr.decode(errors="replace").strip().splitlines()[-5:])
+    return str(error) or type(error).__name__
+
+
+def format_mmss(seconds):
+    minutes, secs = divmod(int(seconds), 60)
+    return f"{minutes:02d}:{secs:02d}"
+
+
+def shuffle_order(segments, manifest=None, rng=random):
+    """打乱片段顺序，返回 (顺序, 是否沿用检查点)
+
+    检查点中已有同一批片段的顺序时沿用（继续任务时播放顺序不变），否则打乱并写入检查点。
+    """
+    if manifest is not None and manifest.order is not None and sorted(manifest.order) == sorted(segments):
+        return list(manifest.order), True
+    order = list(segments)
+    rng.shuffle(order)
+    if manifest is not None:
+        manifest.set_order(order)
+    return order, False
+
+
+def concat_segments(order, list_file, final_output, profiles=otaku_engine.DEFAULT_PROFILES):
+    """按顺序流复制拼接片段（其他格式共用一次解码），返回各片段的时长（秒）
+
+    耗时随整场时长增长（2 小时的 opus/wav 输出可能要几分钟），不受单进程超时限制。
+    """
+    otaku_engine.write_concat_list(order, list_file)
+    ffmpeg_scheduler.run(otaku_engine.concat_list_outputs(list_file, final_output, profiles),
+                         timeout=ffmpeg_scheduler.NO_TIMEOUT)
+    # 片段按帧拼接，章节时长直接由各片段的帧数得出
+    return [mp3_chapters.segment_duration(path) for path in order]
+
+
+def write_chapters(final_output, song_files, durations, profiles=otaku_engine.DEFAULT_PROFILES):
+    """为 MP3 输出写入寻址表与每首歌的章节，返回章节数（没有 MP3 输出时为 0）"""
+    if "mp3" not in profiles:
+        return 0
+    mp3_path = otaku_engine.output_paths(final_output, ["mp3"])[0]
+    chapters = mp3_chapters.chapters_from_durations([Path(song_file).stem for song_file in song_files], durations)
+    mp3_chapters.write_seekable(mp3_path, chapters, Path(mp3_path).stem)
+    return len(chapters)
+
+
+class Renderer:
+    """一次生成的渲染流程：片段渲染、缓存、响度、打乱、拼接 / 整场编码、章节与校验
+
+    图形界面、命令行、scripts/ 与渲染服务都通过它生成，各自只提供回调：
+    log(文本) 输出一行日志；on_progress(当前值, 最大值) 汇报进度（片段数或已编码的秒数）；
+    on_ready(已就绪秒数, 计划秒数, 是否结束) 为 progressive 引擎汇报可以播放的长度。
+    report 为 RunReport（None 时不计量），throughput 为 ThroughputStats（None 时不记录处理速度），
+    slots 为多个任务共用的渲染名额（信号量）。
+    """
+
+    def __init__(self, cache, library, songs_dir="songs", render_mode="single_pass",
+                 profiles=otaku_engine.DEFAULT_PROFILES, workers=None, log=print, on_progress=None, on_ready=None,
+                 report=None, throughput=None, slots=None, rng=random):
+        if render_mode not in RENDER_MODES:
+            raise ValueError(f"不支持的渲染模式: {render_mode}")
+        self.cache = cache
+        self.library = library
+        self.songs_dir = songs_dir
+        self.render_mode = render_mode
+        # 播放列表 / 渐进式输出的片段直接交给播放器，只用输出 MP3 的 single_pass / smart
+        self.segment_mode = "smart" if render_mode == "smart" else "single_pass"
+        self.profiles = list(profiles)
+        self.workers = workers or otaku_engine.default_workers()
+        self.log = log
+        self.on_progress = on_progress
+        self.on_ready = on_ready
+        self.report = report
+        self.throughput = throughput
+        self.slots = slots
+        self.rng = rng
+        self._mix_duration = None
+
+    # --- 单个片段 ---
+
+    def input_path(self, song_file):
+        return os.path.join(self.songs_dir, song_file)
+
+    def require(self, song_file):
+        """源文件路径，文件不存在时抛出 FileNotFoundError"""
+        input_path = self.input_path(song_file)
+        if not os.path.exists(input_path):
+            raise FileNotFoundError(f"找不到文件 {input_path}")
+        return input_path
+
+    def segment_key(self, song_file, start_time, end_time, render_mode=None, mix_path=otaku_engine.MIX_PATH):
+        """片段在缓存中的键（numpy 模式为 PCM 片段）"""
+        render_mode = render_mode or self.render_mode
+        input_path = self.input_path(song_file)
+        if render_mode == "numpy":
+            import pcm_engine
+            return pcm_engine.pcm_key(self.cache, input_path, start_time, end_time, normalized=True)
+        return otaku_engine.segment_key(self.cache, input_path, start_time, end_time, render_mode, mix_path)
+
+    def countdown_key(self, render_mode=None):
+        if (render_mode or self.render_mode) == "numpy":
+            import pcm_engine
+            return pcm_engine.pcm_key(self.cache, otaku_engine.MIX_PATH)
+        return otaku_engine.countdown_key(self.cache)
+
+    def mix_duration(self):
+        """倒数音频的时长，找不到 mix.mp3 时为 0"""
+        if self._mix_duration is None:
+            self._mix_duration = (mp3_verify.audio_length(otaku_engine.MIX_PATH)
+                                  if os.path.exists(otaku_engine.MIX_PATH) else 0)
+        return self._mix_duration
+
+    def segment_gain(self, song_file, start_time, end_time):
+        """片段的响度统一增益（dB），每个片段只测量一次，结果保存在缓存目录的 loudness.json"""
+        if loudness.TARGET_LUFS is None:
+            return 0.0
+        input_path = self.input_path(song_file)
+        store = loudness.store_for(self.cache)
+        measured = store.get(store.key(input_path, start_time, end_time)) is not None
+        with run_report.stage(self.report, song_file, "loudness", "hit" if measured else "miss"):
+            return loudness.segment_gain(self.cache, input_path, start_time, end_time,
+                                         self.library.resolve(input_path))
+
+    def ensure_segment(self, song_file, start_time, end_time, render_mode=None, mix_path=otaku_engine.MIX_PATH):
+        """确保成品片段已经在缓存中，返回 (缓存中的路径, 是否命中)；render_mode 不能为 numpy"""
+        render_mode = render_mode or self.render_mode
+        self.require(song_file)
+        key = self.segment_key(song_file, start_time, end_time, render_mode, mix_path)
+        with run_report.stage(self.report, song_file, "render") as entry:
+            path = self.cache.get(key)
+            if path:
+                entry["cache"] = "hit"
+                return path, True
+
+            entry["cache"] = "miss"
+            rendered = self.cache.temp_path(key)
+            try:
+                with self._slot():
+                    started = time.monotonic()
+                    self._render(song_file, rendered, start_time, end_time, render_mode, mix_path)
+                if not os.path.exists(rendered):
+                    raise RuntimeError(f"未生成输出文件 {song_file}")
+                self._record(render_mode, end_time - start_time, started)
+                return self.cache.put(key, rendered), False
+            finally:
+                if os.path.exists(rendered):
+                    os.remove(rendered)
+
+    def _render(self, song_file, output_file, start_time, end_time, render_mode, mix_path):
+        input_path = self.input_path(song_file)
+        gain_db = self.segment_gain(song_file, start_time, end_time)
+        if render_mode == "legacy":
+            otaku_engine.render_segment_legacy(
+                input_path, output_file, start_time, end_time, mix_path, gain_db,
+                stage=lambda name: run_report.stage(self.report, song_file, name),
+            )
+            return
+        # 倒数音频整场只编码一次，之后按帧直接拼接
+        countdown = otaku_engine.countdown_clip(self.cache, mix_path)
+        if render_mode == "smart":
+            if not otaku_engine.render_segment_smart(input_path, output_file, start_time, end_time, countdown,
+                                                     gain_db):
+                self.log(f"提示：{song_file} 不满足 smart 渲染条件，已整段重新编码。")
+        else:
+            # 已转码时从中间文件读取，省去解码与重采样（smart 需要原始 MP3 帧，仍读源文件）
+            otaku_engine.render_segment_single_pass(self.library.resolve(input_path), output_file,
+                                                    start_time, end_time, countdown, gain_db)
+
+    def prepare(self, song_file, output_file, start_time, end_time):
+        """准备一首歌，返回检查点记录的文件
+
+        numpy 模式只把未加效果的片段解码到 PCM 缓存（淡入淡出与拼接在整场编码时完成），
+        其他模式渲染成品片段（或命中缓存）后复制到 output_file。
+        """
+        input_path = self.require(song_file)
+        if self.render_mode == "numpy":
+            import pcm_engine
+            cached = self.cache.get(self.segment_key(song_file, start_time, end_time), pcm_engine.PCM_EXT)
+            started = time.monotonic()
+            with run_report.stage(self.report, song_file, "decode", "hit" if cached else "miss") as entry:
+                with self._slot():
+                    path = pcm_engine.ensure_pcm(self.cache, input_path, start_time, end_time,
+                                                 self.library.resolve(input_path),
+                                                 lambda: self.segment_gain(song_file, start_time, end_time))
+                if not cached and pcm_engine.av is not None:
+                    # 进程内解码（PyAV）不经过 ffmpeg 计量，写入量按生成的 PCM 文件计算
+                    entry["bytes_written"] = os.path.getsize(path)
+            if not cached:
+                self._record("decode", end_time - start_time, started)
+            return path
+
+        path, hit = self.ensure_segment(song_file, start_time, end_time)
+        with run_report.stage(self.report, song_file, "copy") as entry:
+            os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+            self.cache.materialize(Path(path).stem, output_file)
+            entry["bytes_read"] = entry["bytes_written"] = os.path.getsize(output_file)
+        if hit:
+            self.log(f"命中缓存，跳过渲染：{song_file}")
+        return output_file
+
+    def prerender(self, song_file, start_time, end_time, show_engine="segments"):
+        """后台预渲染一行：按渲染设置把片段放进缓存，正式生成时直接命中"""
+        input_path = self.input_path(song_file)
+        if not os.path.exists(input_path):
+            return
+        if show_engine == "streaming":
+            # 流式渲染不使用片段缓存，只提前准备规范化中间文件与响度测量
+            self.library.ensure(input_path)
+            self.segment_gain(song_file, start_time, end_time)
+        elif show_engine in ("playlist", "progressive"):
+            mix_path = None if show_engine == "playlist" else otaku_engine.MIX_PATH
+            self.ensure_segment(song_file, start_time, end_time, self.segment_mode, mix_path)
+        elif self.render_mode == "numpy":
+            import pcm_engine
+            pcm_engine.ensure_pcm(self.cache, input_path, start_time, end_time, self.library.resolve(input_path),
+                                  lambda: self.segment_gain(song_file, start_time, end_time))
+        else:
+            self.ensure_segment(song_file, start_time, end_time)
+
+    # --- 整场 ---
+
+    def render_parallel(self, jobs, worker, on_done=None):
+        """并行执行 worker(*job)，渲染线程继承调用线程的调度会话，返回失败的任务"""
+        return otaku_engine.run_parallel(jobs, ffmpeg_scheduler.propagate(worker), self.workers, on_done)
+
+    def evict(self, entries, render_mode=None, mix_path=otaku_engine.MIX_PATH):
+        """按磁盘预算淘汰旧缓存，entries 的片段、中间文件与倒数音频不会被删除，返回删除的文件数"""
+        render_mode = render_mode or self.render_mode
+        protect = []
+        for song_file, start_time, end_time in entries:
+            input_path = self.input_path(song_file)
+            if os.path.exists(input_path):
+                protect.append(self.segment_key(song_file, start_time, end_time, render_mode, mix_path))
+                protect.append(self.library.key(input_path))
+        if os.path.exists(otaku_engine.MIX_PATH):
+            protect.append(self.countdown_key(render_mode))
+        removed = self.cache.evict(protect)
+        if removed:
+            self.log(f">>> 已清理 {removed} 个旧缓存文件")
+        return removed
+
+    def run_job(self, manifest, workspace):
+        """segments 引擎：按检查点渲染尚未完成或已失效的片段，然后打乱并拼接（numpy 模式整场编码一次）
+
+        全部成功时标记检查点完成并清理工作目录；其他结果保留检查点，之后可以继续。
+        """
+        jobs = manifest.jobs
+        pending = [job for job in jobs
+                   if not (os.path.exists(self.input_path(job[0]))
+                           and manifest.verified(job[1], self.segment_key(job[0], job[2], job[3])))]
+        total = len(jobs)
+        done = total - len(pending)
+        self._progress(done, total)
+        if done:
+            self.log(f">>> 检查点中已有 {done} 首完成并通过校验，跳过")
+
+        def render(song_file, output_file, start_time, end_time):
+            path = self.prepare(song_file, output_file, start_time, end_time)
+            manifest.mark_done(output_file, self.segment_key(song_file, start_time, end_time), path)
+
+        def on_done(job, error):
+            nonlocal done
+            done += 1
+            self._progress(done, total)
+            if error is not None:
+                self.log(f"进度: {done}/{total} - 失败 {job[0]}: {describe_error(error)}")
+            else:
+                self.log(f"进度: {done}/{total} - 完成 {job[0]}")
+
+        self.log(f">>> 并行渲染 {len(pending)} 首歌曲 (并发数: {self.workers})")
+        failed = self.render_parallel(pending, render, on_done)
+        if ffmpeg_scheduler.cancelled():
+            self.log("*** 已取消 ***")
+            return CANCELLED
+        self.evict([(song_file, start_time, end_time) for song_file, _, start_time, end_time in jobs])
+        if failed:
+            self.log(f">>> {len(failed)} 首渲染失败")
+
+        failed_files = {job[0] for job in failed}
+        if self.render_mode == "numpy":
+            status = self._encode_pcm(
+                [(song_file, start_time, end_time) for song_file, _, start_time, end_time in jobs
+                 if song_file not in failed_files and os.path.exists(self.input_path(song_file))],
+                manifest.final_output)
+        else:
+            status = self._concat(manifest, workspace, failed_files)
+        if status != DONE:
+            return status
+        if failed:
+            return INCOMPLETE
+        manifest.finish()
+        workspace.cleanup()
+        return DONE
+
+    def _concat(self, manifest, workspace, failed_files):
+        """打乱已完成的片段（继续任务时沿用检查点中的顺序）并流复制拼接"""
+        jobs = manifest.jobs
+        order, reused = shuffle_order([output_file for song_file, output_file, _, _ in jobs
+                                       if song_file not in failed_files and os.path.exists(output_file)],
+                                      manifest, self.rng)
+        if not order:
+            self.log("没有可拼接的片段")
+            return FAILED
+        self.log(">>> 沿用检查点中的播放顺序..." if reused else ">>> 正在随机化播放列表...")
+
+        final_output = manifest.final_output
+        self.log(">>> 开始最终拼接...")
+        started = time.monotonic()
+        try:
+            with run_report.stage(self.report, None, "concat"):
+                durations = concat_segments(order, workspace.list_file, final_output, self.profiles)
+        except Exception as e:
+            return self._failed("最终拼接失败", e)
+        if self.profiles == ["mp3"]:
+            self._record("concat", sum(durations), started)
+
+        by_output = {output_file: (song_file, start_time, end_time)
+                     for song_file, output_file, start_time, end_time in jobs}
+        entries = [by_output[path] for path in order]
+        self._write_chapters(final_output, [song_file for song_file, _, _ in entries], durations)
+        self._log_outputs(final_output)
+        return DONE if self.verify(final_output, entries) else UNVERIFIED
+
+    def _encode_pcm(self, entries, final_output):
+        """numpy 模式的收尾：打乱 PCM 片段顺序，淡入淡出后整场编码一次"""
+        import pcm_engine
+
+        if not entries:
+            self.log("没有可编码的片段")
+            return FAILED
+        self.log(">>> 正在随机化播放列表...")
+        order = list(entries)
+        self.rng.shuffle(order)
+        segments = [pcm_engine.ensure_pcm(self.cache, self.input_path(song_file), start_time, end_time,
+                                          self.library.resolve(self.input_path(song_file)),
+                                          lambda entry=(song_file, start_time, end_time): self.segment_gain(*entry))
+                    for song_file, start_time, end_time in order]
+        countdown = pcm_engine.countdown_pcm(self.cache, otaku_engine.MIX_PATH)
+
+        bytes_per_second = 4 * otaku_engine.CHANNELS * otaku_engine.SAMPLE_RATE
+        mix_duration = os.path.getsize(countdown) / bytes_per_second if countdown else 0
+        durations = [os.path.getsize(path) / bytes_per_second + mix_duration for path in segments]
+        total_seconds = sum(durations)
+        self._progress(0, total_seconds)
+
+        self.log(">>> 开始整场编码...")
+        started = time.monotonic()
+        try:
+            with run_report.stage(self.report, None, "encode") as entry:
+                entry["bytes_read"] = sum(os.path.getsize(path) for path in segments)
+                pcm_engine.render_show(segments, final_output, countdown,
+                                       lambda seconds: self._progress(seconds, total_seconds), self.profiles)
+        except Exception as e:
+            return self._failed("最终编码失败", e)
+        self._record("encode", total_seconds * len(self.profiles), started)
+        self._write_chapters(final_output, [song_file for song_file, _, _ in order], durations)
+        self._log_outputs(final_output)
+        return DONE if self.verify(final_output, order, frame_aligned=False) else UNVERIFIED
+
+    def render_show(self, show_engine, entries, workspace):
+        """不写检查点的整场生成（streaming / playlist / progressive），输出文件名带任务 ID"""
+        if show_engine in MP3_ONLY_ENGINES and self.profiles != ["mp3"]:
+            ignored = [name for name in self.profiles if name != "mp3"]
+            self.log(f"警告：{show_engine} 方式只输出 mp3，忽略格式 {', '.join(ignored)}")
+        if show_engine == "streaming":
+            return self.render_streaming(entries, workspace.final_output())
+        if show_engine == "playlist":
+            return self.render_playlist(entries, workspace.final_output("output_playlist", ""))
+        if show_engine == "progressive":
+            return self.render_progressive(entries, workspace.final_output(), workspace.final_output(ext=".m3u8"))
+        raise ValueError(f"不支持的生成方式: {show_engine}")
+
+    def render_streaming(self, entries, final_output):
+        """streaming 引擎：打乱顺序后整场一次流式渲染出最终文件，不写单曲中间文件"""
+        order = []
+        for song_file, start_time, end_time in entries:
+            if not os.path.exists(self.input_path(song_file)):
+                self.log(f"错误：找不到文件 {self.input_path(song_file)}")
+                continue
+            order.append((song_file, start_time, end_time))
+        if not order:
+            self.log("没有可渲染的歌曲")
+            return FAILED
+
+        self.log(">>> 正在随机化播放列表...")
+        self.rng.shuffle(order)
+        for i, (song_file, _, _) in enumerate(order):
+            self.log(f"{i + 1}. {song_file}")
+        sources = [(self.library.resolve(self.input_path(song_file)), start_time, end_time)
+                   for song_file, start_time, end_time in order]
+        gains = [self.segment_gain(*entry) for entry in order]
+
+        mix_duration = self.mix_duration()
+        # 结束时间可能超过歌曲实际长度，按源文件时长截断，章节位置才与输出一致
+        durations = [min(end, mp3_verify.audio_length(path) or end) - start + mix_duration
+                     for path, start, end in sources]
+        total_seconds = sum(durations)
+        self._progress(0, total_seconds)
+
+        self.log(f">>> 开始整场流式渲染 ({len(order)} 首)...")
+        started = time.monotonic()
+        try:
+            otaku_engine.render_show_streaming(sources, final_output, otaku_engine.MIX_PATH,
+                                               lambda seconds: self._progress(seconds, total_seconds),
+                                               self.profiles, gains)
+        except Exception as e:
+            return self._failed("流式渲染失败", e)
+        self._record("encode", total_seconds * len(self.profiles), started)
+        self._write_chapters(final_output, [song_file for song_file, _, _ in order], durations)
+        self._progress(total_seconds, total_seconds)
+        self._log_outputs(final_output)
+        return DONE if self.verify(final_output, order, frame_aligned=False) else UNVERIFIED
+
+    def render_playlist(self, entries, base):
+        """playlist 引擎：片段（不含倒数）与倒数音频各自缓存，打乱后只写 base.m3u / base.cue，不做最终拼接
+
+        列表直接引用缓存文件，并登记为这两个列表文件的固定键，列表文件还在时不会被淘汰。
+        """
+        import playlist
+
+        segments = {}
+        done = 0
+
+        def render(song_file, start_time, end_time):
+            path, _ = self.ensure_segment(song_file, start_time, end_time, self.segment_mode, mix_path=None)
+            segments[song_file, start_time, end_time] = path
+
+        def on_done(job, error):
+            nonlocal done
+            done += 1
+            self._progress(done, len(entries))
+            if error is not None:
+                self.log(f"进度: {done}/{len(entries)} - 失败 {job[0]}: {describe_error(error)}")
+
+        failed = self.render_parallel(entries, render, on_done)
+        if ffmpeg_scheduler.cancelled():
+            self.log("*** 已取消 ***")
+            return CANCELLED
+        countdown = otaku_engine.countdown_clip(self.cache, otaku_engine.MIX_PATH)
+
+        tracks = [(segments[entry], entry[2] - entry[1], os.path.splitext(entry[0])[0])
+                  for entry in entries if entry in segments]
+        self.rng.shuffle(tracks)
+
+        playlist.write_m3u(tracks, f"{base}.m3u", countdown, self.mix_duration())
+        playlist.write_cue(tracks, f"{base}.cue", base, countdown)
+        keys = [Path(path).stem for path in segments.values()] + ([Path(countdown).stem] if countdown else [])
+        for owner in (f"{base}.m3u", f"{base}.cue"):
+            self.cache.pin(owner, keys)
+        self.evict(list(segments), self.segment_mode, mix_path=None)
+        if playlist.remove_track_dirs(os.path.dirname(base)):
+            self.log(">>> 已删除旧版本复制的 _tracks 片段目录")
+        self.log(f">>> 播放列表已保存为: {base}.m3u, {base}.cue")
+        return INCOMPLETE if failed else DONE
+
+    def render_progressive(self, entries, final_output, hls_playlist):
+        """progressive 引擎：先确定播放顺序，片段按顺序一完成就追加到 MP3 与 HLS 列表，开头部分可以先播放
+
+        HLS 列表直接引用缓存中的片段，并登记为列表文件的固定键，列表文件还在时不会被淘汰。
+        """
+        import playlist
+
+        self.log(">>> 正在随机化播放列表...")
+        order = [entry for entry in entries if os.path.exists(self.input_path(entry[0]))]
+        self.rng.shuffle(order)
+
+        mix_duration = self.mix_duration()
+        planned = sum(end_time - start_time + mix_duration for _, start_time, end_time in order)
+        target_duration = max((end_time - start_time + mix_duration for _, start_time, end_time in order), default=1)
+        open(final_output, "wb").close()
+
+        results = {}   # 顺序下标 -> 缓存片段路径，失败为 None
+        appended = []  # 已经追加的 [(片段, 时长, 标题)]
+        appended_entries = []
+        next_index = 0
+        ready = 0.0
+        done = 0
+
+        def render(index, song_file, start_time, end_time):
+            path, _ = self.ensure_segment(song_file, start_time, end_time, self.segment_mode)
+            results[index] = path
+
+        def on_done(job, error):
+            nonlocal next_index, ready, done
+            index, song_file = job[0], job[1]
+            done += 1
+            self._progress(done, len(order))
+            if error is not None:
+                results[index] = None
+                self.log(f"进度: {done}/{len(order)} - 失败 {song_file}: {describe_error(error)}")
+
+            # 把从 next_index 开始连续完成的片段按顺序追加
+            grown = False
+            while next_index in results:
+                path = results[next_index]
+                if path is not None:
+                    with open(path, "rb") as f:
+                        data = mp3_frames.strip_tags(f.read())
+                    with open(final_output, "ab") as out:
+                        out.write(data)
+                    duration = mp3_chapters.segment_duration(path)
+                    appended.append((path, duration, os.path.splitext(order[next_index][0])[0]))
+                    appended_entries.append(order[next_index])
+                    ready += duration
+                    grown = True
+                next_index += 1
+            if grown:
+                playlist.write_hls(appended, hls_playlist, target_duration)
+                self.cache.pin(hls_playlist, [Path(path).stem for path, _, _ in appended])
+                if self.on_ready:
+                    self.on_ready(ready, planned, False)
+                self.log(f">>> 可以播放到 {format_mmss(ready)}")
+
+        self.log(f">>> 渐进式渲染 {len(order)} 首 -> {final_output} / {hls_playlist}")
+        failed = self.render_parallel([(i, *entry) for i, entry in enumerate(order)], render, on_done)
+        if ffmpeg_scheduler.cancelled():
+            self.log("*** 已取消 ***")
+            return CANCELLED
+
+        playlist.write_hls(appended, hls_playlist, target_duration, ended=True)
+        self._write_chapters(final_output, [song_file for song_file, _, _ in appended_entries],
+                             [duration for _, duration, _ in appended])
+        self.evict(appended_entries, self.segment_mode)
+        if playlist.remove_track_dirs(os.path.dirname(hls_playlist)):
+            self.log(">>> 已删除旧版本复制的 _tracks 片段目录")
+        if self.on_ready:
+            self.on_ready(ready, planned, True)
+        self.log(f">>> 已生成: {final_output}, {hls_playlist}")
+        if not self.verify(final_output, appended_entries):
+            return UNVERIFIED
+        return INCOMPLETE if failed else DONE
+
+    # --- 辅助 ---
+
+    def _progress(self, value, maximum):
+        if self.on_progress:
+            self.on_progress(value, maximum)
+
+    def _slot(self):
+        return self.slots if self.slots is not None else contextlib.nullcontext()
+
+    def _record(self, kind, audio_seconds, started):
+        if self.throughput is not None:
+            self.throughput.record(kind, audio_seconds, time.monotonic() - started)
+
+    def _failed(self, message, error):
+        """拼接 / 编码出错时的结果：任务已取消为 CANCELLED，否则写日志并返回 FAILED"""
+        if ffmpeg_scheduler.cancelled():
+            self.log("*** 已取消 ***")
+            return CANCELLED
+        self.log(f"{message}: {describe_error(error)}")
+        return FAILED
+
+    def _write_chapters(self, final_output, song_files, durations):
+        """为 MP3 输出写入正确的寻址表与每首歌的章节（不重新解码）"""
+        if "mp3" not in self.profiles:
+            return
+        try:
+            count = write_chapters(final_output, song_files, durations, self.profiles)
+            self.log(f">>> 已写入 {count} 个章节与寻址表")
+        except OSError as e:
+            self.log(f"写入章节失败: {e}")
+
+    def verify(self, final_output, entries, frame_aligned=True):
+        """扫描 MP3 输出的帧头，核对连续性、总时长与每首的章节边界，entries 为实际写入的 [(歌曲文件, 开始, 结束)]"""
+        if "mp3" not in self.profiles:
+            return True
+        mp3_path = otaku_engine.output_paths(final_output, ["mp3"])[0]
+        planned = mp3_verify.planned_durations(entries, self.mix_duration(), songs_dir=self.songs_dir)
+        check = mp3_verify.verify_mp3(mp3_path, planned, frame_aligned)
+        self.log(mp3_verify.describe(check).rstrip("\n"))
+        return check.ok
+
+    def _log_outputs(self, final_output):
+        self.log("已生成: " + ", ".join(otaku_engine.output_paths(final_output, self.profiles)))
+
+
+def renderer_for(settings, cache, library, songs_dir="songs", workers=None, **callbacks):
+    """按检查点中的渲染设置创建 Renderer，callbacks 为 log / on_progress / report 等"""
+    return Renderer(cache, library, songs_dir, settings.get("render_mode", "single_pass"),
+                    settings.get("output_profiles", list(otaku_engine.DEFAULT_PROFILES)), workers, **callbacks)
+
+
+def render_setlist(entries, out_dir, renderer):
+    """把歌单中的每首渲染为 out_dir 中的片段，返回渲染失败的 [(歌曲文件, 开始, 结束)]"""
+    os.makedirs(out_dir, exist_ok=True)
+
+    def render(song_file, start_time, end_time):
+        path, hit = renderer.ensure_segment(song_file, start_time, end_time)
+        renderer.cache.materialize(Path(path).stem, segment_output(out_dir, song_file))
+        return hit
+
+    def on_done(job, error):
+        if error is not None:
+            renderer.log(f"渲染失败: {job[0]}: {describe_error(error)}")
+        else:
+            renderer.log(f"渲染成功: {segment_output(out_dir, job[0])}")
+
+    return renderer.render_parallel(entries, render, on_done)
+
+
+def run_job(manifest, workspace, cache, library, songs_dir="songs", workers=None,
+            on_progress=None, log=print, slots=None, rng=random):
+    """按检查点中的设置生成（见 Renderer.run_job），全部成功时返回 True
+
+    on_progress(已完成数, 总数) 在每个片段完成后回调；slots 为多个任务共用的渲染名额（信号量）。
+    """
+    renderer = renderer_for(manifest.settings, cache, library, songs_dir, workers,
+                            log=log, on_progress=on_progress, slots=slots, rng=rng)
+    status = renderer.run_job(manifest, workspace)
+    if status == INCOMPLETE:
+        log("部分片段渲染失败，修正后重新运行只会重做这些片段")
+    return status == DONE
+
+
+def _formats(text):
+    profiles = [name.strip() for name in text.split(",") if name.strip()]
+    unknown = [name for name in profiles if name not in otaku_engine.OUTPUT_PROFILES]
+    if unknown or not profiles:
+        raise argparse.ArgumentTypeError(f"未知的输出格式: {', '.join(unknown)}")
+    return profiles
+
+
+def _cmd_render(args):
+    renderer = Renderer(SegmentCache(args.cache_dir, args.budget_mb), SourceLibrary(args.cache_dir), args.songs_dir,
+                        args.mode, workers=args.workers)
+    failed = render_setlist(otaku_engine.read_setlist(args.csv), args.out_dir, renderer)
+    return 1 if failed else 0
+
+
+def _cmd_shuffle(args):
+    segments = [segment_output(args.out_dir, song_file) for song_file, _, _ in otaku_engine.read_setlist(args.csv)]
+    missing = [path for path in segments if not os.path.exists(path)]
+    for path in missing:
+        print(f"跳过尚未渲染的片段: {path}")
+    order, _ = shuffle_order([path for path in segments if path not in missing], rng=random.Random(args.seed))
+    otaku_engine.write_concat_list(order, args.list)
+    print(f"已随机打乱 {len(order)} 首，拼接列表: {args.list}")
+    return 0
+
+
+def _cmd_concat(args):
+    order = otaku_engine.read_concat_list(args.list)
+    if not order:
+        print(f"拼接列表为空: {args.list}")
+        return 2
+    profiles = args.formats
+    durations = concat_segments(order, args.list, args.output, profiles)
+    titles = [Path(path).name[len("out_"):] if Path(path).name.startswith("out_") else Path(path).name
+              for path in order]
+    write_chapters(args.output, titles, durations, profiles)
+    if "mp3" in profiles:
+        check = mp3_verify.verify_mp3(otaku_engine.output_paths(args.output, ["mp3"])[0])
+        print(mp3_verify.describe(check), end="")
+        if not check.ok:
+            return 1
+    print("已生成: " + ", ".join(otaku_engine.output_paths(args.output, profiles)))
+    return 0
+
+
+def _cmd_all(args):
+    if args.engine in MP3_ONLY_ENGINES and args.formats != ["mp3"]:
+        print(f"{args.engine} 方式只支持 --formats mp3")
+        return 2
+    entries = otaku_engine.read_setlist(args.csv)
+    if not entries:
+        print(f"歌单为空: {args.csv}")
+        return 2
+    cache = SegmentCache(args.cache_dir, args.budget_mb)
+    workspace = Workspace.create(args.jobs_dir)
+    otaku_engine.write_setlist(workspace.csv_file, entries)
+    settings = {"render_mode": args.mode, "show_engine": args.engine, "output_profiles": args.formats,
+                "use_content_hash": cache.use_content_hash}
+    print(f"任务 {workspace.job_id}：{len(entries)} 首")
+    if args.engine != "segments":
+        renderer = renderer_for(settings, cache, SourceLibrary(args.cache_dir), args.songs_dir, args.workers)
+        status = renderer.render_show(args.engine, entries, workspace)
+        return 0 if status == DONE else 1
+
+    manifest = create_job(workspace, entries, settings, args.output or workspace.final_output())
+    ok = run_job(manifest, workspace, cache, SourceLibrary(args.cache_dir), args.songs_dir, args.workers)
+    if not ok:
+        print(f"未全部完成，可运行 python scripts/resume_render.py --job {workspace.job_id} 继续")
+    return 0 if ok else 1
+
+
+def main(argv=None):
+    """命令行入口，返回退出码"""
+    p = argparse.ArgumentParser(description="随舞音频生成（命令行，不需要图形界面）")
+    sub = p.add_subparsers(dest="command", required=True)
+
+    def common(parser):
+        parser.add_argument("--songs-dir", default="songs")
+        parser.add_argument("--cache-dir", default="cache")
+        parser.add_argument("--budget-mb", type=float, default=DEFAULT_BUDGET_MB)
+        parser.add_argument("--workers", type=int, default=otaku_engine.default_workers())
+        return parser
+
+    render = common(sub.add_parser("render", help="渲染歌单中每首的片段"))
+    render.add_argument("--csv", default="songs.csv")
+    render.add_argument("--mode", choices=SEGMENT_MODES, default="single_pass", help="片段渲染方式")
+    render.add_argument("--out-dir", default="output")
+    render.set_defaults(func=_cmd_render)
+
+    shuffle = sub.add_parser("shuffle", help="随机打乱已渲染的片段，写出拼接列表")
+    shuffle.add_argument("--csv", default="songs.csv")
+    shuffle.add_argument("--out-dir", default="output")
+    shuffle.add_argument("--list", default="songlist.txt")
+    shuffle.add_argument("--seed", type=int, help="随机种子，相同的种子得到相同的顺序")
+    shuffle.set_defaults(func=_cmd_shuffle)
+
+    concat = sub.add_parser("concat", help="按拼接列表生成最终文件（流复制，写入章节并校验）")
+    concat.add_argument("--list", default="songlist.txt")
+    concat.add_argument("-o", "--output", default="output_audio.mp3")
+    concat.add_argument("--formats", type=_formats, default="mp3", help="逗号分隔: " + ", ".join(otaku_engine.OUTPUT_PROFILES))
+    concat.set_defaults(func=_cmd_concat)
+
+    everything = common(sub.add_parser("all", help="渲染、打乱并拼接（带检查点，中断后可继续）"))
+    everything.add_argument("--csv", default="songs.csv")
+    everything.add_argument("--mode", choices=RENDER_MODES, default="single_pass",
+                            help="片段渲染方式（numpy 需要安装 numpy）")
+    everything.add_argument("--engine", choices=SHOW_ENGINES, default="segments",
+                            help="整场生成方式，只有 segments 写入检查点；其他方式的输出文件名带任务 ID")
+    everything.add_argument("-o", "--output", help="默认为 output_audio_<任务ID>.mp3（仅 segments）")
+    everything.add_argument("--jobs-dir", default=JOBS_DIR)
+    everything.add_argument("--formats", type=_formats, default="mp3", help="逗号分隔: " + ", ".join(otaku_engine.OUTPUT_PROFILES))
+    everything.set_defaults(func=_cmd_all)
+
+    args = p.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+import json
+import os
+import threading
+from collections import namedtuple
+
+import otaku_engine
+from otaku_engine import CHANNELS, SAMPLE_RATE, MIX_PATH, OUTPUT_PROFILES, DEFAULT_PROFILES
+
+# 生成前的预估（不渲染任何内容）：逐行判断缓存是否命中、走哪条渲染路径，
+# 并按以往实测的处理速度估算 CPU 时间与需要写入的磁盘空间。
+
+STATS_FILE = "output/render_stats.json"
+
+# 每秒音频需要的处理时间（秒）。单个 ffmpeg 进程基本只占一个核，耗时近似等于 CPU 秒数。
+# 没有实测数据时使用下面的默认值，实测数据由 ThroughputStats.record 在每次生成时累积。
+DEFAULT_RATES = {
+    "single_pass": 0.02,  # 解码 + 淡入淡出 + 编码
+    "smart": 0.005,       # 只重新编码淡入淡出的边缘
+    "legacy": 0.06,       # 剪切 -> 淡入 -> 淡出 -> 拼接，编码三次
+    "decode": 0.005,      # numpy 模式解码到 PCM
+    "encode": 0.02,       # 整场编码（streaming / numpy / 非 mp3 格式）
+    "concat": 0.0005,     # 流复制拼接
+}
+# 各输出格式每秒音频的字节数
+BYTES_PER_SECOND = {"mp3": 320000 // 8, "opus": 160000 // 8, "wav": 2 * CHANNELS * SAMPLE_RATE}
+PCM_BYTES_PER_SECOND = 4 * CHANNELS * SAMPLE_RATE
+
+RowPlan = namedtuple("RowPlan", "song_file status path duration cpu_seconds bytes")
+
+
+class ThroughputStats:
+    """各渲染路径的实测处理速度，按 {类型: {"audio": 累计音频秒数, "seconds": 累计耗时}} 保存"""
+
+    def __init__(self, path=STATS_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        try:
+            with open(path, encoding="utf-8") as f:
+                self.data = json.load(f)
+        except (OSError, ValueError):
+            self.data = {}
+
+    def record(self, kind, audio_seconds, elapsed):
+        if audio_seconds <= 0:
+            return
+        with self.lock:
+            entry = self.data.setdefault(kind, {"audio": 0.0, "seconds": 0.0})
+            entry["audio"] += audio_seconds
+            entry["seconds"] += elapsed
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.data, f, indent=1)
+            os.replace(tmp, self.path)
+
+    def measured(self, kind):
+        return self.data.get(kind, {}).get("audio", 0) >= 1
+
+    def rate(self, kind):
+        """每秒音频的处理秒数，有实测数据时使用实测值"""
+        if self.measured(kind):
+            entry = self.data[kind]
+            return entry["seconds"] / entry["audio"]
+        return DEFAULT_RATES[kind]
+
+
+def plan_show(rows, cache, stats, render_mode="single_pass", show_engine="segments", profiles=DEFAULT_PROFILES,
+              mix_duration=0, workers=1, songs_dir="songs", exact=False):
+    """预估一次生成，返回 ([RowPlan], 合计)
+
+    rows 为歌单行 [文件名, 开始, 结束, ...]；exact 为 True 时为 smart 模式逐个扫描源文件判断能否走复制路径
+    （较慢，默认只按扩展名判断）。合计包含最终拼接/编码阶段。
+    """
+    mp3_bps = BYTES_PER_SECOND["mp3"]
+    segment_mode = "smart" if render_mode == "smart" else "single_pass"
+    if show_engine == "segments" and render_mode in ("legacy", "numpy"):
+        segment_mode = render_mode
+    mix_path = None if show_engine == "playlist" else MIX_PATH
+    mix = mix_duration if mix_path else 0
+    kinds = set()
+    plans = []
+
+    for row in rows:
+        song_file = row[0] if row else ""
+        try:
+            start_time, end_time = float(row[1]), float(row[2])
+        except (IndexError, ValueError):
+            plans.append(RowPlan(song_file, "invalid", "-", 0, 0, 0))
+            continue
+        duration = max(0.0, end_time - start_time)
+        input_path = os.path.join(songs_dir, song_file)
+        if not os.path.exists(input_path):
+            plans.append(RowPlan(song_file, "missing", "-", duration, 0, 0))
+            continue
+
+        if show_engine == "streaming":
+            # 整场一次编码，不使用片段缓存，成本计入 encode
+            kinds.add("encode")
+            plans.append(RowPlan(song_file, "miss", "流式编码", duration,
+                                 (duration + mix) * stats.rate("encode"), 0))
+            continue
+
+        if segment_mode == "numpy":
+            import pcm_engine  # 需要 numpy，只在 numpy 模式下导入
+            key = pcm_engine.pcm_key(cache, input_path, start_time, end_time, normalized=True)
+            if os.path.exists(cache.path_for(key, pcm_engine.PCM_EXT)):
+                plans.append(RowPlan(song_file, "hit", "复制", duration, 0, 0))
+            else:
+                kinds.add("decode")
+                plans.append(RowPlan(song_file, "miss", "解码", duration,
+                                     duration * stats.rate("decode"), duration * PCM_BYTES_PER_SECOND))
+            continue
+
+        segment_bytes = (duration + mix) * mp3_bps
+        # segments 引擎还会把片段复制到任务工作目录
+        copy_bytes = segment_bytes if show_engine == "segments" else 0
+        key = otaku_engine.segment_key(cache, input_path, start_time, end_time, segment_mode, mix_path)
+        if os.path.exists(cache.path_for(key)):
+            plans.append(RowPlan(song_file, "hit", "复制", duration, 0, copy_bytes))
+            continue
+
+        kind = segment_mode
+        path = "重新编码"
+        if segment_mode == "smart":
+            smart_ok = (otaku_engine.plan_smart_render(input_path, start_time, end_time) is not None if exact
+                        else input_path.lower().endswith(".mp3"))
+            if smart_ok:
+                path = "边缘重新编码"
+            else:
+                kind = "single_pass"
+        elif segment_mode == "legacy":
+            path = "重新编码×3"
+        kinds.add(kind)
+        cost_seconds = duration + mix if segment_mode == "legacy" else duration
+        plans.append(RowPlan(song_file, "miss", path, duration, cost_seconds * stats.rate(kind),
+                             segment_bytes + copy_bytes))
+
+    # 最终阶段：流复制拼接 / 整场编码，各输出格式的文件大小
+    usable = [plan for plan in plans if plan.status in ("hit", "miss")]
+    show_seconds = sum(plan.duration + mix for plan in usable)
+    final_cpu = 0.0
+    final_bytes = 0
+    if show_engine != "playlist" and usable:
+        encoded = [name for name in profiles if name != "mp3"]
+        if show_engine == "streaming":
+            pass  # mp3 编码已计入各行，其他格式在同一进程中额外编码
+        elif show_engine in ("segments", "progressive") and segment_mode != "numpy" and "mp3" in profiles:
+            kinds.add("concat")
+            final_cpu += show_seconds * stats.rate("concat")
+        else:
+            encoded = list(profiles)
+        if encoded:
+            kinds.add("encode")
+            final_cpu += show_seconds * stats.rate("encode") * len(encoded)
+        final_bytes = sum(show_seconds * BYTES_PER_SECOND.get(name, mp3_bps) for name in profiles
+                          if name in OUTPUT_PROFILES)
+
+    row_cpu = sum(plan.cpu_seconds for plan in plans)
+    totals = {
+        "rows": len(plans),
+        "hits": sum(plan.status == "hit" for plan in plans),
+        "misses": sum(plan.status == "miss" for plan in plans),
+        "missing": sum(plan.status in ("missing", "invalid") for plan in plans),
+        "cpu_seconds": row_cpu + final_cpu,
+        # 片段按 workers 并行渲染，最终阶段只有一个进程；streaming 整场只有一个进程
+        "wall_seconds": (row_cpu if show_engine == "streaming" else row_cpu / max(1, workers)) + final_cpu,
+        "bytes": sum(plan.bytes for plan in plans) + final_bytes,
+        "measured": all(stats.measured(kind) for kind in kinds),
+    }
+    return plans, totals
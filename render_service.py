@@ -0,0 +1,335 @@
+import argparse
+import itertools
+import json
+import os
+import queue
+import random
+import shutil
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import otaku_engine
+import render_jobs
+from render_cache import SegmentCache, DEFAULT_BUDGET_MB
+from source_library import SourceLibrary
+from workspace import JOBS_DIR, Workspace
+
+# 渲染服务：把渲染流程包装成本地 HTTP 接口，由一台性能较好的电脑为多个摊位统一生成音频。
+# 各摊位提交歌单（JSON 或 CSV），轮询任务状态与进度，完成后下载结果；
+# 任务按优先级排队，有限个任务同时运行，所有任务共用一个片段缓存与一组渲染名额。
+#
+#   POST   /jobs              提交歌单，返回任务 ID
+#   GET    /jobs              所有任务
+#   GET    /jobs/<id>         任务状态与进度
+#   GET    /jobs/<id>/result  下载结果（?format=mp3|opus|wav）
+#   DELETE /jobs/<id>         取消排队中的任务
+
+DEFAULT_PORT = 8766
+MAX_BODY_BYTES = 1024 * 1024
+CONTENT_TYPES = {"mp3": "audio/mpeg", "opus": "audio/ogg", "wav": "audio/wav"}
+JOB_ERRORS = {
+    render_jobs.INCOMPLETE: "部分片段渲染失败",
+    render_jobs.UNVERIFIED: "输出校验未通过",
+    render_jobs.FAILED: "拼接失败",
+    render_jobs.CANCELLED: "已取消",
+}
+
+
+def log(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+def parse_setlist(body, content_type):
+    """解析提交的歌单，返回 ([(歌曲文件, 开始, 结束)], 选项)
+
+    JSON: {"setlist": [{"file": ..., "start": ..., "end": ...} 或 [文件, 开始, 结束], ...], "priority": ..., ...}
+    CSV: 与 songs.csv 相同的格式（第一行为标题）
+    编码与读取 songs.csv 时相同（utf-8 / utf-8-sig / gbk / gb2312）。
+    """
+    text = otaku_engine.decode_setlist(body)
+    if "json" in content_type:
+        data = json.loads(text)
+        if not isinstance(data, (dict, list)):
+            raise ValueError("JSON 歌单必须是对象或数组")
+        if isinstance(data, list):
+            data = {"setlist": data}
+        entries = []
+        for item in data.get("setlist", []):
+            if isinstance(item, dict):
+                item = (item.get("file"), item.get("start"), item.get("end"))
+            song_file, start_time, end_time = item[:3]
+            entries.append((str(song_file), float(start_time), float(end_time)))
+        options = {k: v for k, v in data.items() if k != "setlist"}
+        return entries, options
+
+    entries = []
+    for row in otaku_engine.setlist_rows(text):
+        if len(row) < 3:
+            continue
+        entries.append((row[0], float(row[1]), float(row[2])))
+    return entries, {}
+
+
+class ServiceJob:
+    """服务中的一个任务（状态只保存在内存中，片段与检查点保存在任务工作目录里）"""
+
+    def __init__(self, workspace, manifest, priority, seed):
+        self.workspace = workspace
+        self.manifest = manifest
+        self.priority = priority
+        self.seed = seed
+        self.status = "queued"  # queued -> running -> done / incomplete / failed，或 cancelled
+        self.done = 0
+        self.total = len(manifest.jobs)
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+    @property
+    def job_id(self):
+        return self.workspace.job_id
+
+    def outputs(self):
+        profiles = self.manifest.settings.get("output_profiles", list(otaku_engine.DEFAULT_PROFILES))
+        paths = otaku_engine.output_paths(self.manifest.final_output, profiles)
+        return {name: path for name, path in zip(profiles, paths) if os.path.exists(path)}
+
+    def to_dict(self, position=None):
+        data = {
+            "id": self.job_id,
+            "status": self.status,
+            "priority": self.priority,
+            "progress": {"done": self.done, "total": self.total},
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "error": self.error,
+        }
+        if position is not None:
+            data["queue_position"] = position
+        if self.status in ("done", "incomplete"):
+            data["outputs"] = {name: f"/jobs/{self.job_id}/result?format={name}" for name in self.outputs()}
+        return data
+
+
+class RenderService:
+    def __init__(self, songs_dir="songs", cache_dir="cache", out_dir="output", jobs_dir=JOBS_DIR,
+                 job_workers=1, render_workers=None, budget_mb=DEFAULT_BUDGET_MB):
+        self.songs_dir = songs_dir
+        self.out_dir = out_dir
+        self.jobs_dir = jobs_dir
+        self.render_workers = render_workers or otaku_engine.default_workers()
+        self.cache = SegmentCache(cache_dir, budget_mb)
+        self.library = SourceLibrary(cache_dir)
+        # 所有任务共用的渲染名额：同时运行多个任务时 ffmpeg 进程总数不超过 render_workers
+        self.slots = threading.BoundedSemaphore(self.render_workers)
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.queue = queue.PriorityQueue()
+        self.seq = itertools.count()
+        os.makedirs(out_dir, exist_ok=True)
+        self.library.start_background_ingest(songs_dir)
+        for _ in range(max(1, job_workers)):
+            threading.Thread(target=self._worker, daemon=True).start()
+
+    def submit(self, entries, priority=0, render_mode="single_pass", profiles=otaku_engine.DEFAULT_PROFILES,
+               seed=None):
+        """校验并排队一个任务，priority 越大越先运行，同优先级按提交顺序"""
+        if not entries:
+            raise ValueError("歌单为空")
+        if render_mode not in render_jobs.RENDER_MODES:
+            raise ValueError(f"不支持的渲染模式: {render_mode}")
+        profiles = list(profiles)
+        unknown = [name for name in profiles if name not in otaku_engine.OUTPUT_PROFILES]
+        if unknown or not profiles:
+            raise ValueError(f"未知的输出格式: {', '.join(unknown)}")
+        missing = sorted({song_file for song_file, _, _ in entries
+                          if not os.path.isfile(os.path.join(self.songs_dir, os.path.basename(song_file)))
+                          or os.path.basename(song_file) != song_file})
+        if missing:
+            raise ValueError(f"songs 目录中找不到: {', '.join(missing)}")
+
+        workspace = Workspace.create(self.jobs_dir)
+        otaku_engine.write_setlist(workspace.csv_file, entries)
+        settings = {"render_mode": render_mode, "show_engine": "segments", "output_profiles": profiles,
+                    "use_content_hash": self.cache.use_content_hash}
+        final_output = os.path.join(self.out_dir, workspace.final_output())
+        manifest = render_jobs.create_job(workspace, entries, settings, final_output)
+
+        job = ServiceJob(workspace, manifest, int(priority), seed)
+        with self.lock:
+            self.jobs[job.job_id] = job
+        self.queue.put((-job.priority, next(self.seq), job.job_id))
+        log(f"[{job.job_id}] 已排队：{len(entries)} 首，优先级 {job.priority}")
+        return job
+
+    def cancel(self, job_id):
+        """取消排队中的任务，已经开始的任务不能取消"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.status != "queued":
+                return False
+            job.status = "cancelled"
+            job.finished = time.time()
+        shutil.rmtree(job.workspace.dir, ignore_errors=True)
+        return True
+
+    def queue_position(self, job):
+        with self.lock:
+            queued = sorted((-j.priority, j.created, j.job_id) for j in self.jobs.values() if j.status == "queued")
+        for i, (_, _, job_id) in enumerate(queued):
+            if job_id == job.job_id:
+                return i
+        return None
+
+    def _worker(self):
+        while True:
+            _, _, job_id = self.queue.get()
+            with self.lock:
+                job = self.jobs[job_id]
+                if job.status != "queued":
+                    continue
+                job.status = "running"
+                job.started = time.time()
+            try:
+                self._run(job)
+            except Exception as e:
+                job.status = "failed"
+                job.error = str(e)
+                log(f"[{job_id}] 失败: {e}")
+            job.finished = time.time()
+
+    def _run(self, job):
+        def on_progress(done, total):
+            job.done = done
+
+        rng = random.Random(job.seed)
+        # 片段渲染完成后按磁盘预算淘汰旧缓存，本任务用到的片段、中间文件与倒数音频不会被删除
+        renderer = render_jobs.renderer_for(
+            job.manifest.settings, self.cache, self.library, self.songs_dir, self.render_workers,
+            log=lambda message: log(f"[{job.job_id}] {message}"), on_progress=on_progress, slots=self.slots, rng=rng,
+        )
+        status = renderer.run_job(job.manifest, job.workspace)
+        job.status = {render_jobs.DONE: "done", render_jobs.FAILED: "failed"}.get(status, "incomplete")
+        job.error = JOB_ERRORS.get(status)
+
+
+def make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            log(f"{self.address_string()} {format % args}")
+
+        def send_json(self, data, status=200):
+            body = json.dumps(data, ensure_ascii=False, indent=1).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def route(self):
+            url = urlparse(self.path)
+            parts = [part for part in url.path.split("/") if part]
+            query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            job = None
+            if len(parts) >= 2 and parts[0] == "jobs":
+                with service.lock:
+                    job = service.jobs.get(parts[1])
+            return parts, query, job
+
+        def do_GET(self):
+            parts, query, job = self.route()
+            if parts in ([], ["jobs"]):
+                with service.lock:
+                    jobs = sorted(service.jobs.values(), key=lambda j: j.created)
+                self.send_json({"jobs": [j.to_dict() for j in jobs]})
+            elif job is None:
+                self.send_json({"error": "任务不存在"}, 404)
+            elif len(parts) == 2:
+                position = service.queue_position(job) if job.status == "queued" else None
+                self.send_json(job.to_dict(position))
+            elif len(parts) == 3 and parts[2] == "result":
+                self.send_result(job, query.get("format", "mp3"))
+            else:
+                self.send_json({"error": "未知的路径"}, 404)
+
+        def send_result(self, job, name):
+            path = job.outputs().get(name) if job.status in ("done", "incomplete") else None
+            if path is None:
+                self.send_json({"error": f"结果不可用（状态: {job.status}）"}, 409)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPES.get(name, "application/octet-stream"))
+            self.send_header("Content-Length", str(os.path.getsize(path)))
+            self.send_header("Content-Disposition", f'attachment; filename="{os.path.basename(path)}"')
+            self.end_headers()
+            with open(path, "rb") as f:
+                shutil.copyfileobj(f, self.wfile, 1024 * 1024)
+
+        def do_POST(self):
+            parts, query, _ = self.route()
+            if parts != ["jobs"]:
+                self.send_json({"error": "未知的路径"}, 404)
+                return
+            length = int(self.headers.get("Content-Length") or 0)
+            if length > MAX_BODY_BYTES:
+                self.send_json({"error": "歌单过大"}, 413)
+                return
+            try:
+                entries, options = parse_setlist(self.rfile.read(length), self.headers.get("Content-Type", ""))
+                options = {**query, **options}
+                formats = options.get("formats", ",".join(otaku_engine.DEFAULT_PROFILES))
+                if isinstance(formats, str):
+                    formats = [name.strip() for name in formats.split(",") if name.strip()]
+                seed = options.get("seed")
+                job = service.submit(
+                    entries, int(options.get("priority", 0)), options.get("mode", "single_pass"), formats,
+                    int(seed) if seed is not None else None,
+                )
+            except (ValueError, TypeError, IndexError, UnicodeDecodeError) as e:
+                self.send_json({"error": str(e)}, 400)
+                return
+            self.send_json(job.to_dict(service.queue_position(job)), 202)
+
+        def do_DELETE(self):
+            parts, _, job = self.route()
+            if job is None or len(parts) != 2:
+                self.send_json({"error": "任务不存在"}, 404)
+            elif service.cancel(job.job_id):
+                self.send_json(job.to_dict())
+            else:
+                self.send_json({"error": f"任务已经开始或结束（状态: {job.status}）"}, 409)
+
+    return Handler
+
+
+def main():
+    p = argparse.ArgumentParser(description="本地 HTTP 渲染服务：多个摊位提交歌单，由一台电脑统一渲染")
+    p.add_argument("--host", default="127.0.0.1", help="监听地址，局域网内共享可用 0.0.0.0")
+    p.add_argument("--port", type=int, default=DEFAULT_PORT)
+    p.add_argument("--songs-dir", default="songs")
+    p.add_argument("--cache-dir", default="cache")
+    p.add_argument("--out-dir", default="output")
+    p.add_argument("--jobs", type=int, default=1, help="同时运行的任务数")
+    p.add_argument("--workers", type=int, default=otaku_engine.default_workers(), help="所有任务共用的 ffmpeg 进程数")
+    p.add_argument("--budget-mb", type=float, default=DEFAULT_BUDGET_MB)
+    args = p.parse_args()
+
+    service = RenderService(args.songs_dir, args.cache_dir, args.out_dir, os.path.join(args.out_dir, "jobs"),
+                            args.jobs, args.workers, args.budget_mb)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    log(f"渲染服务已启动: http://{args.host}:{args.port}/jobs")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
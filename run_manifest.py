@@ -0,0 +1,131 @@
+import json
+import os
+import threading
+import time
+
+from render_cache import content_hash
+from workspace import JOBS_DIR, list_jobs
+
+# 生成任务的检查点：记录本次任务的曲目、每个已完成片段的输入指纹与输出校验信息、打乱后的顺序。
+# 中途失败（ffmpeg 崩溃、电脑休眠等）后可以继续上次的任务：已验证的片段直接跳过，从第一个缺失或失效的片段继续。
+# 检查点保存在各任务的工作目录中（见 workspace.py）。
+
+
+class RunManifest:
+    """一次生成任务的检查点文件
+
+    jobs 为 [(歌曲文件, 输出文件, 开始, 结束)]；segments 按输出文件记录
+    {"key": 输入指纹(片段缓存键), "path": 实际产物, "size": 字节数, "sha1": 内容哈希}。
+    status: rendering（渲染片段） -> concat（已确定顺序，正在拼接） -> done。
+    """
+
+    def __init__(self, path, data):
+        self.path = path
+        self.data = data
+        self.lock = threading.Lock()
+
+    @classmethod
+    def create(cls, path, job_id, csv_file, settings, jobs, final_output):
+        data = {
+            "run_id": job_id,
+            "created": int(time.time()),
+            "csv": csv_file,
+            "settings": settings,
+            "jobs": [list(job) for job in jobs],
+            "final_output": final_output,
+            "segments": {},
+            "order": None,
+            "status": "rendering",
+        }
+        manifest = cls(path, data)
+        manifest.save()
+        return manifest
+
+    @classmethod
+    def load(cls, path):
+        """读取检查点，文件不存在或已损坏时返回 None"""
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(data, dict) or "jobs" not in data:
+            return None
+        return cls(path, data)
+
+    @property
+    def job_id(self):
+        return self.data["run_id"]
+
+    @property
+    def jobs(self):
+        return [(song_file, output_file, float(start), float(end))
+                for song_file, output_file, start, end in self.data["jobs"]]
+
+    @property
+    def settings(self):
+        return self.data.get("settings", {})
+
+    @property
+    def final_output(self):
+        return self.data["final_output"]
+
+    @property
+    def status(self):
+        return self.data.get("status", "rendering")
+
+    @property
+    def order(self):
+        return self.data.get("order")
+
+    def save(self):
+        """先写临时文件再替换，写到一半中断也不会留下损坏的检查点"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.path)
+
+    def mark_done(self, output_file, key, path):
+        """记录一个已完成的片段（可在多个渲染线程中调用）"""
+        record = {"key": key, "path": path, "size": os.path.getsize(path), "sha1": content_hash(path)}
+        with self.lock:
+            self.data["segments"][output_file] = record
+            self.save()
+
+    def verified(self, output_file, key):
+        """片段已完成、输入指纹未变且产物完好时返回 True"""
+        record = self.data["segments"].get(output_file)
+        if not record or record["key"] != key:
+            return False
+        path = record["path"]
+        try:
+            if os.path.getsize(path) != record["size"]:
+                return False
+            return content_hash(path) == record["sha1"]
+        except OSError:
+            return False
+
+    def set_order(self, order):
+        with self.lock:
+            self.data["order"] = list(order)
+            self.data["status"] = "concat"
+            self.save()
+
+    def finish(self):
+        with self.lock:
+            self.data["status"] = "done"
+            self.save()
+
+
+def find_resumable(root=JOBS_DIR, exclude=()):
+    """返回最近一个未完成的任务检查点，exclude 中的任务 ID（正在运行的任务）会被跳过"""
+    for ws in list_jobs(root):
+        if ws.job_id in exclude:
+            continue
+        manifest = RunManifest.load(ws.manifest_path)
+        if manifest is not None and manifest.status != "done":
+            return manifest
+    return None
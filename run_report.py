@@ -0,0 +1,135 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import ffmpeg_scheduler
+
+# 每次生成的计量报告：记录 cut_and_fade 各阶段与最终拼接的耗时、ffmpeg 子进程 CPU 时间、
+# 读写字节数与缓存命中情况，保存为任务工作目录中的 report.json，并在日志末尾输出摘要。
+
+SLOWEST_COUNT = 5  # 摘要中列出的最慢片段数
+CACHE_STAGES = ("render", "decode")  # 片段缓存命中情况只看这些阶段（loudness 等阶段有各自的缓存）
+
+
+class RunReport:
+    """一次生成的各阶段计量记录"""
+
+    def __init__(self, path, job_id, settings):
+        self.path = path
+        self.job_id = job_id
+        self.settings = settings
+        self.started = time.time()
+        self.stages = []
+        self.lock = threading.Lock()
+
+    def add(self, entry):
+        with self.lock:
+            self.stages.append(entry)
+
+    def top_level(self):
+        """不含嵌套子阶段的记录（子阶段的数据已计入外层阶段）"""
+        return [entry for entry in self.stages if not entry["nested"]]
+
+    def segments(self):
+        """按片段汇总：{片段: {"wall_seconds", "cpu_seconds", "thread_cpu_seconds", "cache"}}，不含整场阶段"""
+        totals = {}
+        for entry in self.top_level():
+            if entry["segment"] is None:
+                continue
+            total = totals.setdefault(entry["segment"], {"wall_seconds": 0.0, "cpu_seconds": 0.0,
+                                                         "thread_cpu_seconds": 0.0, "cache": None})
+            total["wall_seconds"] += entry["wall_seconds"]
+            total["cpu_seconds"] += entry["cpu_seconds"]
+            total["thread_cpu_seconds"] += entry["thread_cpu_seconds"]
+            if entry["stage"] in CACHE_STAGES and entry["cache"] is not None:
+                total["cache"] = entry["cache"]
+        return totals
+
+    def totals(self):
+        stages = self.top_level()
+        return {
+            "wall_seconds": time.time() - self.started,
+            "cpu_seconds": sum(entry["cpu_seconds"] for entry in stages),
+            "thread_cpu_seconds": sum(entry["thread_cpu_seconds"] for entry in stages),
+            "bytes_read": sum(entry["bytes_read"] for entry in stages),
+            "bytes_written": sum(entry["bytes_written"] for entry in stages),
+            "cache_hits": sum(entry["stage"] in CACHE_STAGES and entry["cache"] == "hit" for entry in stages),
+            "cache_misses": sum(entry["stage"] in CACHE_STAGES and entry["cache"] == "miss" for entry in stages),
+            "failed": sum(not entry["ok"] for entry in stages),
+        }
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self.lock:
+            data = {"job_id": self.job_id, "settings": self.settings, "started": self.started,
+                    "totals": self.totals(), "stages": list(self.stages)}
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.path)
+
+    def summary(self, count=SLOWEST_COUNT):
+        """日志末尾的摘要文本：总计、各阶段合计与最慢的几个片段"""
+        totals = self.totals()
+        lines = [
+            f">>> 计量报告: 总耗时 {totals['wall_seconds']:.1f}s，ffmpeg CPU {totals['cpu_seconds']:.1f}s，"
+            f"进程内 CPU {totals['thread_cpu_seconds']:.1f}s，"
+            f"读取 {totals['bytes_read'] / 1024 / 1024:.1f} MB，写入 {totals['bytes_written'] / 1024 / 1024:.1f} MB，"
+            f"缓存命中 {totals['cache_hits']} / 未命中 {totals['cache_misses']}\n"
+        ]
+        by_stage = {}
+        for entry in self.stages:
+            total = by_stage.setdefault(entry["stage"], [0, 0.0, 0.0, 0.0])
+            total[0] += 1
+            total[1] += entry["wall_seconds"]
+            total[2] += entry["cpu_seconds"]
+            total[3] += entry["thread_cpu_seconds"]
+        for stage, (calls, wall, cpu, thread_cpu) in sorted(by_stage.items(), key=lambda item: -item[1][1]):
+            lines.append(f"    {stage}: {calls} 次，耗时 {wall:.1f}s，CPU {cpu:.1f}s，进程内 CPU {thread_cpu:.1f}s\n")
+        slowest = sorted(self.segments().items(), key=lambda item: -item[1]["wall_seconds"])[:count]
+        if slowest:
+            lines.append(f">>> 最慢的 {len(slowest)} 个片段:\n")
+            for segment, total in slowest:
+                cache = {"hit": "命中", "miss": "未命中"}.get(total["cache"], "-")
+                lines.append(f"    ★ {segment}: {total['wall_seconds']:.1f}s (CPU {total['cpu_seconds']:.1f}s, "
+                             f"进程内 CPU {total['thread_cpu_seconds']:.1f}s, 缓存{cache})\n")
+        lines.append(f">>> 详细数据: {self.path}\n")
+        return "".join(lines)
+
+
+@contextmanager
+def stage(report, segment, name, cache=None):
+    """计量一个阶段，返回的记录可以在阶段内补充 cache（"hit"/"miss"）与非 ffmpeg 的读写字节数
+
+    cpu_seconds 为 ffmpeg 子进程的 CPU 时间，thread_cpu_seconds 为本线程在进程内的 CPU 时间（如 PyAV 解码）。
+
+    segment 为 None 表示整场阶段（如最终拼接）；report 为 None 时只执行不记录（如后台预渲染）。
+    在另一个阶段内部计量的子阶段标记为 nested，只用于分阶段统计，不重复计入总计。
+    """
+    entry = {"segment": segment, "stage": name, "cache": cache, "ok": True, "nested": False,
+             "wall_seconds": 0.0, "cpu_seconds": 0.0, "thread_cpu_seconds": 0.0,
+             "bytes_read": 0, "bytes_written": 0, "processes": 0}
+    if report is None:
+        yield entry
+        return
+    started = time.monotonic()
+    thread_started = time.thread_time()
+    with ffmpeg_scheduler.metered() as meter:
+        entry["nested"] = meter.parent is not None
+        try:
+            yield entry
+        except BaseException:
+            entry["ok"] = False
+            raise
+        finally:
+            entry["wall_seconds"] = time.monotonic() - started
+            entry["thread_cpu_seconds"] = time.thread_time() - thread_started
+            entry["cpu_seconds"] += meter.cpu_seconds
+            entry["bytes_read"] += meter.bytes_read
+            entry["bytes_written"] += meter.bytes_written
+            entry["processes"] += meter.processes
+            report.add(entry)
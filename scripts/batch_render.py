@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+import sys
+from pathlib import Path
+import argparse
+import os
+import random
+import tempfile
+
+# ensure repo root on sys.path
+_ROOT = Path(__file__).resolve().parent.parent
+if str(_ROOT) not in sys.path:
+    sys.path.insert(0, str(_ROOT))
+
+import otaku_engine
+import render_jobs
+import run_report
+from render_cache import SegmentCache, DEFAULT_BUDGET_MB
+from source_library import SourceLibrary
+
+
+def render_unique_segments(setlists, renderer):
+    """每个不同的 (文件, 开始, 结束) 只渲染一次，返回 {片段: 缓存路径}"""
+    unique = sorted({entry for entries in setlists.values() for entry in entries})
+    segments = {}
+
+    def render(song_file, start_time, end_time):
+        path, hit = renderer.ensure_segment(song_file, start_time, end_time)
+        segments[(song_file, start_time, end_time)] = path
+        return hit
+
+    def on_done(job, error):
+        if error is not None:
+            print(f'render failed: {job[0]} ({job[1]}-{job[2]}): {render_jobs.describe_error(error)}')
+        else:
+            print(f'rendered: {job[0]} ({job[1]}-{job[2]})')
+
+    print(f'{len(unique)} unique segments across {len(setlists)} setlists')
+    renderer.render_parallel(unique, render, on_done)
+    return segments
+
+
+def write_variants(setlists, segments, out_dir: Path, variants, seed, renderer):
+    """按种子打乱每份歌单并以流复制方式拼接（MP3 输出附带章节与寻址表）并校验，返回 (生成的文件, 校验失败的个数)"""
+    outputs = []
+    unverified = 0
+    for csv_file, entries in setlists.items():
+        rendered = [entry for entry in entries if entry in segments]
+        for i in range(variants):
+            variant_seed = seed + i
+            order = list(rendered)
+            random.Random(variant_seed).shuffle(order)
+            output_file = out_dir / f'{Path(csv_file).stem}_seed{variant_seed}.mp3'
+
+            fd, list_file = tempfile.mkstemp(suffix='.txt')
+            os.close(fd)
+            try:
+                with run_report.stage(renderer.report, None, 'concat'):
+                    durations = render_jobs.concat_segments([segments[entry] for entry in order], list_file,
+                                                            str(output_file), renderer.profiles)
+            finally:
+                os.remove(list_file)
+            render_jobs.write_chapters(str(output_file), [song_file for song_file, _, _ in order], durations,
+                                       renderer.profiles)
+            paths = otaku_engine.output_paths(str(output_file), renderer.profiles)
+            print(f'{csv_file} seed={variant_seed} -> {", ".join(paths)}')
+            unverified += not renderer.verify(str(output_file), order)
+            outputs.extend(paths)
+    return outputs, unverified
+
+
+def main():
+    p = argparse.ArgumentParser(description='render several setlists and shuffled variants sharing one segment cache')
+    p.add_argument('csv', nargs='+', help='setlist csv files (same format as songs.csv)')
+    p.add_argument('--variants', type=int, default=1, help='shuffled variants per setlist')
+    p.add_argument('--seed', type=int, default=0, help='base seed; variant i uses seed + i')
+    p.add_argument('--songs-dir', default='songs')
+    p.add_argument('--out-dir', default='output')
+    p.add_argument('--cache-dir', default='cache')
+    p.add_argument('--mode', choices=render_jobs.SEGMENT_MODES, default='single_pass')
+    p.add_argument('--formats', default='mp3', help='comma separated output profiles, e.g. mp3,opus,wav')
+    p.add_argument('--workers', type=int, default=otaku_engine.default_workers())
+    p.add_argument('--budget-mb', type=float, default=DEFAULT_BUDGET_MB)
+    args = p.parse_args()
+
+    profiles = [name.strip() for name in args.formats.split(',') if name.strip()]
+    unknown = [name for name in profiles if name not in otaku_engine.OUTPUT_PROFILES]
+    if unknown:
+        print('unknown formats:', ', '.join(unknown))
+        sys.exit(2)
+
+    setlists = {}
+    for csv_file in args.csv:
+        if not Path(csv_file).exists():
+            print('csv not found:', csv_file)
+            sys.exit(2)
+        try:
+            setlists[csv_file] = otaku_engine.read_setlist(csv_file)
+        except ValueError as e:
+            print(e)
+            sys.exit(2)
+
+    settings = {'render_mode': args.mode, 'output_profiles': profiles, 'setlists': args.csv}
+    report = run_report.RunReport(str(Path(args.out_dir) / 'batch_report.json'), 'batch', settings)
+    renderer = render_jobs.Renderer(SegmentCache(args.cache_dir, args.budget_mb), SourceLibrary(args.cache_dir),
+                                    args.songs_dir, args.mode, profiles, args.workers, report=report)
+    out_dir = Path(args.out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    segments = render_unique_segments(setlists, renderer)
+    _, unverified = write_variants(setlists, segments, out_dir, args.variants, args.seed, renderer)
+
+    # 本次用到的片段、中间文件和倒数音频不会被淘汰
+    renderer.evict(list(segments))
+    report.save()
+    print(report.summary(), end='')
+    sys.exit(1 if unverified else 0)
+
+
+if __name__ == '__main__':
+    main()
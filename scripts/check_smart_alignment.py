@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+import sys
+import os
+import tempfile
+from pathlib import Path
+import argparse
+
+# ensure repo root on sys.path
+_ROOT = Path(__file__).resolve().parent.parent
+if str(_ROOT) not in sys.path:
+    sys.path.insert(0, str(_ROOT))
+
+import numpy as np
+
+import otaku_engine
+import pcm_engine
+
+FRAME = 1152      # samples per MPEG1 layer III frame
+SEARCH = 4 * FRAME  # how far apart the two renders may be before we give up looking
+
+
+def decode(path, work_dir):
+    """decode a whole mp3 to a (samples, channels) float32 array"""
+    pcm_file = os.path.join(work_dir, Path(path).stem + pcm_engine.PCM_EXT)
+    pcm_engine.decode_to_pcm(path, pcm_file)
+    return np.array(pcm_engine.load_pcm(pcm_file))
+
+
+def find_offset(reference, candidate, at, window):
+    """samples by which `candidate` lags `reference`, found by matching `window` samples starting at sample `at`"""
+    ref = reference[at:at + window].sum(axis=1)
+    best, best_err = None, None
+    for lag in range(-SEARCH, SEARCH + 1):
+        lo = at + lag
+        if lo < 0 or lo + window > len(candidate):
+            continue
+        err = float(np.square(candidate[lo:lo + window].sum(axis=1) - ref).sum())
+        if best_err is None or err < best_err:
+            best, best_err = lag, err
+    return best
+
+
+def check(input_path, start_time, end_time, gain_db, work_dir):
+    """render one cut with single_pass and smart
+
+    returns (smart used, start offset, length difference, single_pass length, smart length), all in samples
+    """
+    reference_file = os.path.join(work_dir, 'single_pass.mp3')
+    smart_file = os.path.join(work_dir, 'smart.mp3')
+    otaku_engine.render_segment_single_pass(input_path, reference_file, start_time, end_time, gain_db=gain_db)
+    used_smart = otaku_engine.render_segment_smart(input_path, smart_file, start_time, end_time, gain_db=gain_db)
+
+    reference = decode(reference_file, work_dir)
+    smart = decode(smart_file, work_dir)
+    # compare in the copied body, well clear of both fades
+    at = round((otaku_engine.FADE_IN_DURATION + 2) * otaku_engine.SAMPLE_RATE)
+    offset = find_offset(reference, smart, at, otaku_engine.SAMPLE_RATE // 4)
+    return used_smart, offset, len(smart) - len(reference), len(reference), len(smart)
+
+
+def main():
+    p = argparse.ArgumentParser(
+        description='render a cut with single_pass and smart, decode both and check that smart lines up '
+                    'with single_pass to within one mp3 frame (start offset and length)')
+    p.add_argument('song', help='source mp3')
+    p.add_argument('cuts', nargs='+', help='start-end in seconds, e.g. 30-90')
+    p.add_argument('--gain-db', type=float, default=0)
+    args = p.parse_args()
+
+    if not Path(args.song).exists():
+        print('song not found:', args.song)
+        sys.exit(2)
+
+    failed = 0
+    for cut in args.cuts:
+        start_time, end_time = (float(value) for value in cut.split('-'))
+        with tempfile.TemporaryDirectory() as work_dir:
+            used_smart, offset, diff, expected, got = check(args.song, start_time, end_time, args.gain_db, work_dir)
+        ok = offset is not None and abs(offset) <= FRAME and abs(diff) <= FRAME
+        failed += not ok
+        path = 'smart' if used_smart else 'fell back to single_pass'
+        print(f'{"OK  " if ok else "FAIL"} {cut}: {path}, offset {offset} samples, '
+              f'length {got} vs {expected} ({diff:+d} samples)')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+import sys
+import re
+import subprocess
+import tempfile
+from pathlib import Path
+import argparse
+
+# ensure repo root on sys.path
+_ROOT = Path(__file__).resolve().parent.parent
+if str(_ROOT) not in sys.path:
+    sys.path.insert(0, str(_ROOT))
+
+# modules that must only be imported on first use, never while the window opens
+LAZY_MODULES = ('pygame', 'ffmpeg', 'mutagen', 'numpy', 'av', 'asyncio', 'librosa')
+_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+# runs in a fresh interpreter: import the GUI, open the main window and process pending events.
+# without a display the window is still built, against stand-in widgets, so that eager imports in the
+# constructor (e.g. while loading songs.csv) are caught; only the drawing time is not measured
+_CHILD = r'''
+import os, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {root!r})
+import tkinter as tk
+from tkinter import ttk
+import integrated_manager
+imported = time.perf_counter()
+try:
+    root = tk.Tk()
+except tk.TclError as e:
+    class Stub:
+        def __init__(self, *args, **kwargs): pass
+        def __call__(self, *args, **kwargs): return Stub()
+        def __getattr__(self, name): return Stub()
+        def __iter__(self): return iter(())
+    for module in (tk, ttk):
+        for name, value in list(vars(module).items()):
+            if isinstance(value, type) and not issubclass(value, BaseException) and name[:1].isupper():
+                setattr(module, name, Stub)
+    integrated_manager.OtakuDanceGUI(Stub())
+    print('IMPORT', imported - started, 'WINDOW', -1, str(e).replace(chr(10), ' '), flush=True)
+    os._exit(0)
+integrated_manager.OtakuDanceGUI(root)
+root.update()
+print('IMPORT', imported - started, 'WINDOW', time.perf_counter() - started, '', flush=True)
+os._exit(0)
+'''
+
+
+def parse_importtime(stderr):
+    """parse `python -X importtime` output into [(module, self_us, cumulative_us, parent)]"""
+    modules = []
+    stack = []  # (depth, index) of entries whose parent is not known yet
+    for line in stderr.splitlines():
+        m = _LINE.match(line)
+        if not m:
+            continue
+        depth = (len(m.group(3)) - 1) // 2
+        index = len(modules)
+        modules.append([m.group(4), int(m.group(1)), int(m.group(2)), None])
+        # importtime prints children before their parent, one level deeper
+        while stack and stack[-1][0] > depth:
+            modules[stack.pop()[1]][3] = m.group(4)
+        stack.append((depth, index))
+    return [tuple(entry) for entry in modules]
+
+
+def import_chain(modules, name):
+    """who pulled `name` in, e.g. integrated_manager -> otaku_engine -> ffmpeg"""
+    parents = {module: parent for module, _, _, parent in modules}
+    chain = [name]
+    while parents.get(chain[-1]) and len(chain) < 10:
+        chain.append(parents[chain[-1]])
+    return ' -> '.join(reversed(chain))
+
+
+def main():
+    p = argparse.ArgumentParser(description='measure how long integrated_manager takes to open its window '
+                                            'and report the import cost of each module')
+    p.add_argument('--budget', type=float, default=0.5, help='seconds allowed until the main window is drawn')
+    p.add_argument('--top', type=int, default=15, help='number of modules to list')
+    p.add_argument('--cwd', default=str(_ROOT), help='directory to start the GUI in (it loads songs.csv from there)')
+    args = p.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cwd = args.cwd
+        if not (Path(cwd) / 'songs.csv').exists():
+            # the GUI loads songs.csv on startup; make sure that path is part of the measurement
+            cwd = tmp
+            with open(Path(tmp) / 'songs.csv', 'w', encoding='utf-8') as f:
+                f.write('文件名,开始时间,结束时间,备注\nsample.mp3,0,30,\n')
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', _CHILD.format(root=str(_ROOT))],
+                              cwd=cwd, capture_output=True, text=True, timeout=120)
+    # other output (e.g. the pygame banner) may come first
+    result = next((line.split() for line in proc.stdout.splitlines() if line.startswith('IMPORT ')), None)
+    if proc.returncode != 0 or result is None:
+        print(proc.stderr[-2000:])
+        print('startup failed')
+        sys.exit(2)
+    import_seconds, window_seconds = float(result[1]), float(result[3])
+    modules = parse_importtime(proc.stderr)
+
+    # integrated_manager itself and each of its direct imports
+    startup = [entry for entry in modules if entry[0] == 'integrated_manager' or entry[3] == 'integrated_manager']
+    startup.sort(key=lambda entry: entry[2], reverse=True)
+    print(f'{"module":<28}{"cumulative ms":>15}{"self ms":>10}')
+    for module, self_us, cumulative_us, _ in startup[:args.top]:
+        print(f'{module:<28}{cumulative_us / 1000:>15.1f}{self_us / 1000:>10.1f}')
+    print()
+
+    failed = False
+    loaded = {module for module, _, _, _ in modules}
+    for name in LAZY_MODULES:
+        if name in loaded:
+            print(f'eagerly imported: {import_chain(modules, name)}')
+            failed = True
+
+    print(f'imports: {import_seconds:.3f}s')
+    if window_seconds < 0:
+        # no display (e.g. a server): only the import part can be measured
+        print(f'window: not measured ({" ".join(result[4:]) or "no display"})')
+        measured = import_seconds
+    else:
+        print(f'window drawn after: {window_seconds:.3f}s')
+        measured = window_seconds
+    if measured > args.budget:
+        print(f'over budget: {measured:.3f}s > {args.budget:.3f}s')
+        failed = True
+    else:
+        print(f'within budget ({args.budget:.3f}s)')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
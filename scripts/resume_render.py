@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+import sys
+from pathlib import Path
+import argparse
+
+# ensure repo root on sys.path
+_ROOT = Path(__file__).resolve().parent.parent
+if str(_ROOT) not in sys.path:
+    sys.path.insert(0, str(_ROOT))
+
+import otaku_engine
+import render_jobs
+from render_cache import SegmentCache, DEFAULT_BUDGET_MB
+from run_manifest import RunManifest, find_resumable
+from source_library import SourceLibrary
+from workspace import JOBS_DIR, Workspace
+
+
+def main():
+    p = argparse.ArgumentParser(description='resume an interrupted generation run from its checkpoint manifest')
+    p.add_argument('--job', help='job id under --jobs-dir; defaults to the most recent unfinished job')
+    p.add_argument('--jobs-dir', default=JOBS_DIR)
+    p.add_argument('--songs-dir', default='songs')
+    p.add_argument('--cache-dir', default='cache')
+    p.add_argument('--workers', type=int, default=otaku_engine.default_workers())
+    p.add_argument('--budget-mb', type=float, default=DEFAULT_BUDGET_MB)
+    args = p.parse_args()
+
+    if args.job:
+        manifest = RunManifest.load(Workspace(args.job, args.jobs_dir).manifest_path)
+    else:
+        manifest = find_resumable(args.jobs_dir)
+    if manifest is None:
+        print('no run to resume in', args.jobs_dir)
+        sys.exit(2)
+    if manifest.status == 'done':
+        print('run already finished:', manifest.final_output)
+        return
+    cache = SegmentCache(args.cache_dir, args.budget_mb, manifest.settings.get('use_content_hash', False))
+    library = SourceLibrary(args.cache_dir)
+    print('resuming job', manifest.job_id)
+    workspace = Workspace(manifest.job_id, args.jobs_dir)
+    if not render_jobs.run_job(manifest, workspace, cache, library, args.songs_dir, args.workers):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
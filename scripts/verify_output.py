@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+import sys
+import os
+import time
+from pathlib import Path
+import argparse
+
+# ensure repo root on sys.path
+_ROOT = Path(__file__).resolve().parent.parent
+if str(_ROOT) not in sys.path:
+    sys.path.insert(0, str(_ROOT))
+
+import mp3_verify
+import otaku_engine
+
+
+def main():
+    p = argparse.ArgumentParser(description='check generated mp3 files by scanning frame headers (no decoding)')
+    p.add_argument('mp3', nargs='+', help='output files to check')
+    p.add_argument('--csv', help='setlist csv the files were generated from; enables duration and chapter checks')
+    p.add_argument('--songs-dir', default='songs')
+    p.add_argument('--mix', default=otaku_engine.MIX_PATH, help='countdown clip placed before every song')
+    p.add_argument('--whole-show', action='store_true',
+                   help='files were encoded in one pass (numpy/streaming engines), chapters are not frame aligned')
+    args = p.parse_args()
+
+    planned = None
+    if args.csv:
+        if not Path(args.csv).exists():
+            print('csv not found:', args.csv)
+            sys.exit(2)
+        mix_duration = mp3_verify.audio_length(args.mix) if os.path.exists(args.mix) else 0
+        planned = mp3_verify.planned_durations(otaku_engine.read_setlist(args.csv), mix_duration,
+                                               songs_dir=args.songs_dir)
+
+    failed = 0
+    for path in args.mp3:
+        started = time.perf_counter()
+        check = mp3_verify.verify_mp3(path, planned, not args.whole_show)
+        print(mp3_verify.describe(check), end='')
+        print(f'    checked in {time.perf_counter() - started:.3f}s')
+        failed += not check.ok
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+import os
+import threading
+import uuid
+import ffmpeg_scheduler
+
+from otaku_engine import CHANNELS, SAMPLE_RATE
+from render_cache import content_hash
+
+AUDIO_EXTS = (".mp3", ".wav", ".flac", ".m4a")  # 与 SongDialog.browse_file 接受的格式一致
+LIBRARY_EXT = ".wav"
+
+
+class SourceLibrary:
+    """规范化中间文件库
+
+    songs 目录中的每个源文件（不论 44.1/48kHz、mp3/wav/flac/m4a）都只转码一次，
+    得到固定采样率与声道布局的 16 位 WAV，按源文件内容哈希存放在 cache/library 中。
+    渲染、预览和副歌分析都读取这个中间文件，不再重复解码与重采样。
+    """
+
+    def __init__(self, cache_dir="cache"):
+        self.library_dir = os.path.join(cache_dir, "library")
+        os.makedirs(self.library_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._pending = {}  # key -> threading.Event，避免同一文件被并发转码
+        self._thread = None
+
+    def key(self, source):
+        return content_hash(source)
+
+    def path_for(self, key):
+        return os.path.join(self.library_dir, f"{key}{LIBRARY_EXT}")
+
+    def lookup(self, source):
+        """已转码则返回中间文件路径（并刷新 LRU 时间），否则返回 None"""
+        path = self.path_for(self.key(source))
+        try:
+            os.utime(path, None)
+        except OSError:
+            return None
+        return path
+
+    def resolve(self, source):
+        """优先返回中间文件，尚未转码时返回源文件本身（不等待）"""
+        if not os.path.exists(source):
+            return source
+        return self.lookup(source) or source
+
+    def ensure(self, source):
+        """返回中间文件路径，必要时立即转码"""
+        import ffmpeg
+        key = self.key(source)
+        path = self.path_for(key)
+        while True:
+            with self._lock:
+                if os.path.exists(path):
+                    return path
+                event = self._pending.get(key)
+                if event is None:
+                    event = self._pending[key] = threading.Event()
+                    break
+            event.wait()
+
+        # tmp_ 前缀的文件在转码期间不会被 SegmentCache.evict 删除
+        rendered = os.path.join(self.library_dir, f"tmp_{uuid.uuid4().hex}_{key}{LIBRARY_EXT}")
+        try:
+            ffmpeg_scheduler.run(
+                ffmpeg
+                .input(source)
+                .output(rendered, f="wav", acodec="pcm_s16le", ar=SAMPLE_RATE, ac=CHANNELS)
+            )
+            os.replace(rendered, path)
+            return path
+        finally:
+            if os.path.exists(rendered):
+                os.remove(rendered)
+            with self._lock:
+                self._pending.pop(key, None)
+            event.set()
+
+    def _ingest(self, source, on_done):
+        try:
+            self.ensure(source)
+            error = None
+        except Exception as e:
+            error = e
+        if on_done:
+            on_done(source, error)
+
+    def ingest_all(self, songs_dir="songs", on_done=None):
+        """依次转码目录中所有尚未转码的音频文件，on_done(source, error) 在每个文件处理后回调"""
+        for name in sorted(os.listdir(songs_dir)):
+            if name.lower().endswith(AUDIO_EXTS):
+                self._ingest(os.path.join(songs_dir, name), on_done)
+
+    def prepare(self, source, on_done=None):
+        """在后台线程中转码单个文件，on_done(source, error) 在完成后回调
+
+        与 start_background_ingest 同时转码同一文件时只转码一次（见 ensure）。
+        """
+        threading.Thread(target=self._ingest, args=(source, on_done), daemon=True).start()
+
+    def start_background_ingest(self, songs_dir="songs", on_done=None):
+        """在后台线程中执行 ingest_all（同一时间只运行一个）"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self.ingest_all, args=(songs_dir, on_done), daemon=True)
+        self._thread.start()
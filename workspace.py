@@ -0,0 +1,76 @@
+import os
+import shutil
+import time
+import uuid
+
+# 每次生成任务独占一个工作目录（output/jobs/<任务ID>），歌单快照、单曲片段、拼接列表与检查点都放在里面，
+# 多个任务同时生成时互不覆盖；片段缓存 cache/ 仍由所有任务共享（写入均为临时文件 + 原子替换）。
+
+JOBS_DIR = "output/jobs"
+
+
+def new_job_id():
+    """时间戳 + 随机后缀，同一秒内开始的任务也不会重名"""
+    return f"{int(time.time())}_{uuid.uuid4().hex[:6]}"
+
+
+class Workspace:
+    """一次生成任务的工作目录"""
+
+    def __init__(self, job_id, root=JOBS_DIR):
+        self.job_id = job_id
+        self.dir = os.path.join(root, job_id)
+
+    @classmethod
+    def create(cls, root=JOBS_DIR):
+        workspace = cls(new_job_id(), root)
+        os.makedirs(workspace.dir)
+        return workspace
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.dir, "manifest.json")
+
+    @property
+    def csv_file(self):
+        return os.path.join(self.dir, "setlist.csv")
+
+    @property
+    def report_path(self):
+        return os.path.join(self.dir, "report.json")
+
+    @property
+    def list_file(self):
+        return os.path.join(self.dir, "songlist.txt")
+
+    def segment_path(self, song_file):
+        return os.path.join(self.dir, f"out_{song_file}")
+
+    def final_output(self, prefix="output_audio", ext=".mp3"):
+        """最终输出仍放在工作目录之外（程序目录），文件名带任务 ID"""
+        return f"{prefix}_{self.job_id}{ext}"
+
+    def cleanup(self):
+        """任务完成后删除片段副本等中间文件，只保留检查点、歌单快照与计量报告"""
+        keep = {os.path.basename(self.manifest_path), os.path.basename(self.csv_file),
+                os.path.basename(self.report_path)}
+        for name in os.listdir(self.dir):
+            if name in keep:
+                continue
+            path = os.path.join(self.dir, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+def list_jobs(root=JOBS_DIR):
+    """按开始时间从新到旧列出已有的任务工作目录"""
+    try:
+        names = [name for name in os.listdir(root) if os.path.isdir(os.path.join(root, name))]
+    except OSError:
+        return []
+    return [Workspace(name, root) for name in sorted(names, reverse=True)]